@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+事件载荷解码的前后对比基准
+
+对录制的 Dify chatflow 流（corpus/dify_chatflow.sse）比较：
+- legacy：旧流程，parse_sse_event 中 loads+dumps 做“Unicode解码”，_parse_event_data 再 loads 一次
+- single：当前流程，build_event 只解码一次，events_stream 直接使用 event.parsed
+
+运行：python benchmarks/bench_event_decode.py [重复次数]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.dify_sse_node_plugin import SSEClient  # noqa: E402
+from utils.sse_parser import SSEFrameParser  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "dify_chatflow.sse")
+
+
+def legacy_decode(frame):
+    """旧流程的JSON处理：解码-重新编码-再解码"""
+    data = frame.data or ""
+    if data.strip().startswith('{') and data.strip().endswith('}'):
+        data = json.dumps(json.loads(data), ensure_ascii=False, separators=(',', ':'))
+    stripped = data.strip()
+    if (stripped.startswith('{') and stripped.endswith('}')) or (stripped.startswith('[') and stripped.endswith(']')):
+        return json.loads(data)
+    return data
+
+
+def single_decode(client, frame):
+    event = client.build_event(frame)
+    return event.parsed if event else None
+
+
+def run(label, frames, decode, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            decode(frame)
+    elapsed = time.perf_counter() - start
+    total = len(frames) * repeat
+    print(f"{label:<8} {total / elapsed:>12,.0f} events/s  {elapsed / total * 1e6:>8.2f} µs/event")
+    return elapsed
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with open(CORPUS, "rb") as f:
+        frames = SSEFrameParser().feed(f.read())
+    client = SSEClient("http://localhost/")
+
+    # 两种流程的输出必须一致
+    for frame in frames:
+        assert legacy_decode(frame) == single_decode(client, frame) or frame.data is None
+
+    print(f"语料: {os.path.basename(CORPUS)}，{len(frames)} 帧，重复 {repeat} 次")
+    before = run("legacy", frames, legacy_decode, repeat)
+    after = run("single", frames, lambda fr: single_decode(client, fr), repeat)
+    print(f"加速比: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
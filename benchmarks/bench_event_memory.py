@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+单事件内存与CPU基准（10k事件流）
+
+比较：
+- legacy：普通类（带 __dict__），每个事件调用 datetime.now().isoformat()，
+  收集时再复制成6个键的事件字典，对象和字典同时保留
+- compact：slots 事件，只记录 monotonic_ns 偏移，保留事件对象本身，输出时才生成字典
+
+载荷对象在两种方式间共享，内存只统计事件表示本身的开销。
+
+运行：python benchmarks/bench_event_memory.py [事件数]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import json_codec  # noqa: E402
+from utils.sse_event import SSEEvent, StreamClock  # noqa: E402
+from utils.sse_parser import SSEFrameParser  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "dify_chatflow.sse")
+
+
+class LegacySSEEvent:
+    """旧的事件结构"""
+    def __init__(self, event_type="message", data="", event_id="", retry=0, parsed=None, raw=None):
+        self.event_type = event_type
+        self._data = data
+        self.parsed = parsed if parsed is not None else data
+        self.raw = raw
+        self.event_id = event_id
+        self.retry = retry
+        self.timestamp = datetime.now().isoformat()
+
+
+def load_payloads():
+    with open(CORPUS, "rb") as f:
+        frames = SSEFrameParser().feed(f.read())
+    return [(frame.event_type, json_codec.loads(frame.data), len(frame.data)) for frame in frames if frame.data]
+
+
+def collect_legacy(payloads, n):
+    events, all_events = [], []
+    for i in range(n):
+        event_type, parsed, _ = payloads[i % len(payloads)]
+        event = LegacySSEEvent(event_type, None, "", 0, parsed)
+        events.append(event)
+        all_events.append({
+            "event_number": i + 1,
+            "event_type": event.event_type,
+            "data": event.parsed,
+            "event_id": event.event_id,
+            "timestamp": event.timestamp,
+            "retry": event.retry,
+        })
+    return events, all_events
+
+
+def collect_compact(payloads, n):
+    clock = StreamClock()
+    events = []
+    for i in range(n):
+        event_type, parsed, size = payloads[i % len(payloads)]
+        event = SSEEvent(event_type, None, "", 0, parsed, None, size, clock)
+        event.number = i + 1
+        events.append(event)
+    return events
+
+
+def measure(func, *args):
+    """返回 (保留内存字节, 耗时秒)"""
+    tracemalloc.start()
+    result = func(*args)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    return retained, elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    payloads = load_payloads()
+
+    results = {
+        "legacy": measure(collect_legacy, payloads, n),
+        "compact": measure(collect_compact, payloads, n),
+    }
+    events = collect_compact(payloads, n)
+    start = time.perf_counter()
+    [event.to_dict() for event in events]
+    output_elapsed = time.perf_counter() - start
+
+    print(f"语料: {os.path.basename(CORPUS)}，{n} 个事件")
+    print(f"{'方式':<8} {'内存/事件(B)':>14} {'收集 µs/事件':>14}")
+    for label, (retained, elapsed) in results.items():
+        print(f"{label:<8} {retained / n:>14.0f} {elapsed / n * 1e6:>14.2f}")
+    print(f"compact 输出时生成字典: {output_elapsed / n * 1e6:.2f} µs/事件（仅在结束时执行一次）")
+    legacy, compact = results["legacy"], results["compact"]
+    print(f"内存降低: {legacy[0] / compact[0]:.2f}x，收集加速: {legacy[1] / compact[1]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+JSON后端微基准
+
+从录制的 Dify chatflow 流中取出典型的 message（小增量）和 node_finished（大载荷）事件，
+比较各个可用后端的单事件 loads 耗时（dumps 固定使用标准库，不参与比较）。
+
+运行：python benchmarks/bench_json_codec.py [重复次数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import json_codec  # noqa: E402
+from utils.sse_parser import SSEFrameParser  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "dify_chatflow.sse")
+
+
+def load_payloads():
+    """按Dify事件类型挑选代表性载荷"""
+    with open(CORPUS, "rb") as f:
+        frames = SSEFrameParser().feed(f.read())
+    payloads = {}
+    for frame in frames:
+        if not frame.data:
+            continue
+        event = json_codec.loads(frame.data).get("event")
+        if event == "message" and "message" not in payloads:
+            payloads["message"] = frame.data
+        elif event == "node_finished":
+            # 取最大的 node_finished 载荷
+            if len(frame.data) > len(payloads.get("node_finished", "")):
+                payloads["node_finished"] = frame.data
+    return payloads
+
+
+def time_per_call(func, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    payloads = load_payloads()
+    results = {}
+    for name in ("json", "orjson", "msgspec"):
+        if json_codec.use_backend(name) != name:
+            print(f"{name:<8} 未安装或不能精确解码超大整数，跳过")
+            continue
+        for event, text in payloads.items():
+            results[(name, event)] = time_per_call(json_codec.loads, text, repeat)
+    json_codec.use_backend("auto")
+
+    print(f"{'后端':<8} {'事件':<14} {'大小(B)':>8} {'loads µs':>10} {'相对json':>10}")
+    for (name, event), load_us in results.items():
+        speedup = results[("json", event)] / load_us
+        size = len(payloads[event].encode("utf-8"))
+        print(f"{name:<8} {event:<14} {size:>8} {load_us:>10.2f} {speedup:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
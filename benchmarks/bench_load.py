@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+端到端压测：本地替身服务器 + N 个并发调用方
+
+在子进程中启动 benchmarks/sse_standin_server.py，用 gevent 协程模拟插件运行时的并发调用，
+直接调用 DifySseNodePluginTool._invoke / DifyChatflowSSETool._invoke（output_mode=stream）。
+
+报告：
+- 首事件耗时 TTFE（调用开始到第一条流式输出）与总延迟的 p50/p95/p99
+- 全部调用合计的 events/s
+- 本进程的 RSS 起始值与峰值、打开的socket数峰值与结束时的值（/proc/self，需Linux）
+
+完全离线，只连接 127.0.0.1。
+
+运行：python benchmarks/bench_load.py [--tool generic|chatflow|both] [--callers 20] [--calls 100]
+                                      [--events 100] [--size 200] [--rate 0] [--delay 0]
+                                      [--engine sync|async] [--save 结果.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gevent  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+
+from tools.dify_chatflow_sse import DifyChatflowSSETool  # noqa: E402
+from tools.dify_sse_node_plugin import DifySseNodePluginTool  # noqa: E402
+from utils.latency_stats import summarize  # noqa: E402
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sse_standin_server.py")
+# 调用方的日志级别，避免每次调用的INFO日志影响结果
+CREDENTIALS = {"log_level": "WARNING"}
+
+
+class ResourceSampler:
+    """后台协程定期采样本进程的RSS和打开的socket数"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.rss_start = self.rss_peak = self._rss()
+        self.sockets_start = self.sockets_peak = self._sockets()
+        self._greenlet = None
+
+    @staticmethod
+    def _rss() -> int:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    @staticmethod
+    def _sockets() -> int:
+        count = 0
+        for fd in os.listdir("/proc/self/fd"):
+            try:
+                if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                    count += 1
+            except OSError:
+                pass  # 采样期间被关闭
+        return count
+
+    def sample(self) -> None:
+        self.rss_peak = max(self.rss_peak, self._rss())
+        self.sockets_peak = max(self.sockets_peak, self._sockets())
+
+    def _run(self) -> None:
+        while True:
+            self.sample()
+            gevent.sleep(self.interval)
+
+    def start(self) -> None:
+        self._greenlet = gevent.spawn(self._run)
+
+    def stop(self) -> dict:
+        self._greenlet.kill()
+        self.sample()
+        return {
+            "rss_start_mb": round(self.rss_start / 1e6, 1),
+            "rss_peak_mb": round(self.rss_peak / 1e6, 1),
+            "sockets_start": self.sockets_start,
+            "sockets_peak": self.sockets_peak,
+            "sockets_end": self._sockets(),
+        }
+
+
+def start_server(args) -> (subprocess.Popen, str):
+    """启动替身服务器子进程，返回进程和基础URL"""
+    proc = subprocess.Popen([sys.executable, SERVER, "--port", "0", "--events", str(args.events),
+                             "--size", str(args.size), "--rate", str(args.rate), "--delay", str(args.delay)],
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().strip()
+    if not line.startswith("listening "):
+        proc.kill()
+        raise RuntimeError(f"替身服务器启动失败: {line!r}")
+    return proc, "http://" + line.split(" ", 1)[1]
+
+
+def tool_parameters(tool: str, base_url: str, args, index: int) -> dict:
+    common = {"timeout": 60, "max_events": args.events + 20, "max_duration": 600, "output_mode": "stream"}
+    if tool == "generic":
+        return {"url": f"{base_url}/stream", "method": "GET", **common}
+    body = {"query": f"load-{index}", "inputs": {}, "response_mode": "streaming", "user": "bench"}
+    return {"url": f"{base_url}/v1/chat-messages", "method": "POST", "body": json.dumps(body), **common}
+
+
+def invoke_once(tool_cls, parameters: dict) -> dict:
+    """执行一次调用，记录首个流式输出和结束的时间"""
+    tool = tool_cls.from_credentials(CREDENTIALS)
+    start = time.perf_counter()
+    ttfe = None
+    result = {}
+    for message in tool._invoke(parameters):
+        kind = message.type.value
+        if ttfe is None and kind == "variable" and message.message.stream:
+            ttfe = time.perf_counter() - start
+        elif kind == "json":
+            result = message.message.json_object
+    return {"ttfe": ttfe, "latency": time.perf_counter() - start,
+            "status": result.get("status"), "events": result.get("total_events") or 0}
+
+
+def run_load(tool: str, base_url: str, args) -> dict:
+    tool_cls = DifySseNodePluginTool if tool == "generic" else DifyChatflowSSETool
+    # 预热：导入、连接池和日志配置等一次性开销不计入
+    invoke_once(tool_cls, tool_parameters(tool, base_url, args, -1))
+
+    sampler = ResourceSampler()
+    sampler.start()
+    pool = Pool(args.callers)
+    start = time.perf_counter()
+    jobs = [pool.spawn(invoke_once, tool_cls, tool_parameters(tool, base_url, args, i)) for i in range(args.calls)]
+    pool.join()
+    wall = time.perf_counter() - start
+    resources = sampler.stop()
+
+    calls = [job.value for job in jobs if job.successful()]
+    ok = [c for c in calls if c["status"] == "completed"]
+    events = sum(c["events"] for c in ok)
+    ms = lambda values: [v * 1000 for v in values if v is not None]  # noqa: E731
+    return {
+        "tool": tool,
+        "engine": args.engine,
+        "callers": args.callers,
+        "calls": args.calls,
+        "failed": args.calls - len(ok),
+        "wall_s": round(wall, 3),
+        "calls_per_s": round(len(ok) / wall, 1),
+        "events_per_s": round(events / wall, 1),
+        "ttfe_ms": summarize(ms(c["ttfe"] for c in ok), percentiles=(50, 95, 99), digits=1),
+        "latency_ms": summarize(ms(c["latency"] for c in ok), percentiles=(50, 95, 99), digits=1),
+        **resources,
+    }
+
+
+def print_result(r: dict) -> None:
+    print(f"[{r['tool']}] 引擎 {r['engine']}，{r['calls']} 次调用，并发 {r['callers']}，失败 {r['failed']}，"
+          f"耗时 {r['wall_s']} 秒，{r['calls_per_s']} 次/秒，{r['events_per_s']:,.0f} events/s")
+    for label, key in (("TTFE", "ttfe_ms"), ("总延迟", "latency_ms")):
+        s = r[key]
+        print(f"  {label:<6} ms  p50 {s['p50']}  p95 {s['p95']}  p99 {s['p99']}  max {s['max']}")
+    print(f"  RSS {r['rss_start_mb']} → 峰值 {r['rss_peak_mb']} MB，"
+          f"socket {r['sockets_start']} → 峰值 {r['sockets_peak']}，结束时 {r['sockets_end']}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="端到端压测")
+    arg_parser.add_argument("--tool", choices=("generic", "chatflow", "both"), default="both")
+    arg_parser.add_argument("--callers", type=int, default=20, help="并发调用方数")
+    arg_parser.add_argument("--calls", type=int, default=100, help="每个工具的总调用次数")
+    arg_parser.add_argument("--events", type=int, default=100, help="每个流的事件数（chatflow为message增量数）")
+    arg_parser.add_argument("--size", type=int, default=200, help="每个事件data的近似字节数")
+    arg_parser.add_argument("--rate", type=float, default=0, help="每个流每秒事件数，0表示不限速")
+    arg_parser.add_argument("--delay", type=float, default=0, help="服务器发送第一个事件前的延迟（秒）")
+    arg_parser.add_argument("--engine", choices=("sync", "async"), default="sync", help="SSE_ENGINE")
+    arg_parser.add_argument("--save", help="把结果保存为JSON")
+    args = arg_parser.parse_args()
+
+    os.environ["SSE_ENGINE"] = args.engine
+    proc, base_url = start_server(args)
+    results = []
+    try:
+        for tool in (("generic", "chatflow") if args.tool == "both" else (args.tool,)):
+            results.append(run_load(tool, base_url, args))
+            print_result(results[-1])
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.save}")
+
+
+if __name__ == "__main__":
+    main()
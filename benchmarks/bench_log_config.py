@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+日志配置与输出开销基准
+
+1. 每次调用的日志配置开销：旧流程（每次遍历处理器、设置根logger、INFO输出凭据等）
+   与 configure_log_level（同一级别缓存后直接返回）对比
+2. 输出慢时调用方的耗时：直接写stdout的 StreamHandler 与队列处理器对比，
+   用每次写入休眠0.2ms的流模拟变慢的插件守护进程管道
+3. 端到端的读取循环停顿：多个greenlet模拟同步引擎的读取循环，每隔1ms处理一个事件并输出一条日志，
+   统计每轮超出间隔的时间。入队本身很快，但写greenlet与读取greenlet共用主线程，
+   慢输出的写入耗时仍会落到读取循环上，只看第2项会高估收益
+
+运行：python benchmarks/bench_log_config.py [调用次数]
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+
+import gevent
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dify_plugin.config.logger_format import DifyPluginLoggerFormatter, plugin_logger_handler  # noqa: E402
+
+from utils import log_config, native  # noqa: E402
+
+
+class SlowStream:
+    """每次写入都有固定延迟的输出流"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        # 导入dify_plugin时time.sleep被gevent patch，这里要真正阻塞当前线程
+        self._sleep = native.original('time', 'sleep')
+
+    def write(self, data):
+        self._sleep(self.delay)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def legacy_configure(logger, credentials):
+    """旧的 DifyChatflowSSETool._invoke 日志配置流程"""
+    logger.info(f"[日志配置] 获取到的credentials: {credentials}")
+    log_level_str = credentials.get('log_level', 'INFO')
+    logger.info(f"[日志配置] 从credentials获取的log_level: {log_level_str}")
+    log_level = log_config.LOG_LEVELS.get(log_level_str.upper(), logging.INFO)
+    logger.setLevel(log_level)
+    for handler in logger.handlers:
+        if hasattr(handler, 'setLevel'):
+            handler.setLevel(log_level)
+            if hasattr(handler, '__class__') and 'plugin' in str(handler.__class__).lower():
+                logger.info(f"[日志配置] 为plugin_logger_handler设置级别: {log_level_str}")
+    root_logger = logging.getLogger()
+    if root_logger.level > log_level:
+        root_logger.setLevel(log_level)
+    logger.info(f"[日志配置] 动态设置日志级别为: {log_level_str} ({log_level})")
+
+
+def per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def read_loop_stall(log, readers: int, rounds: int, interval: float = 0.001):
+    """readers 个读取greenlet各处理 rounds 个事件，返回每轮超出间隔时间的 p50/p99/最大值（ms）"""
+    overruns = []
+
+    def reader():
+        for _ in range(rounds):
+            start = time.perf_counter()
+            gevent.sleep(interval)
+            log("[SSE事件] 收到事件")
+            overruns.append((time.perf_counter() - start - interval) * 1e3)
+
+    gevent.joinall([gevent.spawn(reader) for _ in range(readers)])
+    overruns.sort()
+    return (statistics.median(overruns), overruns[int(len(overruns) * 0.99) - 1], overruns[-1])
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    credentials = {'log_level': 'INFO'}
+
+    devnull = open(os.devnull, 'w')
+    legacy_logger = logging.getLogger("bench.legacy")
+    legacy_logger.propagate = False
+    direct_handler = logging.StreamHandler(devnull)
+    direct_handler.setFormatter(DifyPluginLoggerFormatter())
+    legacy_logger.addHandler(direct_handler)
+
+    print(f"每次调用的日志配置开销（{repeat} 次）")
+    legacy_us = per_call(lambda: legacy_configure(legacy_logger, credentials), repeat)
+    cached_us = per_call(lambda: log_config.configure_log_level(credentials['log_level']), repeat)
+    print(f"  旧流程            {legacy_us:>8.2f} µs/次")
+    print(f"  configure_log_level {cached_us:>6.2f} µs/次（级别未变化时直接返回）")
+
+    # 输出变慢时，调用方（SSE读取循环）每条日志的耗时
+    slow = SlowStream(0.0002)
+    direct_handler.setStream(slow)
+    # 队列处理器由写greenlet交给 plugin_logger_handler 写出
+    plugin_logger_handler.setStream(slow)
+    queued_logger = logging.getLogger("bench.queued")
+    queued_logger.propagate = False
+    log_config.install_queue_handler(queued_logger)
+    lines = min(repeat, 1000)
+    direct_us = per_call(lambda: legacy_logger.info("[SSE事件] 收到事件"), lines)
+    queued_us = per_call(lambda: queued_logger.info("[SSE事件] 收到事件"), lines)
+    print(f"输出流每次写入延迟0.2ms时，调用方每条日志耗时（{lines} 条）")
+    print(f"  直接写stdout      {direct_us:>8.2f} µs/条")
+    print(f"  队列处理器        {queued_us:>8.2f} µs/条")
+
+    # 等写greenlet写完积压的日志，再测端到端停顿
+    gevent.sleep(lines * slow.delay + 0.5)
+    readers, rounds = 20, 100
+    print(f"{readers}个读取循环每1ms处理一个事件并输出一条日志时，每轮超出间隔的时间（p50 / p99 / 最大，ms）")
+    for name, log in (("直接写stdout", legacy_logger.info), ("队列处理器", queued_logger.info)):
+        p50, p99, worst = read_loop_stall(log, readers, rounds)
+        print(f"  {name:<14}  {p50:>6.2f} / {p99:>6.2f} / {worst:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
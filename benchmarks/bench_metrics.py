@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+指标注册表开销基准
+
+1. 基本操作：计数器 inc、直方图 observe、按事件间隔批量 observe_many 的单次耗时
+2. 每个流结束时的汇总（stream_started + stream_finished）耗时
+3. 端到端：用 httpx.MockTransport 回放语料，SSEClient.connect_and_listen 在开启/关闭指标时的每事件耗时
+4. 导出 Prometheus 文本的耗时
+
+指标只在流和调用结束时汇总一次，读取循环里没有逐事件的指标操作，端到端差值应在噪声范围内。
+
+运行：python benchmarks/bench_metrics.py [回放轮数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import tools.dify_sse_node_plugin as generic_module  # noqa: E402
+from utils import log_config, metrics  # noqa: E402
+from utils.stream_timing import StreamTiming  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def per_call_ns(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e9
+
+
+def replay(client_factory, repeat):
+    """返回 (事件数, 总耗时秒)"""
+    events = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client = client_factory()
+        for _ in client.connect_and_listen(max_events=100000, max_duration=60):
+            events += 1
+    return events, time.perf_counter() - start
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # 回放时不输出每个流的INFO日志
+    log_config.configure_log_level("WARNING")
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("bench_total", "bench", ("client",)).labels("generic")
+    histogram = registry.histogram("bench_seconds", "bench", ("client",)).labels("generic")
+    gaps = [0.0123] * 1000
+
+    print("基本操作")
+    print(f"  counter.inc          {per_call_ns(counter.inc, 200000):>8.0f} ns")
+    print(f"  histogram.observe    {per_call_ns(lambda: histogram.observe(0.042), 200000):>8.0f} ns")
+    many_ns = per_call_ns(lambda: histogram.observe_many(gaps), 200) / len(gaps)
+    print(f"  observe_many（每值） {many_ns:>8.0f} ns")
+
+    timing = StreamTiming()
+    timing.start_request()
+    timing.headers_received()
+    for i in range(100):
+        timing.event_received(timing.request_start + i * 0.01)
+    timing.finish()
+
+    def aggregate():
+        metrics.stream_started("bench")
+        metrics.stream_finished("bench", timing, "server_closed")
+
+    print(f"每个流的汇总（100个事件）  {per_call_ns(aggregate, 20000) / 1000:>6.2f} µs")
+
+    # 端到端：get_http_pool 换成回放语料的客户端
+    bodies = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        with open(os.path.join(CORPUS_DIR, name), "rb") as f:
+            bodies[name] = f.read()
+
+    print(f"端到端回放（每个语料 {repeat} 次，ns/事件）")
+    print(f"  {'语料':<24}{'关闭指标':>10}{'开启指标':>10}{'差值':>8}")
+    original_pool = generic_module.get_http_pool
+    try:
+        for name, body in bodies.items():
+            transport = httpx.MockTransport(
+                lambda request, body=body: httpx.Response(200, headers={"Content-Type": "text/event-stream"},
+                                                          content=body))
+            mock_client = httpx.Client(transport=transport)
+            generic_module.get_http_pool = lambda: mock_client
+            results = {}
+            for enabled in (False, True, False, True):
+                metrics.REGISTRY.enabled = enabled
+                events, elapsed = replay(lambda: generic_module.SSEClient("http://corpus/"), repeat)
+                ns = elapsed / max(events, 1) * 1e9
+                # 交替运行两轮取较小值，减少预热和抖动影响
+                results[enabled] = min(results.get(enabled, ns), ns)
+            off, on = results[False], results[True]
+            print(f"  {name:<24}{off:>10.0f}{on:>10.0f}{on - off:>+8.0f}")
+            mock_client.close()
+    finally:
+        generic_module.get_http_pool = original_pool
+        metrics.REGISTRY.enabled = True
+
+    start = time.perf_counter()
+    text = metrics.REGISTRY.render()
+    print(f"导出 Prometheus 文本  {(time.perf_counter() - start) * 1000:.2f} ms（{len(text)} 字节）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+SSE解析微基准
+
+用 corpus/ 下录制的流在内存中驱动解析，不经过网络：
+- lines：SSEClient.parse_sse_event，按行输入的事件
+- chunk-4k / chunk-64：connect_and_listen 使用的字节块处理（_events_from_chunk + _finish_events），
+  分别模拟普通网络块和逐token到达的小块
+
+语料：
+- dify_chatflow.sse：Dify chatflow，以 message 增量为主
+- dify_node_finished.sse：大载荷 node_finished（LLM、知识检索、代码节点）
+- openai_chat.sse：OpenAI 风格 chat.completion.chunk，以 data: [DONE] 结束
+- multiline_custom.sse：CRLF换行、注释心跳、多行data、retry与自定义字段
+
+输出 events/s、MB/s（语料字节数）和每事件的内存分配：块数由 sys.getallocatedblocks() 统计，
+字节数由 tracemalloc 统计，均为保留全部事件时仍存活的分配（中途释放的临时对象不计入）。
+
+运行：python benchmarks/bench_parser.py [-n 重复次数] [--corpus 名称] [--save 结果.json] [--compare 基线.json]
+修改解析器前后各运行一次，用 --save 保存基线、--compare 对比。
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import dify_sse_node_plugin  # noqa: E402
+from tools.dify_sse_node_plugin import SSEClient  # noqa: E402
+from utils.debug_log import DebugLog  # noqa: E402
+from utils.sse_parser import SSEFrameParser  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+CORPORA = ("dify_chatflow", "dify_node_finished", "openai_chat", "multiline_custom")
+
+
+def split_lines(data):
+    """按空行切分为事件，每个事件是去掉换行符的行列表"""
+    text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    return [block.split("\n") for block in text.split("\n\n") if block]
+
+
+def split_chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def parse_lines(client, blocks):
+    events = []
+    for lines in blocks:
+        event = client.parse_sse_event(lines)
+        if event:
+            events.append(event)
+    return events
+
+
+def parse_chunks(client, chunks):
+    """与 connect_and_listen 相同的块处理，只是数据来自内存"""
+    client._begin_listen(sys.maxsize)
+    parser = SSEFrameParser(keep_raw=client.keep_raw)
+    dbg = DebugLog(dify_sse_node_plugin.logger)
+    events = []
+    for chunk in chunks:
+        events.extend(client._events_from_chunk(parser, chunk, dbg))
+    events.extend(client._finish_events(parser, dbg))
+    return events
+
+
+def best_time(func, args, repeat):
+    """多次运行取最短耗时"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def allocations(func, args):
+    """返回 (存活块数, 存活字节数)，结果在统计期间保持引用"""
+    gc.collect()
+    gc.disable()
+    try:
+        blocks_before = sys.getallocatedblocks()
+        result = func(*args)
+        blocks = sys.getallocatedblocks() - blocks_before
+        del result
+        tracemalloc.start()
+        result = func(*args)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+    finally:
+        gc.enable()
+    return blocks, size
+
+
+def bench_corpus(name, repeat):
+    with open(os.path.join(CORPUS_DIR, name + ".sse"), "rb") as f:
+        data = f.read()
+    client = SSEClient("http://localhost/")
+    cases = {
+        "lines": (parse_lines, (client, split_lines(data))),
+        "chunk-4k": (parse_chunks, (client, split_chunks(data, 4096))),
+        "chunk-64": (parse_chunks, (client, split_chunks(data, 64))),
+    }
+
+    results = {}
+    event_count = None
+    for mode, (func, args) in cases.items():
+        count = len(func(*args))
+        # 各种输入方式解析出的事件数必须一致
+        assert event_count is None or count == event_count, f"{name} {mode}: {count} != {event_count}"
+        event_count = count
+        elapsed = best_time(func, args, repeat)
+        blocks, size = allocations(func, args)
+        results[f"{name}/{mode}"] = {
+            "events": count,
+            "bytes": len(data),
+            "events_per_s": count / elapsed,
+            "mb_per_s": len(data) / elapsed / 1e6,
+            "blocks_per_event": blocks / count,
+            "bytes_per_event": size / count,
+        }
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="SSE解析微基准")
+    arg_parser.add_argument("-n", "--repeat", type=int, default=20, help="每项重复次数，取最短耗时")
+    arg_parser.add_argument("--corpus", choices=CORPORA, action="append", help="只运行指定语料，可重复")
+    arg_parser.add_argument("--save", help="把结果保存为JSON，作为之后对比的基线")
+    arg_parser.add_argument("--compare", help="与之前 --save 保存的基线对比 events/s")
+    args = arg_parser.parse_args()
+
+    # 每次 _finish_events 都输出一条INFO，基准中关闭
+    dify_sse_node_plugin.logger.setLevel(logging.WARNING)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name in args.corpus or CORPORA:
+        results.update(bench_corpus(name, args.repeat))
+
+    header = f"{'语料/方式':<30} {'事件':>6} {'events/s':>12} {'MB/s':>8} {'块/事件':>8} {'B/事件':>8}"
+    print(header + (f" {'相对基线':>8}" if baseline else ""))
+    for key, r in results.items():
+        line = (f"{key:<30} {r['events']:>6} {r['events_per_s']:>12,.0f} {r['mb_per_s']:>8.1f} "
+                f"{r['blocks_per_event']:>8.1f} {r['bytes_per_event']:>8.0f}")
+        if key in baseline:
+            line += f" {r['events_per_s'] / baseline[key]['events_per_s']:>7.2f}x"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"结果已保存到 {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+本地SSE替身服务器，用于离线压测
+
+- POST .../chat-messages：Dify chatflow 形状的流
+  workflow_started → node_started → N 个 message 增量 → node_finished → workflow_finished → message_end
+- POST .../chat-messages/{task_id}/stop：与 Dify 相同的停止接口，该任务的流随即结束（不再发送后续增量）
+- 其他路径（GET/POST）：通用流，N 个带 id 的 JSON 事件，data 约 size 字节
+
+流的参数可用命令行设置默认值，也可在每个请求的查询参数中覆盖：
+- events：事件数
+- size：每个事件 data 的近似字节数
+- rate：每秒事件数，0 表示不限速
+- delay：第一个事件前的延迟（秒），模拟首包耗时
+
+运行：python benchmarks/sse_standin_server.py [--port 8765] [--events 100] [--size 200] [--rate 0] [--delay 0]
+启动后在标准输出打印一行 "listening <host>:<port>"。
+只使用标准库，不导入插件代码（插件导入时会 patch gevent）。
+"""
+import argparse
+import json
+import re
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_STOP_PATH = re.compile(r"/chat-messages/([^/]+)/stop$")
+
+
+class StreamSpec:
+    """一个流的参数"""
+
+    def __init__(self, events: int = 100, size: int = 200, rate: float = 0, delay: float = 0):
+        self.events = events
+        self.size = size
+        self.rate = rate
+        self.delay = delay
+
+    def override(self, query: str) -> "StreamSpec":
+        """用查询参数覆盖默认值"""
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        return StreamSpec(int(params.get("events", self.events)), int(params.get("size", self.size)),
+                          float(params.get("rate", self.rate)), float(params.get("delay", self.delay)))
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 事件是一个个小块，不关闭Nagle时会与客户端的延迟确认叠加出约40ms的停顿
+    disable_nagle_algorithm = True
+    spec = StreamSpec()
+
+    def do_GET(self):
+        self._stream(self.spec.override(urlsplit(self.path).query), chatflow=False)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        split = urlsplit(self.path)
+        spec = self.spec.override(split.query)
+        stop = _STOP_PATH.search(split.path)
+        if stop:
+            self._stop_task(stop.group(1), body)
+        elif split.path.endswith("/chat-messages"):
+            try:
+                query = json.loads(body).get("query", "")
+            except ValueError:
+                query = ""
+            self._stream(spec, chatflow=True, query=query)
+        else:
+            self._stream(spec, chatflow=False)
+
+    def _stop_task(self, task_id: str, body: bytes):
+        try:
+            user = json.loads(body).get("user")
+        except ValueError:
+            user = None
+        self.server.stop_requests.append({"task_id": task_id, "user": user})
+        self.server.stopped_tasks.add(task_id)
+        data = json.dumps({"result": "success"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, spec: StreamSpec, chatflow: bool, query: str = ""):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = self._chatflow_events(spec, query, self.server.stopped_tasks) if chatflow else self._generic_events(spec)
+        interval = 1 / spec.rate if spec.rate > 0 else 0
+        if spec.delay:
+            time.sleep(spec.delay)
+        start = time.monotonic()
+        try:
+            for i, event in enumerate(events):
+                if interval:
+                    # 按绝对时间排期，写入本身的耗时不累积成漂移
+                    wait = start + i * interval - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                self._chunk(event)
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束（达到事件数上限、答案完整、调用取消等）
+            self.close_connection = True
+            self.server.aborted_streams += 1
+
+    @staticmethod
+    def _generic_events(spec: StreamSpec):
+        filler = "x" * max(0, spec.size - 40)
+        for i in range(1, spec.events + 1):
+            data = json.dumps({"n": i, "ts": time.time(), "payload": filler})
+            yield f"id: {i}\ndata: {data}\n\n".encode()
+
+    @staticmethod
+    def _chatflow_events(spec: StreamSpec, query: str, stopped_tasks=frozenset()):
+        task_id, run_id, message_id = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+        base = {"task_id": task_id, "workflow_run_id": run_id, "message_id": message_id,
+                "conversation_id": "standin", "created_at": int(time.time())}
+        delta = ("答" * max(1, spec.size // 3))[:max(1, spec.size // 3)]
+        answer = delta * spec.events
+
+        def event(name, **fields):
+            return ("data: " + json.dumps({"event": name, **base, **fields}) + "\n\n").encode()
+
+        yield event("workflow_started", data={"id": run_id, "inputs": {"sys.query": query}})
+        yield event("node_started", data={"node_id": "llm", "node_type": "llm", "title": "LLM"})
+        for _ in range(spec.events):
+            if task_id in stopped_tasks:
+                # 任务被停止：与 Dify 一样不再生成后续内容
+                yield event("message_end", metadata={"stopped": True})
+                return
+            yield event("message", answer=delta)
+        yield event("node_finished", data={"node_id": "llm", "node_type": "llm", "status": "succeeded",
+                                           "outputs": {"text": answer}})
+        yield event("workflow_finished", data={"id": run_id, "status": "succeeded", "outputs": {"answer": answer}})
+        yield event("message_end", metadata={"usage": {"total_tokens": spec.events}})
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认监听队列只有5，大量并发连接时会被拒绝
+    request_queue_size = 4096
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stopped_tasks = set()
+        self.stop_requests = []  # 收到的停止请求：{"task_id", "user"}
+        self.aborted_streams = 0  # 客户端中途断开的流
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, spec: StreamSpec = None) -> StandinServer:
+    """创建服务器，调用方负责 serve_forever / shutdown"""
+    handler = type("Handler", (StandinHandler,), {"spec": spec or StreamSpec()})
+    return StandinServer((host, port), handler)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="本地SSE替身服务器")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765, help="0 表示随机端口")
+    arg_parser.add_argument("--events", type=int, default=100)
+    arg_parser.add_argument("--size", type=int, default=200)
+    arg_parser.add_argument("--rate", type=float, default=0)
+    arg_parser.add_argument("--delay", type=float, default=0)
+    args = arg_parser.parse_args()
+
+    server = make_server(args.host, args.port, StreamSpec(args.events, args.size, args.rate, args.delay))
+    host, port = server.server_address[:2]
+    print(f"listening {host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
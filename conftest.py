@@ -0,0 +1,63 @@
+"""
+测试共用的本地替身服务器和指标读取
+
+测试文件用 from conftest import ... 导入，pytest 收集和直接作为脚本运行时都可用。
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple, Type
+
+from utils import metrics
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    """替身服务器处理器的基类：分块写出SSE事件，不输出访问日志"""
+    protocol_version = "HTTP/1.1"
+    # 响应头和事件分多次小块写出，不关闭Nagle时会被延迟确认拖慢约40ms
+    disable_nagle_algorithm = True
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def send_empty(self, status: int, headers: Optional[Dict[str, str]] = None) -> None:
+        """返回没有响应体的状态码"""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def start_stream(self) -> None:
+        """发送分块传输的SSE响应头"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(server: ThreadingHTTPServer) -> Tuple[ThreadingHTTPServer, str]:
+    """在后台线程中运行服务器，返回 (服务器, 基础URL)"""
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_server(handler: Type[BaseHTTPRequestHandler],
+                 server_class: Type[ThreadingHTTPServer] = ThreadingHTTPServer) -> Tuple[ThreadingHTTPServer, str]:
+    """在随机端口启动替身服务器，返回 (服务器, 基础URL)"""
+    return serve(server_class(("127.0.0.1", 0), handler))
+
+
+def metric_value(metric, *labels) -> float:
+    """指标子项的当前值（直方图为观测次数），子项不存在时为0"""
+    child = metric._children.get(tuple(str(v) for v in labels))
+    if child is None:
+        return 0
+    return child.count if isinstance(metric, metrics.Histogram) else child.value
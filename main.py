@@ -1,6 +1,8 @@
 import logging
 from dify_plugin import Plugin, DifyPluginEnv
 
+from utils.retry_policy import MAX_REQUEST_TIMEOUT
+
 # 日志级别现在通过插件配置管理，在provider中设置
 # 默认设置一个基础的日志配置，会被provider覆盖
 logging.basicConfig(
@@ -8,7 +10,7 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=120))
+plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=MAX_REQUEST_TIMEOUT))
 
 if __name__ == '__main__':
     plugin.run()
@@ -1,9 +1,11 @@
-import logging
 from typing import Any
 
 from dify_plugin import ToolProvider
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
 
+from utils import metrics
+from utils.log_config import configure_log_level
+
 
 class DifySseNodePluginProvider(ToolProvider):
     
@@ -20,34 +22,18 @@ class DifySseNodePluginProvider(ToolProvider):
             # 配置日志级别
             log_level = credentials.get('log_level', 'INFO')
             self._setup_logging(log_level)
+            metrics.credentials_validated("ok")
             
         except Exception as e:
+            metrics.credentials_validated("error")
             raise ToolProviderCredentialValidationError(str(e))
     
     def _setup_logging(self, log_level: str) -> None:
         """
-        设置日志级别
+        设置插件logger的日志级别
+        只调整插件自己的logger（同一级别只配置一次），不再用 basicConfig(force=True) 重建根logger的处理器
         """
-        # 将字符串转换为logging级别
-        level_mapping = {
-            'DEBUG': logging.DEBUG,
-            'INFO': logging.INFO,
-            'WARNING': logging.WARNING,
-            'ERROR': logging.ERROR
-        }
-        
-        level = level_mapping.get(log_level.upper(), logging.INFO)
-        
-        # 配置根日志记录器
-        logging.basicConfig(
-            level=level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            force=True  # 强制重新配置，覆盖之前的配置
-        )
-        
-        # 记录日志级别设置
-        logger = logging.getLogger(__name__)
-        logger.info(f"日志级别已设置为: {log_level}")
+        configure_log_level(log_level)
 
     #########################################################################################
     # If OAuth is supported, uncomment the following functions.
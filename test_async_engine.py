@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+测试asyncio引擎：与同步引擎输出一致、单线程承载大量空闲长连接、提前结束时取消读取
+"""
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+from conftest import SSEHandler, start_server
+from tools.dify_chatflow_sse import DifyChatflowSSEClient
+from tools.dify_sse_node_plugin import SSEClient
+from utils import host_limiter
+from utils.async_engine import AsyncSSEEngine
+from utils.host_limiter import LimiterConfig
+from utils.http_pool import PoolConfig
+from utils.native import original
+
+IDLE_STREAMS = 200
+
+FIRST_EVENT = b'id: 1\nevent: message\ndata: {"event": "message", "answer": "\\u4f60\\u597d"}\n\n'
+LAST_EVENT = b'id: 2\ndata: {"event": "message_end"}\n\n'
+
+
+class _IdleHandler(SSEHandler):
+    """发送第一个事件后保持连接空闲，直到release被设置才发送最后一个事件并结束"""
+    release = None
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.active += 1
+        cls.max_active = max(cls.max_active, cls.active)
+        try:
+            self.start_stream()
+            self._chunk(FIRST_EVENT)
+            cls.release.wait(30)
+            self._chunk(LAST_EVENT)
+            self._chunk(b"")
+        finally:
+            cls.active -= 1
+
+
+def _start_server(release):
+    handler = type("Handler", (_IdleHandler,), {"release": release, "active": 0, "max_active": 0})
+    server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": IDLE_STREAMS + 16})
+    server, base = start_server(handler, server_class)
+    return server, handler, base + "/stream"
+
+
+def _summary(events):
+    return [(e.event_type, e.event_id, e.parsed, e.size) for e in events]
+
+
+def test_async_matches_sync():
+    """同一个流经两种引擎得到相同的事件和结束原因"""
+    release = threading.Event()
+    release.set()
+    server, _, url = _start_server(release)
+    engine = AsyncSSEEngine(PoolConfig())
+    try:
+        for client_class in (SSEClient, DifyChatflowSSEClient):
+            sync_client = client_class(url)
+            async_client = client_class(url)
+            sync_events = list(sync_client.connect_and_listen(10, 30))
+            async_events = list(engine.iterate(async_client.aconnect_and_listen(10, 30, engine.pool)))
+            assert _summary(async_events) == _summary(sync_events)
+            assert async_events[0].parsed == {"event": "message", "answer": "你好"}
+            assert async_client.stop_reason == sync_client.stop_reason == "server_closed"
+    finally:
+        engine.close()
+        server.shutdown()
+
+
+def test_idle_streams_share_one_thread():
+    """200个同时打开的空闲流由引擎线程中的一个事件循环承载"""
+    release = threading.Event()
+    server, handler, url = _start_server(release)
+    config = PoolConfig(max_connections=IDLE_STREAMS + 16, max_keepalive_connections=IDLE_STREAMS + 16)
+    engine = AsyncSSEEngine(config)
+    # 限流默认关闭；显式设置上限为 IDLE_STREAMS，环境变量启用了更低的并发上限时也能同时保持这些流
+    host_limiter.configure(LimiterConfig(max_concurrent=IDLE_STREAMS))
+    get_ident = original('_thread', 'get_ident')
+    thread_ids = set()
+    connected = []
+
+    async def listen(client):
+        events = []
+        async for event in client.aconnect_and_listen(10, 60, engine.pool):
+            thread_ids.add(get_ident())
+            events.append(event)
+            if len(events) == 1:
+                connected.append(client)
+                if len(connected) == IDLE_STREAMS:
+                    # 所有流都已收到第一个事件并处于空闲状态
+                    handler.max_active_when_idle = handler.active
+                    release.set()
+        return events
+
+    async def listen_all():
+        clients = [DifyChatflowSSEClient(url) for _ in range(IDLE_STREAMS)]
+        return clients, await asyncio.gather(*(listen(client) for client in clients))
+
+    try:
+        clients, results = engine.run(listen_all(), timeout=60)
+        pool_stats = engine.pool.stats(url)
+    finally:
+        host_limiter.configure(None)
+        engine.close()
+        server.shutdown()
+
+    assert handler.max_active_when_idle == IDLE_STREAMS
+    assert thread_ids and len(thread_ids) == 1
+    assert get_ident() not in thread_ids
+    assert all([e.event_id for e in events] == ["1", "2"] for events in results)
+    assert all(client.stop_reason == "server_closed" for client in clients)
+    assert pool_stats["new_connections"] == IDLE_STREAMS
+
+
+def test_early_close_cancels_stream():
+    """调用方提前结束迭代时取消引擎中的读取协程"""
+    release = threading.Event()
+    server, _, url = _start_server(release)
+    engine = AsyncSSEEngine(PoolConfig())
+
+    async def pending_tasks():
+        await asyncio.sleep(0.05)
+        return len(asyncio.all_tasks()) - 1
+
+    try:
+        for event in engine.iterate(DifyChatflowSSEClient(url).aconnect_and_listen(10, 30, engine.pool)):
+            assert event.event_id == "1"
+            break
+        assert engine.run(pending_tasks(), timeout=5) == 0
+    finally:
+        release.set()
+        engine.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    test_async_matches_sync()
+    test_idle_streams_share_one_thread()
+    test_early_close_cancels_stream()
+    print("测试完成！")
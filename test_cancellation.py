@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+测试调用取消：关闭工具生成器时立即断开上游连接，chatflow 还会调用 Dify 的停止接口
+使用 benchmarks/sse_standin_server.py 作为本地替身
+"""
+import json
+import os
+import time
+
+import gevent
+
+from benchmarks.sse_standin_server import StreamSpec, make_server
+from conftest import SSEHandler, metric_value, serve, start_server
+from tools.dify_chatflow_batch import DifyChatflowBatchTool
+from tools.dify_chatflow_sse import DifyChatflowSSEClient, DifyChatflowSSETool
+from tools.dify_sse_fanout import DifySseFanoutTool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils import metrics
+
+
+def _start_server():
+    # 每秒20个事件，共5秒：取消时流一定还在进行
+    return serve(make_server(spec=StreamSpec(events=100, size=30, rate=20)))
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def _cancel_after_first_stream_output(tool_cls, **parameters):
+    """流式模式下收到第一段输出后关闭工具生成器"""
+    gen = tool_cls.from_credentials({})._invoke({"output_mode": "stream", **parameters})
+    for message in gen:
+        if message.type.value == "variable" and message.message.stream:
+            break
+    gen.close()
+
+
+def test_chatflow_cancel_stops_dify_task_both_engines():
+    """取消chatflow调用：断开连接，并用相同的user调用 /chat-messages/{task_id}/stop"""
+    server, base = _start_server()
+    try:
+        for engine in ("sync", "async"):
+            server.stop_requests.clear()
+            aborted = server.aborted_streams
+            cancelled = metric_value(metrics.INVOCATIONS, "dify_chatflow_sse", "cancelled")
+            os.environ["SSE_ENGINE"] = engine
+            start = time.monotonic()
+            try:
+                _cancel_after_first_stream_output(
+                    DifyChatflowSSETool, url=base + "/v1/chat-messages", method="POST",
+                    headers='{"Authorization": "Bearer app-test"}',
+                    body='{"query": "hi", "user": "user-7", "response_mode": "streaming"}')
+            finally:
+                os.environ.pop("SSE_ENGINE", None)
+            assert time.monotonic() - start < 2, engine
+            assert len(server.stop_requests) == 1, engine
+            assert server.stop_requests[0]["user"] == "user-7"
+            assert server.stop_requests[0]["task_id"] in server.stopped_tasks
+            assert _wait_for(lambda: server.aborted_streams > aborted), engine
+            assert metric_value(metrics.INVOCATIONS, "dify_chatflow_sse", "cancelled") == cancelled + 1
+    finally:
+        server.shutdown()
+
+
+def test_generic_cancel_closes_connection():
+    """取消通用调用：服务端立即发现连接已断开；结果输出之后再关闭不算取消"""
+    server, base = _start_server()
+    try:
+        aborted = server.aborted_streams
+        closed_streams = metric_value(metrics.STREAMS, "generic", "cancelled")
+        _cancel_after_first_stream_output(DifySseNodePluginTool, url=base + "/events")
+        assert _wait_for(lambda: server.aborted_streams == aborted + 1)
+        assert metric_value(metrics.STREAMS, "generic", "cancelled") == closed_streams + 1
+        assert server.stop_requests == []
+
+        cancelled = metric_value(metrics.INVOCATIONS, "dify_sse_node_plugin", "cancelled")
+        gen = DifySseNodePluginTool.from_credentials({})._invoke({"url": base + "/events?events=3&rate=0"})
+        assert next(gen).type.value == "json"
+        gen.close()
+        assert metric_value(metrics.INVOCATIONS, "dify_sse_node_plugin", "cancelled") == cancelled
+    finally:
+        server.shutdown()
+
+
+def test_stop_task_requires_chat_messages_url():
+    """只有 chat-messages 接口可以停止；停止请求携带原请求的认证头"""
+    server, base = _start_server()
+    try:
+        assert not DifyChatflowSSEClient(base + "/v1/workflows/run", "POST").stop_task("t1")
+        client = DifyChatflowSSEClient(base + "/v1/chat-messages?x=1", "POST", {"Authorization": "Bearer k"},
+                                       body='{"user": "u1"}')
+        assert client.stop_task("task-42")
+        assert server.stop_requests == [{"task_id": "task-42", "user": "u1"}]
+    finally:
+        server.shutdown()
+
+
+def test_fanout_cancel_closes_every_source():
+    """取消多源调用：所有源的连接立即断开"""
+    server, base = _start_server()
+    try:
+        aborted = server.aborted_streams
+        cancelled = metric_value(metrics.INVOCATIONS, "dify_sse_fanout", "cancelled")
+        start = time.monotonic()
+        _cancel_after_first_stream_output(DifySseFanoutTool, sources=json.dumps([base + "/events"] * 3))
+        assert time.monotonic() - start < 2
+        assert _wait_for(lambda: server.aborted_streams == aborted + 3)
+        assert server.stop_requests == []
+        assert metric_value(metrics.INVOCATIONS, "dify_sse_fanout", "cancelled") == cancelled + 1
+    finally:
+        server.shutdown()
+
+
+def test_batch_cancel_stops_running_dify_tasks():
+    """结束批量调用的greenlet：断开正在监听的查询，并停止它们仍在生成的Dify任务；未开始的查询不发请求"""
+    server, base = _start_server()
+    try:
+        aborted = server.aborted_streams
+        cancelled = metric_value(metrics.INVOCATIONS, "dify_chatflow_batch", "cancelled")
+        parameters = {"url": base + "/v1/chat-messages", "body": '{"user": "user-9"}',
+                      "queries": json.dumps(["a", "b", "c", "d"]), "concurrency": 2}
+        invocation = gevent.spawn(lambda: list(DifyChatflowBatchTool.from_credentials({})._invoke(parameters)))
+        # 每个流约5秒：0.5秒后前两个查询都在监听中
+        gevent.sleep(0.5)
+        start = time.monotonic()
+        invocation.kill()
+        assert time.monotonic() - start < 2
+        assert [request["user"] for request in server.stop_requests] == ["user-9", "user-9"]
+        assert _wait_for(lambda: server.aborted_streams == aborted + 2)
+        assert metric_value(metrics.INVOCATIONS, "dify_chatflow_batch", "cancelled") == cancelled + 1
+    finally:
+        server.shutdown()
+
+
+class _TrailingHandler(SSEHandler):
+    """message_end 之后仍持续发送约3秒的事件"""
+
+    def do_POST(self):
+        self.read_body()
+        self.start_stream()
+        events = [{"event": "message", "task_id": "t1", "answer": "done"}, {"event": "message_end", "task_id": "t1"}]
+        events += [{"event": "ping"}] * 30
+        try:
+            for i, event in enumerate(events):
+                self._chunk(f"id: {i}\ndata: {json.dumps(event)}\n\n".encode())
+                time.sleep(0.1)
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def test_stop_when_complete_closes_stream_before_output_both_engines():
+    """答案完整后提前结束：在输出最终结果之前关闭流，不等调用方取完生成器"""
+    server, base = start_server(_TrailingHandler)
+    url = base + "/v1/chat-messages"
+    active = metrics.STREAMS_ACTIVE.labels("chatflow")
+    try:
+        for engine in ("sync", "async"):
+            baseline = active.value
+            os.environ["SSE_ENGINE"] = engine
+            try:
+                gen = DifyChatflowSSETool.from_credentials({})._invoke(
+                    {"url": url, "method": "POST", "body": '{"query": "hi"}', "stop_when_complete": True})
+                result = next(m.message.json_object for m in gen if m.type.value == "json")
+                assert result["stop_reason"] == "answer_complete", engine
+                assert _wait_for(lambda: active.value == baseline), engine
+            finally:
+                os.environ.pop("SSE_ENGINE", None)
+            gen.close()
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    test_chatflow_cancel_stops_dify_task_both_engines()
+    test_generic_cancel_closes_connection()
+    test_stop_task_requires_chat_messages_url()
+    test_fanout_cancel_closes_every_source()
+    test_batch_cancel_stops_running_dify_tasks()
+    test_stop_when_complete_closes_stream_before_output_both_engines()
+    print("测试完成！")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+测试Chatflow答案的增量组装
+"""
+from tools.dify_chatflow_sse import ChatflowAnswerAssembler, SSEEvent
+
+
+def _event(payload):
+    return SSEEvent("message", None, parsed=payload)
+
+
+def test_incremental_answer():
+    """message增量按顺序拼接，message_end标记完成"""
+    assembler = ChatflowAnswerAssembler()
+    assert assembler.feed(_event({"event": "message", "answer": "你好", "task_id": "t-1"})) == "你好"
+    assert assembler.feed(_event({"event": "node_finished", "data": {"outputs": {}}})) is None
+    assert assembler.feed(_event({"event": "message", "answer": "，世界"})) == "，世界"
+    assert assembler.answer == "你好，世界"
+    assert not assembler.is_complete
+
+    assembler.feed(_event({"event": "message_end", "task_id": "t-1"}))
+    assert assembler.is_complete
+    assert assembler.task_id == "t-1"
+
+
+def test_workflow_finished_answer_wins():
+    """workflow_finished中的完整答案优先于增量拼接结果"""
+    assembler = ChatflowAnswerAssembler()
+    assembler.feed(_event({"event": "message", "answer": "草稿"}))
+    assembler.feed(_event({"event": "workflow_finished", "data": {"outputs": {"answer": "最终答案"}}}))
+    assert assembler.workflow_finished
+    assert assembler.answer == "最终答案"
+    assert assembler.streamed_answer == "草稿"
+
+
+if __name__ == '__main__':
+    test_incremental_answer()
+    test_workflow_finished_answer_wins()
+    print("测试完成！")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+测试Chatflow批量查询：并发上限、结果顺序、连接复用、失败隔离与延迟统计
+"""
+import json
+import time
+
+from conftest import SSEHandler, start_server
+from tools.dify_chatflow_batch import DifyChatflowBatchTool
+from utils import invocation_deadline
+from utils.latency_stats import percentile, summarize
+
+ANSWER_DELAY = 0.1
+
+
+class _ChatMessagesHandler(SSEHandler):
+    """模拟 /chat-messages：分两段流式返回 "答:<query>"；query为bad时返回400，为stall时只返回第一段后停滞"""
+    active = 0
+    max_active = 0
+    bodies = []
+
+    def do_POST(self):
+        cls = type(self)
+        body = json.loads(self.read_body())
+        cls.bodies.append(body)
+        if body["query"] == "bad":
+            payload = b'{"code": "invalid_param"}'
+            self.send_response(400)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        cls.active += 1
+        cls.max_active = max(cls.max_active, cls.active)
+        try:
+            self.start_stream()
+            task_id = "task-" + body["query"]
+            for delta in ("答:", body["query"]):
+                time.sleep(ANSWER_DELAY)
+                self._event({"event": "message", "task_id": task_id, "answer": delta})
+                if body["query"] == "stall":
+                    time.sleep(ANSWER_DELAY * 20)
+                    return
+            self._event({"event": "message_end", "task_id": task_id})
+            self._chunk(b"")
+        finally:
+            cls.active -= 1
+
+    def _event(self, data):
+        self._chunk(b"data: " + json.dumps(data, ensure_ascii=False).encode() + b"\n\n")
+
+
+def _invoke(queries, **parameters):
+    handler = type("Handler", (_ChatMessagesHandler,), {"active": 0, "max_active": 0, "bodies": []})
+    server, base = start_server(handler)
+    try:
+        tool = DifyChatflowBatchTool.from_credentials({})
+        url = base + "/v1/chat-messages"
+        start = time.time()
+        messages = list(tool._invoke({"url": url, "headers": "{}", "body": '{"inputs": {"lang": "zh"}, "user": "u1"}',
+                                      "queries": json.dumps(queries, ensure_ascii=False), **parameters}))
+        elapsed = time.time() - start
+    finally:
+        server.shutdown()
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    variables = {m.message.variable_name: m.message.variable_value for m in messages if m.type.value == "variable"}
+    return result, variables, handler, elapsed
+
+
+def test_batch_runs_concurrently_in_order():
+    """并发不超过上限，结果与输入顺序一致，答案完整后提前结束"""
+    queries = [f"q{i}" for i in range(12)]
+    result, variables, handler, elapsed = _invoke(queries, concurrency=4)
+    results = variables["results"]
+    assert [r["query"] for r in results] == queries
+    assert all(r["status"] == "completed" for r in results)
+    assert [r["chatflow_answer"] for r in results] == [f"答:{q}" for q in queries]
+    assert all(r["stop_reason"] == "answer_complete" for r in results)
+    assert handler.max_active <= 4
+    # 12个查询、并发4，约3轮，每轮约2*ANSWER_DELAY
+    assert elapsed < 12 * 2 * ANSWER_DELAY * 0.6
+    assert result["throughput"] > 0
+    assert variables["latency_p50"] <= variables["latency_p95"]
+    # 请求体由模板与查询合并而成
+    assert all(body["inputs"] == {"lang": "zh"} and body["user"] == "u1" and body["response_mode"] == "streaming"
+               for body in handler.bodies)
+
+
+def test_connections_reused_when_streams_drained():
+    """读完整个响应时连接归还连接池，新建连接数不超过并发上限"""
+    result, variables, _, _ = _invoke([f"q{i}" for i in range(8)], concurrency=2, stop_when_complete=False)
+    assert [r["stop_reason"] for r in variables["results"]] == ["server_closed"] * 8
+    assert result["pool_stats"]["new_connections"] <= 2
+    assert result["pool_stats"]["hits"] >= 6
+
+
+def test_failed_query_is_isolated():
+    """单个查询失败不影响其他查询，整体状态为partial"""
+    result, variables, _, _ = _invoke(["a", "bad", {"query": "c", "inputs": {"lang": "en"}}], concurrency=2)
+    assert result["status"] == "partial"
+    assert [r["status"] for r in variables["results"]] == ["completed", "failed", "completed"]
+    failed = variables["results"][1]
+    assert failed["chatflow_answer"] is None and "400" in failed["error"] and failed["attempts"] == 1
+    assert result["latency"]["count"] == 2
+
+
+def test_stalled_query_ends_at_idle_timeout():
+    """停滞的查询由空闲超时结束并保留已收到的答案，不占用并发名额"""
+    result, variables, _, elapsed = _invoke(["stall", "a", "b"], concurrency=1, idle_timeout=ANSWER_DELAY * 3)
+    stall, a, b = variables["results"]
+    assert (stall["status"], stall["stop_reason"], stall["chatflow_answer"]) == ("completed", "idle_timeout", "答:")
+    assert a["chatflow_answer"] == "答:a" and b["chatflow_answer"] == "答:b"
+    assert elapsed < ANSWER_DELAY * 15
+
+
+def test_batch_stops_starting_queries_at_deadline():
+    """整批共享调用截止时间：预算用完后不再开始新的查询，返回已完成的部分结果"""
+    original = invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE
+    # 预算1秒，每个查询约0.2秒，串行执行10个
+    invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE = 1.5, 0.5
+    try:
+        result, variables, _, elapsed = _invoke([f"q{i}" for i in range(10)], concurrency=1)
+    finally:
+        invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE = original
+    statuses = [r["status"] for r in variables["results"]]
+    assert result["status"] == "partial"
+    assert statuses[0] == "completed" and statuses[-1] == "skipped"
+    assert result["skipped"] == statuses.count("skipped") >= 3
+    # 跳过的查询之后不会再有开始过的查询
+    assert all(s == "skipped" for s in statuses[statuses.index("skipped"):])
+    assert all(r["attempts"] == 0 and r["chatflow_answer"] is None
+               for r in variables["results"] if r["status"] == "skipped")
+    assert result["deadline"]["budget_s"] == 1.0 and result["deadline"]["capped_by_runtime"]
+    assert elapsed < 1.5
+    # 吞吐只计成功完成的查询，不计未开始的查询
+    assert abs(result["throughput"] * result["duration"] - result["succeeded"]) < 0.1
+    assert result["throughput"] < result["total_queries"] / result["duration"]
+
+
+def test_percentiles():
+    """最近秩百分位"""
+    values = list(range(1, 21))
+    assert percentile(values, 50) == 10
+    assert percentile(values, 95) == 19
+    assert percentile(values, 100) == 20
+    assert percentile([], 50) is None
+    assert summarize([3, 1, 2]) == {"count": 3, "min": 1, "p50": 2, "p95": 3, "max": 3, "mean": 2}
+
+
+if __name__ == '__main__':
+    test_batch_runs_concurrently_in_order()
+    test_connections_reused_when_streams_drained()
+    test_failed_query_is_isolated()
+    test_stalled_query_ends_at_idle_timeout()
+    test_batch_stops_starting_queries_at_deadline()
+    test_percentiles()
+    print("测试完成！")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试按主机的熔断器：失败率达到阈值后熔断、熔断中立即失败、半开时只放行一个试探请求
+"""
+import os
+import time
+
+from conftest import SSEHandler, metric_value, start_server
+from tools.dify_chatflow_sse import DifyChatflowSSETool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils import circuit_breaker, metrics
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerConfig, CircuitBreaker, CircuitOpenError
+
+
+class _Handler(SSEHandler):
+    """healthy 为False时返回 503（Retry-After: 0，重试不等待），否则返回两个事件"""
+    healthy = False
+    requests = 0
+
+    def do_POST(self):
+        self.read_body()
+        self.do_GET()
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests += 1
+        if not cls.healthy:
+            self.send_empty(503, {"Retry-After": "0"})
+            return
+        body = b'id: 1\ndata: {"event": "message", "answer": "ok"}\n\nid: 2\ndata: {"event": "message_end"}\n\n'
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _rejects(breaker):
+    try:
+        breaker.acquire()
+    except CircuitOpenError:
+        return True
+    return False
+
+
+def test_breaker_state_machine():
+    """4xx计为成功；失败率达到阈值后熔断；半开时只有一个试探，失败重新熔断，成功恢复"""
+    breaker = CircuitBreaker("h:80", BreakerConfig(failure_rate=0.5, min_requests=4, open_seconds=0.1))
+    opened = metric_value(metrics.CIRCUIT_TRANSITIONS, "h:80", OPEN)
+    breaker.acquire().report_status(404)
+    breaker.acquire().report_status(200)
+    breaker.acquire().failure()
+    assert breaker.state == CLOSED
+    # 没有结果的请求不计入
+    breaker.acquire().release()
+    breaker.acquire().report_status(503)
+    assert breaker.state == OPEN
+    assert breaker.stats()["failures"] == 2
+    assert _rejects(breaker)
+
+    time.sleep(0.12)
+    probe = breaker.acquire()
+    assert probe.probe and breaker.state == HALF_OPEN
+    assert _rejects(breaker)
+    # 试探请求没有结果时让出名额
+    probe.release()
+    probe = breaker.acquire()
+    probe.failure()
+    assert breaker.state == OPEN and _rejects(breaker)
+
+    time.sleep(0.12)
+    breaker.acquire().report_status(200)
+    assert breaker.state == CLOSED and breaker.stats()["requests"] == 0
+    assert not breaker.acquire().probe
+    assert metric_value(metrics.CIRCUIT_TRANSITIONS, "h:80", OPEN) == opened + 2
+    assert metric_value(metrics.CIRCUIT_STATE, "h:80") == 0
+
+
+def _invoke(tool_cls, **parameters):
+    start = time.monotonic()
+    messages = list(tool_cls.from_credentials({})._invoke(parameters))
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    return result, time.monotonic() - start
+
+
+def test_tools_fail_fast_while_open_and_recover_after_probe():
+    """主机持续503：熔断后同一调用不再重试，后续调用（两种引擎）不发请求立即失败；主机恢复后试探成功"""
+    handler = type("Handler", (_Handler,), {})
+    server, base = start_server(handler)
+    url = base + "/events"
+    circuit_breaker.configure(BreakerConfig(failure_rate=0.5, min_requests=2, open_seconds=0.5))
+    try:
+        result, _ = _invoke(DifySseNodePluginTool, url=url)
+        assert result["status"] == "failed"
+        assert [a["give_up_reason"] for a in result["attempts"]] == [None, None, "circuit_open"]
+        assert handler.requests == 2
+
+        rejected = metric_value(metrics.CIRCUIT_REJECTIONS, f"127.0.0.1:{server.server_address[1]}")
+        for engine, tool_cls in (("sync", DifySseNodePluginTool), ("async", DifyChatflowSSETool)):
+            os.environ["SSE_ENGINE"] = engine
+            try:
+                result, elapsed = _invoke(tool_cls, url=url, method="POST", body='{"query": "hi"}')
+            finally:
+                os.environ.pop("SSE_ENGINE", None)
+            assert result["status"] == "failed", engine
+            assert result["attempts"][0]["give_up_reason"] == "circuit_open", engine
+            assert elapsed < 0.3, (engine, elapsed)
+        assert handler.requests == 2
+        assert metric_value(metrics.CIRCUIT_REJECTIONS, f"127.0.0.1:{server.server_address[1]}") == rejected + 2
+
+        handler.healthy = True
+        time.sleep(0.55)
+        result, _ = _invoke(DifySseNodePluginTool, url=url)
+        assert result["status"] == "completed"
+        assert circuit_breaker.get_circuit_breaker(url).state == CLOSED
+    finally:
+        circuit_breaker.configure(None)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    test_breaker_state_machine()
+    test_tools_fail_fast_while_open_and_recover_after_probe()
+    print("测试完成！")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+测试热路径调试日志的开关与采样
+"""
+import logging
+
+from utils.debug_log import DebugLog
+
+
+def test_disabled_when_level_is_info():
+    logger = logging.getLogger("test_debug_log.info")
+    logger.setLevel(logging.INFO)
+    dbg = DebugLog(logger, sample_every=1)
+    assert not dbg.enabled
+    assert not any(dbg.sampled() for _ in range(10))
+
+
+def test_sampling_one_in_n(caplog):
+    logger = logging.getLogger("test_debug_log.debug")
+    logger.setLevel(logging.DEBUG)
+    dbg = DebugLog(logger, sample_every=10)
+    assert dbg.enabled
+    hits = [i for i in range(1, 31) if dbg.sampled()]
+    assert hits == [1, 11, 21]
+
+    with caplog.at_level(logging.DEBUG, logger=logger.name):
+        dbg.debug("事件 %d", 7)
+    assert caplog.messages == ["事件 7"]
+
+
+def test_sample_every_from_env(monkeypatch):
+    monkeypatch.setenv("SSE_DEBUG_SAMPLE_EVERY", "5")
+    assert DebugLog(logging.getLogger("test_debug_log.env")).sample_every == 5
+    monkeypatch.setenv("SSE_DEBUG_SAMPLE_EVERY", "abc")
+    assert DebugLog(logging.getLogger("test_debug_log.env")).sample_every == 100
+
+
+if __name__ == '__main__':
+    test_disabled_when_level_is_info()
+    print("测试完成！")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试按字节预算保留事件
+"""
+import pytest
+
+from utils.event_retention import EventRetention
+
+
+def test_keep_first_drops_later_events():
+    retention = EventRetention("keep_first", max_bytes=10)
+    assert retention.add("a", 4)
+    assert retention.add("b", 4)
+    assert not retention.add("c", 4)
+    assert retention.add("d", 2)
+    assert retention.events == ["a", "b", "d"]
+    stats = retention.stats()
+    assert stats["retained_bytes"] == 10
+    assert (stats["dropped_events"], stats["dropped_bytes"]) == (1, 4)
+
+
+def test_keep_last_evicts_oldest():
+    retention = EventRetention("keep_last", max_bytes=10)
+    for name in "abcd":
+        retention.add(name, 4)
+    assert retention.events == ["c", "d"]
+    assert retention.retained_bytes == 8
+    assert (retention.dropped_events, retention.dropped_bytes) == (2, 8)
+    # 单个超出预算的事件不会清空缓冲区
+    assert not retention.add("huge", 100)
+    assert retention.events == ["c", "d"]
+
+
+def test_key_events_only():
+    retention = EventRetention("key_events", max_bytes=100, is_key_event=lambda e: e.startswith("key"))
+    for name in ("message", "key_end", "message", "key_finished"):
+        retention.add(name, 10)
+    assert retention.events == ["key_end", "key_finished"]
+    assert retention.dropped_events == 2
+
+
+def test_clear_resets_stats():
+    retention = EventRetention("keep_first", max_bytes=1)
+    retention.add("a", 5)
+    retention.clear()
+    assert len(retention) == 0
+    assert retention.stats()["dropped_events"] == 0
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        EventRetention("keep_random")
+    with pytest.raises(ValueError):
+        EventRetention("key_events")
+
+
+if __name__ == '__main__':
+    test_keep_first_drops_later_events()
+    test_keep_last_evicts_oldest()
+    test_key_events_only()
+    test_clear_resets_stats()
+    print("测试完成！")
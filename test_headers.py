@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+测试请求头参数解析：三个工具共用 utils/headers.py
+"""
+from utils.headers import parse_headers
+
+
+def test_parse_headers_cleans_unicode_whitespace():
+    """不间断空格、全角空格等Unicode空白字符替换为普通空格后再解析"""
+    assert parse_headers("") == {}
+    assert parse_headers('{\xa0"Authorization":　"Bearer k" }\n') == {"Authorization": "Bearer k"}
+    # 字符串值中的非空白Unicode字符保持不变
+    assert parse_headers('{"X-Name": "测试"}') == {"X-Name": "测试"}
+
+
+def test_parse_headers_rejects_invalid_json():
+    for value in ('{"a": ', '["a"]'):
+        try:
+            parse_headers(value)
+        except ValueError:
+            continue
+        raise AssertionError(value)
+
+
+if __name__ == '__main__':
+    test_parse_headers_cleans_unicode_whitespace()
+    test_parse_headers_rejects_invalid_json()
+    print("测试完成！")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+测试按主机的准入控制：并发上限、令牌桶、有界队列与排队超时，以及工具输出中的排队耗时
+"""
+import asyncio
+import os
+import threading
+import time
+
+from benchmarks.sse_standin_server import StreamSpec, make_server
+from conftest import metric_value, serve
+from tools.dify_chatflow_sse import DifyChatflowSSETool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils import host_limiter, metrics
+from utils.host_limiter import HostLimiter, HostLimitError, LimiterConfig, get_host_limiter, limiter_key
+
+
+def test_concurrency_cap_is_fifo_and_wakes_async_waiters():
+    """名额用尽时按到达顺序放行；其他线程释放名额可以唤醒事件循环中的等待者"""
+    limiter = HostLimiter("h:80", LimiterConfig(max_concurrent=1))
+    assert limiter.acquire() == 0.0
+    order = []
+
+    def waiter(name):
+        limiter.acquire()
+        order.append(name)
+        time.sleep(0.05)
+        limiter.release()
+
+    threads = [threading.Thread(target=waiter, args=(name,)) for name in ("a", "b", "c")]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    assert limiter.stats() == {"active": 1, "queued": 3}
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == ["a", "b", "c"]
+    assert limiter.stats() == {"active": 0, "queued": 0}
+
+    async def wait_async():
+        return await limiter.aacquire(2)
+
+    limiter.acquire()
+    threading.Timer(0.1, limiter.release).start()
+    waited = asyncio.run(wait_async())
+    assert 0.05 < waited < 1
+    limiter.release()
+
+
+def test_token_bucket_paces_new_requests():
+    """速率20个/秒、突发1个：5个请求至少间隔约0.2秒"""
+    limiter = HostLimiter("h:80", LimiterConfig(max_concurrent=0, rate=20, burst=1))
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release()
+    assert 0.18 < time.monotonic() - start < 1
+
+
+def test_queue_full_and_queue_timeout():
+    """队列已满时立即拒绝；排队超过 queue_timeout 时放弃，并计入拒绝指标"""
+    full = metric_value(metrics.LIMITER_REJECTIONS, "queue_full")
+    timed_out = metric_value(metrics.LIMITER_REJECTIONS, "queue_timeout")
+    limiter = HostLimiter("h:80", LimiterConfig(max_concurrent=1, max_queue=1, queue_timeout=0.2))
+    limiter.acquire()
+    errors = []
+    thread = threading.Thread(target=lambda: errors.append(_raises(limiter.acquire)))
+    thread.start()
+    time.sleep(0.05)
+    assert _raises(limiter.acquire).reason == "queue_full"
+    thread.join(2)
+    assert errors[0].reason == "queue_timeout"
+    assert limiter.stats() == {"active": 1, "queued": 0}
+    # 调用方传入的剩余时长短于 queue_timeout 时按剩余时长放弃
+    start = time.monotonic()
+    assert _raises(lambda: limiter.acquire(0.05)).reason == "queue_timeout"
+    assert time.monotonic() - start < 0.15
+    assert metric_value(metrics.LIMITER_REJECTIONS, "queue_full") == full + 1
+    assert metric_value(metrics.LIMITER_REJECTIONS, "queue_timeout") == timed_out + 2
+
+
+def _raises(func):
+    try:
+        func()
+    except HostLimitError as e:
+        return e
+    raise AssertionError("expected HostLimitError")
+
+
+def test_limiter_key_and_registry():
+    """默认按主机和端口共用限流器；by_auth 时按认证头区分且不保存明文"""
+    assert limiter_key("https://API.dify.ai/v1/chat-messages") == "api.dify.ai:443"
+    keyed = limiter_key("http://h/x", {"authorization": "Bearer secret"}, by_auth=True)
+    assert keyed.startswith("h:80#") and "secret" not in keyed
+    # 默认不启用限流
+    assert not LimiterConfig().enabled
+    os.environ.pop("SSE_LIMIT_MAX_CONCURRENT", None)
+    assert not LimiterConfig.from_env().enabled
+    host_limiter.configure(LimiterConfig(max_concurrent=0))
+    try:
+        assert get_host_limiter("http://h/x") is None
+        host_limiter.configure(LimiterConfig(max_concurrent=2))
+        assert get_host_limiter("http://h/a") is get_host_limiter("http://h:80/b")
+    finally:
+        host_limiter.configure(None)
+
+
+def _invoke_concurrently(tool_cls, count, **parameters):
+    results = []
+
+    def run():
+        messages = list(tool_cls.from_credentials({})._invoke(parameters))
+        results.append(next(m.message.json_object for m in messages if m.type.value == "json"))
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_tools_queue_behind_host_limit_both_engines():
+    """同一主机只允许1个流时，并发调用依次完成，排队耗时单独出现在 timing 中"""
+    # 每个流10个事件、每秒20个，约0.5秒
+    server, base = serve(make_server(spec=StreamSpec(events=10, size=30, rate=20)))
+    host_limiter.configure(LimiterConfig(max_concurrent=1))
+    try:
+        for engine, tool_cls, parameters in (
+                ("sync", DifySseNodePluginTool, {"url": base + "/events"}),
+                ("async", DifyChatflowSSETool, {"url": base + "/v1/chat-messages", "method": "POST",
+                                                "body": '{"query": "hi", "user": "u"}'})):
+            os.environ["SSE_ENGINE"] = engine
+            try:
+                results = _invoke_concurrently(tool_cls, 2, **parameters)
+            finally:
+                os.environ.pop("SSE_ENGINE", None)
+            assert [r["status"] for r in results] == ["completed", "completed"], engine
+            waits = sorted(r["timing"]["queue_wait_ms"] for r in results)
+            assert waits[0] < 100 and waits[1] > 300, (engine, waits)
+            # 排队时间不计入连接阶段
+            assert all(r["timing"]["time_to_headers_ms"] < 300 for r in results), engine
+    finally:
+        host_limiter.configure(None)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    test_concurrency_cap_is_fifo_and_wakes_async_waiters()
+    test_token_bucket_paces_new_requests()
+    test_queue_full_and_queue_timeout()
+    test_limiter_key_and_registry()
+    test_tools_queue_behind_host_limit_both_engines()
+    print("测试完成！")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+测试共享连接池的连接复用和环境代理
+"""
+import asyncio
+import os
+
+import httpx
+
+from conftest import SSEHandler, start_server
+from utils.http_pool import AsyncHTTPClientPool, HTTPClientPool, PoolConfig
+
+
+class _SSEHandler(SSEHandler):
+    """返回一个事件，带 Content-Length 以便连接复用"""
+
+    def do_GET(self):
+        body = b"data: hello\n\n"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ProxyHandler(_SSEHandler):
+    """记录收到的请求行：转发代理收到绝对URL，HTTPS请求先发 CONNECT（这里拒绝隧道）"""
+    seen = []
+
+    def do_GET(self):
+        self.seen.append(f"GET {self.path}")
+        super().do_GET()
+
+    def do_CONNECT(self):
+        self.seen.append(f"CONNECT {self.path}")
+        self.send_empty(502)
+
+
+def test_connection_reuse():
+    """同一主机的多次请求应复用同一个连接"""
+    server, base = start_server(_SSEHandler)
+    pool = HTTPClientPool(PoolConfig(max_connections=4, max_keepalive_connections=2))
+    url = base + "/stream"
+    try:
+        for _ in range(5):
+            with pool.stream("GET", url) as response:
+                assert response.status_code == 200
+                assert b"".join(response.iter_bytes()) == b"data: hello\n\n"
+
+        stats = pool.stats(url)
+        assert stats["requests"] == 5
+        assert stats["new_connections"] == 1
+        assert stats["hits"] == 4
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+def test_env_proxies_are_honoured():
+    """HTTP_PROXY/HTTPS_PROXY 的请求经代理发出，NO_PROXY 中的主机直连；同步和异步连接池一致"""
+    proxy, proxy_url = start_server(type("Handler", (_ProxyHandler,), {"seen": []}))
+    direct, _ = start_server(_SSEHandler)
+    names = ("HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY")
+    saved = {name: os.environ.get(name) for name in names}
+    os.environ["HTTP_PROXY"] = os.environ["HTTPS_PROXY"] = proxy_url
+    os.environ["NO_PROXY"] = "localhost"
+    seen = proxy.RequestHandlerClass.seen
+    direct_url = f"http://localhost:{direct.server_address[1]}/stream"
+    try:
+        pool = HTTPClientPool()
+        with pool.stream("GET", "http://upstream.test/stream") as response:
+            assert b"".join(response.iter_bytes()) == b"data: hello\n\n"
+        assert seen == ["GET http://upstream.test/stream"]
+        try:
+            with pool.stream("GET", "https://upstream.test/stream"):
+                raise AssertionError("expected ProxyError")
+        except httpx.ProxyError:
+            pass
+        assert seen[-1] == "CONNECT upstream.test:443"
+        with pool.stream("GET", direct_url) as response:
+            assert response.status_code == 200
+        assert len(seen) == 2
+        pool.close()
+
+        async def fetch_async():
+            async_pool = AsyncHTTPClientPool()
+            try:
+                async with async_pool.stream("GET", "http://upstream.test/async") as response:
+                    await response.aread()
+                async with async_pool.stream("GET", direct_url) as response:
+                    assert response.status_code == 200
+            finally:
+                await async_pool.aclose()
+
+        asyncio.run(fetch_async())
+        assert seen[2:] == ["GET http://upstream.test/async"]
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        proxy.shutdown()
+        direct.shutdown()
+
+
+if __name__ == '__main__':
+    test_connection_reuse()
+    test_env_proxies_are_honoured()
+    print("测试完成！")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试调用级时间预算：运行时上限截断用户参数，截止时间到达时返回部分结果，重试不超过剩余预算
+"""
+import json
+import time
+
+from conftest import SSEHandler, start_server
+from tools.dify_chatflow_sse import DifyChatflowSSETool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils import invocation_deadline
+from utils.invocation_deadline import MIN_ATTEMPT_TIMEOUT, InvocationDeadline
+
+
+class _Handler(SSEHandler):
+    """/slow 每0.1秒一个答案增量、持续约10秒；/flaky 首次请求发送2个事件后断开，之后返回503"""
+    flaky_served = False
+
+    def do_POST(self):
+        self.read_body()
+        if self.path.startswith("/flaky"):
+            self._flaky()
+        else:
+            self._slow()
+
+    do_GET = do_POST
+
+    def _slow(self):
+        self.start_stream()
+        try:
+            for i in range(100):
+                event = {"event": "message", "task_id": "t1", "answer": f"{i} "}
+                self._chunk(f"id: {i}\ndata: {json.dumps(event)}\n\n".encode())
+                time.sleep(0.1)
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _flaky(self):
+        if type(self).flaky_served:
+            self.send_empty(503)
+            return
+        type(self).flaky_served = True
+        self.start_stream()
+        for i in (1, 2):
+            self._chunk(f"id: {i}\ndata: {{\"n\": {i}}}\n\n".encode())
+        # 不发送结束块直接断开，客户端按暂时性故障重试
+        self.close_connection = True
+
+
+def _start_server():
+    return start_server(type("Handler", (_Handler,), {}))
+
+
+def _invoke_with_limit(tool_cls, limit, **parameters):
+    """把运行时上限临时调小，返回 (JSON结果, 变量, 耗时)"""
+    original = invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE
+    invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE = limit, 0.5
+    try:
+        start = time.monotonic()
+        messages = list(tool_cls.from_credentials({})._invoke(parameters))
+        elapsed = time.monotonic() - start
+    finally:
+        invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE = original
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    variables = {m.message.variable_name: m.message.variable_value for m in messages
+                 if m.type.value == "variable" and not m.message.stream}
+    return result, variables, elapsed
+
+
+def test_budget_from_runtime_limit_and_parameters():
+    """用户参数超过运行时上限时按上限截断；单次超时不超过剩余预算"""
+    capped = InvocationDeadline(600, runtime_limit=120, reserve=5)
+    assert capped.capped and capped.budget == 115
+    assert capped.attempt_timeout(300) <= 115
+    assert capped.attempt_timeout(30) == 30
+
+    short = InvocationDeadline(60, runtime_limit=120, reserve=5)
+    assert not short.capped and short.budget == 60
+
+    expired = InvocationDeadline(0.01, runtime_limit=120)
+    time.sleep(0.02)
+    assert expired.remaining() == 0
+    assert expired.attempt_timeout(30) == MIN_ATTEMPT_TIMEOUT
+    assert expired.to_dict()["remaining_s"] == 0
+
+
+def test_chatflow_returns_partial_answer_at_deadline():
+    """chatflow默认参数（timeout=300、max_duration=600）下，截止时间前返回已收到的部分答案"""
+    server, base = _start_server()
+    try:
+        result, variables, elapsed = _invoke_with_limit(
+            DifyChatflowSSETool, 2.0, url=base + "/slow/v1/chat-messages", method="POST",
+            body='{"query": "hi"}', timeout=300, max_duration=600)
+    finally:
+        server.shutdown()
+    assert result["status"] == "completed"
+    assert result["stop_reason"] == "deadline"
+    assert result["deadline"]["capped_by_runtime"] and result["deadline"]["budget_s"] == 1.5
+    assert result["total_events"] >= 5
+    assert variables["chatflow_answer"].startswith("0 1 2 ")
+    assert elapsed < 2.0
+
+
+def test_retries_share_the_budget_and_keep_partial_events():
+    """断线后的重试只使用剩余预算；放弃时返回之前收到的事件"""
+    server, base = _start_server()
+    try:
+        result, variables, elapsed = _invoke_with_limit(DifySseNodePluginTool, 3.0, url=base + "/flaky",
+                                                        max_duration=600)
+    finally:
+        server.shutdown()
+    assert result["status"] == "failed"
+    assert result["attempts"][-1]["give_up_reason"] == "budget_exhausted"
+    assert result["total_events"] == 2
+    assert [e["data"] for e in variables["events_stream"]] == [{"n": 1}, {"n": 2}]
+    assert elapsed < 3.0
+
+
+if __name__ == '__main__':
+    test_budget_from_runtime_limit_and_parameters()
+    test_chatflow_returns_partial_answer_at_deadline()
+    test_retries_share_the_budget_and_keep_partial_events()
+    print("测试完成！")
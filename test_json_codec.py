@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+测试JSON编解码后端的输出与标准库一致
+"""
+import json
+
+import pytest
+
+from utils import json_codec
+
+SAMPLES = [
+    {"event": "message", "answer": "你好，世界", "id": 1, "ratio": 0.5, "ok": True, "extra": None},
+    [1, "二", {"三": [4.25, False]}],
+    {"big": 2 ** 70},
+    {1: "非字符串键"},
+    # 非有限浮点数和需要指数写法的浮点数，输出必须与标准库逐字相同
+    {"nan": float("nan"), "inf": float("inf"), "-inf": float("-inf")},
+    [1e16, 1.5e-07, 1e+300, 123456789012345680.0],
+]
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgspec"])
+def test_backend_semantics(name):
+    """各后端的编码结果与 json.dumps(ensure_ascii=False, 紧凑分隔符) 一致"""
+    try:
+        json_codec.use_backend(name)
+        for sample in SAMPLES:
+            expected = json.dumps(sample, ensure_ascii=False, separators=(',', ':'))
+            assert json_codec.dumps(sample) == expected
+        for sample in SAMPLES[:2] + SAMPLES[-1:]:
+            expected = json.dumps(sample, ensure_ascii=False, separators=(',', ':'))
+            assert json_codec.dumps(json_codec.loads(expected)) == expected
+        # 标准库能接受的NaN字面量，快速后端也应能解码，并原样编码回去
+        assert json_codec.dumps(json_codec.loads('{"v":NaN}')) == '{"v":NaN}'
+        # 超出64位的整数保持精确，不被解码为浮点数
+        for text in ("18446744073709551616", b'{"n": -123456789012345678901234567890}'):
+            assert json_codec.loads(text) == json.loads(text)
+            assert json_codec.dumps(json_codec.loads(text)) == json.dumps(json.loads(text), separators=(',', ':'))
+        assert type(json_codec.loads("18446744073709551616")) is int
+        with pytest.raises(json_codec.JSONDecodeError):
+            json_codec.loads('{"broken": ')
+    finally:
+        json_codec.use_backend("auto")
+
+
+def test_lossy_backend_is_not_selected():
+    """把超出64位的整数解码为浮点数的后端不会被选用，即使显式指定"""
+    original = json_codec._BACKENDS["orjson"]
+    json_codec._BACKENDS["orjson"] = lambda: lambda s: json.loads(s, parse_int=float)
+    try:
+        assert json_codec.use_backend("orjson") == "json"
+        assert json_codec.use_backend("auto") in ("json", "msgspec")
+    finally:
+        json_codec._BACKENDS["orjson"] = original
+        json_codec.use_backend("auto")
+
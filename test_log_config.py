@@ -55,8 +55,66 @@ def test_provider_validation():
         except Exception as e:
             print(f"✗ 凭据验证失败: {e}")
 
+def test_log_level_cached():
+    """同一级别只配置一次，不修改根logger的处理器"""
+    from utils import log_config
+
+    plugin_logger = log_config.install_queue_handler(logging.getLogger('test_log_config.plugin'))
+    root_handlers = list(logging.getLogger().handlers)
+
+    assert log_config.configure_log_level('DEBUG')
+    assert plugin_logger.level == logging.DEBUG
+    assert not log_config.configure_log_level('debug')
+    assert log_config.configure_log_level('unknown')
+    assert plugin_logger.level == logging.INFO
+    assert logging.getLogger().handlers == root_handlers
+
+def test_logs_are_written_from_main_thread_by_plugin_handler():
+    """其他系统线程中的日志只入队，由主线程的写greenlet经 dify 的 plugin_logger_handler 写出"""
+    import gevent
+    from dify_plugin.config.logger_format import plugin_logger_handler
+    from utils import log_config, native
+
+    get_ident = native.original('_thread', 'get_ident')
+    writers = []
+
+    class RecordingStream:
+        def write(self, data):
+            writers.append((get_ident(), data))
+
+        def flush(self):
+            pass
+
+    plugin_logger = log_config.install_queue_handler(logging.getLogger('test_log_config.threads'))
+    plugin_logger.propagate = False
+    original_stream = plugin_logger_handler.setStream(RecordingStream())
+    try:
+        done = native.original('_thread', 'allocate_lock')()
+        done.acquire()
+
+        def log_from_native_thread():
+            plugin_logger.warning("from native thread")
+            done.release()
+
+        native.original('_thread', 'start_new_thread')(log_from_native_thread, ())
+        assert done.acquire(timeout=2)
+        plugin_logger.warning("from main thread")
+        for _ in range(50):
+            if len(writers) >= 2:
+                break
+            gevent.sleep(0.01)
+    finally:
+        plugin_logger_handler.setStream(original_stream)
+    messages = [data for _, data in writers if "thread" in data]
+    assert any("from native thread" in m for m in messages)
+    assert any("from main thread" in m for m in messages)
+    assert {ident for ident, _ in writers} == {get_ident()}
+
+
 if __name__ == '__main__':
     print("开始测试日志级别配置功能...")
     test_log_levels()
     test_provider_validation()
+    test_log_level_cached()
+    test_logs_are_written_from_main_thread_by_plugin_handler()
     print("\n测试完成！")
\ No newline at end of file
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+测试指标注册表：Prometheus文本格式、流与调用的指标汇总、文件导出和诊断工具
+"""
+import json
+import os
+import tempfile
+
+from conftest import SSEHandler, metric_value, start_server
+from tools.dify_chatflow_batch import DifyChatflowBatchTool
+from tools.dify_sse_fanout import DifySseFanoutTool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from tools.sse_metrics import SSEMetricsTool
+from utils import metrics, native
+from utils.metrics import MetricsRegistry
+
+
+class _Handler(SSEHandler):
+    """/missing 返回404，其他路径发送5个事件"""
+
+    def do_POST(self):
+        self.read_body()
+        self.do_GET()
+
+    def do_GET(self):
+        if self.path.startswith("/missing"):
+            self.send_empty(404)
+            return
+        body = b"".join(b"id: %d\ndata: {\"n\": %d}\n\n" % (i, i) for i in range(1, 6))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_prometheus_text_format():
+    """计数器、仪表和直方图按 Prometheus 文本格式输出，标签值转义"""
+    registry = MetricsRegistry()
+    requests = registry.counter("demo_requests_total", "Requests", ("status",))
+    active = registry.gauge("demo_active", "Active streams")
+    latency = registry.histogram("demo_latency_seconds", "Latency", buckets=(0.1, 1))
+    requests.labels("ok").inc()
+    requests.labels("ok").inc(2)
+    requests.labels('bad "x"').inc()
+    active.labels().inc(3)
+    active.labels().dec()
+    latency.labels().observe(0.05)
+    latency.labels().observe_many([0.5, 5])
+
+    text = registry.render()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert "# TYPE demo_requests_total counter" in lines
+    assert 'demo_requests_total{status="ok"} 3' in lines
+    assert 'demo_requests_total{status="bad \\"x\\""} 1' in lines
+    assert "demo_active 2" in lines
+    assert 'demo_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'demo_latency_seconds_bucket{le="1"} 2' in lines
+    assert 'demo_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "demo_latency_seconds_sum 5.55" in lines
+    assert "demo_latency_seconds_count 3" in lines
+    assert registry.snapshot()["demo_latency_seconds"]["samples"][0]["buckets"] == {"0.1": 1, "1": 1, "+Inf": 1}
+
+    try:
+        requests.labels("ok", "extra")
+        assert False, "标签数量不一致时应报错"
+    except ValueError:
+        pass
+
+
+def test_render_while_other_thread_adds_labels():
+    """引擎线程新增标签的同时导出：子项在锁内复制，导出不受影响"""
+    registry = MetricsRegistry()
+    requests = registry.counter("demo_hosts_total", "Requests", ("host",))
+    done = native.original('_thread', 'allocate_lock')()
+    done.acquire()
+
+    def add_labels():
+        for i in range(2000):
+            requests.labels(f"h{i}").inc()
+        done.release()
+
+    native.original('_thread', 'start_new_thread')(add_labels, ())
+    while not done.acquire(False):
+        registry.render()
+        registry.snapshot()
+    assert len(registry.snapshot()["demo_hosts_total"]["samples"]) == 2000
+    assert 'demo_hosts_total{host="h1999"} 1' in registry.render().splitlines()
+
+
+def test_invocations_record_stream_and_retry_metrics():
+    """成功调用汇总事件数和字节数，404失败按错误分类和放弃原因计数"""
+    server, base = start_server(_Handler)
+    tool_name = "dify_sse_node_plugin"
+    before = {
+        "events": metric_value(metrics.EVENTS, "generic"),
+        "bytes": metric_value(metrics.BYTES, "generic"),
+        "completed": metric_value(metrics.INVOCATIONS, tool_name, "completed"),
+        "failed": metric_value(metrics.INVOCATIONS, tool_name, "failed"),
+        "fatal_404": metric_value(metrics.ERRORS, tool_name, "fatal", 404),
+        "give_up": metric_value(metrics.GIVE_UPS, tool_name, "non_retryable"),
+        "closed": metric_value(metrics.STREAMS, "generic", "server_closed"),
+        "ttfe": metric_value(metrics.TTFE_SECONDS, "generic"),
+        "gaps": metric_value(metrics.GAP_SECONDS, "generic"),
+    }
+    try:
+        tool = DifySseNodePluginTool.from_credentials({})
+        list(tool._invoke({"url": base + "/events"}))
+        list(tool._invoke({"url": base + "/missing"}))
+    finally:
+        server.shutdown()
+
+    assert metric_value(metrics.EVENTS, "generic") - before["events"] == 5
+    assert metric_value(metrics.BYTES, "generic") - before["bytes"] > 0
+    assert metric_value(metrics.INVOCATIONS, tool_name, "completed") - before["completed"] == 1
+    assert metric_value(metrics.INVOCATIONS, tool_name, "failed") - before["failed"] == 1
+    assert metric_value(metrics.ERRORS, tool_name, "fatal", 404) - before["fatal_404"] == 1
+    assert metric_value(metrics.GIVE_UPS, tool_name, "non_retryable") - before["give_up"] == 1
+    assert metric_value(metrics.STREAMS, "generic", "server_closed") - before["closed"] == 1
+    assert metric_value(metrics.TTFE_SECONDS, "generic") - before["ttfe"] == 1
+    assert metric_value(metrics.GAP_SECONDS, "generic") - before["gaps"] == 4
+    assert metric_value(metrics.STREAMS_ACTIVE, "generic") == 0
+
+
+def test_fanout_and_batch_record_invocation_metrics():
+    """多源监听和批量查询每次调用计一次，并汇总每个源、每个查询的尝试和错误"""
+    server, base = start_server(_Handler)
+    fanout, batch = "dify_sse_fanout", "dify_chatflow_batch"
+    before = {
+        "fanout_partial": metric_value(metrics.INVOCATIONS, fanout, "partial"),
+        "fanout_success": metric_value(metrics.ATTEMPTS, fanout, "success"),
+        "fanout_404": metric_value(metrics.ERRORS, fanout, "fatal", 404),
+        "batch_failed": metric_value(metrics.INVOCATIONS, batch, "failed"),
+        "batch_404": metric_value(metrics.ERRORS, batch, "fatal", 404),
+        "batch_give_up": metric_value(metrics.GIVE_UPS, batch, "non_retryable"),
+        "batch_error": metric_value(metrics.INVOCATIONS, batch, "error"),
+    }
+    try:
+        sources = json.dumps([base + "/events", base + "/missing"])
+        list(DifySseFanoutTool.from_credentials({})._invoke({"sources": sources}))
+        tool = DifyChatflowBatchTool.from_credentials({})
+        list(tool._invoke({"url": base + "/missing", "queries": '["a", "b"]'}))
+        list(tool._invoke({"url": "ftp://invalid", "queries": '["a"]'}))
+    finally:
+        server.shutdown()
+
+    assert metric_value(metrics.INVOCATIONS, fanout, "partial") - before["fanout_partial"] == 1
+    assert metric_value(metrics.ATTEMPTS, fanout, "success") - before["fanout_success"] == 1
+    assert metric_value(metrics.ERRORS, fanout, "fatal", 404) - before["fanout_404"] == 1
+    assert metric_value(metrics.INVOCATIONS, batch, "failed") - before["batch_failed"] == 1
+    assert metric_value(metrics.ERRORS, batch, "fatal", 404) - before["batch_404"] == 2
+    assert metric_value(metrics.GIVE_UPS, batch, "non_retryable") - before["batch_give_up"] == 2
+    assert metric_value(metrics.INVOCATIONS, batch, "error") - before["batch_error"] == 1
+
+
+def test_file_export_and_diagnostics_tool():
+    """配置SSE_METRICS_FILE时原子写出；诊断工具返回同样的文本"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sse.prom")
+        os.environ["SSE_METRICS_FILE"] = path
+        try:
+            messages = list(SSEMetricsTool.from_credentials({})._invoke({}))
+        finally:
+            os.environ.pop("SSE_METRICS_FILE", None)
+        with open(path, encoding="utf-8") as f:
+            exported = f.read()
+        assert os.listdir(tmp) == ["sse.prom"]
+
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    text = next(m.message.variable_value for m in messages if m.type.value == "variable")
+    assert result["status"] == "completed" and result["metrics_file"] == path
+    assert "# TYPE sse_events_total counter" in text
+    assert "sse_invocations_total" in result["metrics"]
+    assert exported.startswith("# HELP sse_invocations_total")
+    # 不配置文件时不写出
+    assert metrics.REGISTRY.maybe_dump(force=True) is None
+
+
+if __name__ == '__main__':
+    test_prometheus_text_format()
+    test_render_while_other_thread_adds_labels()
+    test_invocations_record_stream_and_retry_metrics()
+    test_fanout_and_batch_record_invocation_metrics()
+    test_file_export_and_diagnostics_tool()
+    print("测试完成！")
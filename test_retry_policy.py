@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试重试策略的错误分类、退避与时间预算
+"""
+import httpx
+import pytest
+
+from utils.retry_policy import RetryPolicy, SSEHTTPStatusError, classify_error, parse_retry_after
+
+
+def _wrapped(cause):
+    """模拟客户端对httpx异常的包装"""
+    try:
+        raise Exception("SSE连接错误") from cause
+    except Exception as e:
+        return e
+
+
+@pytest.mark.parametrize("error, expected", [
+    (SSEHTTPStatusError("503", 503), "transient"),
+    (SSEHTTPStatusError("429", 429, retry_after=1.0), "transient"),
+    (SSEHTTPStatusError("429", 429), "fatal"),
+    (SSEHTTPStatusError("404", 404), "fatal"),
+    (ValueError("Invalid JSON format in body"), "fatal"),
+    (_wrapped(httpx.ConnectError("refused")), "transient"),
+    (_wrapped(httpx.ReadTimeout("timeout")), "transient"),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_fatal_error_is_not_retried():
+    policy = RetryPolicy()
+    policy.begin_attempt()
+    assert policy.record_failure(ValueError("bad body")) is None
+    assert policy.attempts[-1]["give_up_reason"] == "non_retryable"
+
+
+def test_backoff_uses_server_retry_hint():
+    """服务端retry:字段作为退避基数，并带抖动指数增长"""
+    policy = RetryPolicy(max_delay=100)
+    policy.server_retry_ms = 4000
+    for attempt in range(3):
+        ceiling = 4 * 2 ** attempt
+        assert ceiling / 2 <= policy.backoff(attempt) <= ceiling
+
+
+def test_retry_after_and_budget():
+    policy = RetryPolicy(total_budget=5)
+    policy.begin_attempt()
+    assert policy.record_failure(SSEHTTPStatusError("429", 429, retry_after=2)) == 2
+    policy.begin_attempt()
+    assert policy.record_failure(SSEHTTPStatusError("429", 429, retry_after=60)) is None
+    assert policy.attempts[-1]["give_up_reason"] == "budget_exhausted"
+    assert [a["attempt"] for a in policy.attempts] == [1, 2]
+
+
+def test_max_attempts():
+    policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+    error = SSEHTTPStatusError("502", 502)
+    assert policy.record_failure(error) is not None
+    assert policy.record_failure(error) is None
+    assert policy.attempts[-1]["give_up_reason"] == "max_attempts"
+
+
+if __name__ == '__main__':
+    test_parse_retry_after()
+    test_fatal_error_is_not_retried()
+    test_backoff_uses_server_retry_hint()
+    test_retry_after_and_budget()
+    test_max_attempts()
+    print("测试完成！")
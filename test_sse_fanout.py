@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+测试多源SSE监听：并发、按时间合并、各源限制与失败相互隔离
+"""
+import json
+import time
+
+from conftest import SSEHandler, start_server
+from tools.dify_sse_fanout import DifySseFanoutTool
+from utils import invocation_deadline
+
+SLOW_DELAY = 0.4
+
+
+class _SourcesHandler(SSEHandler):
+    """/slow/<名称> 每隔SLOW_DELAY秒发送一个事件，共3个；/many 连续发送10个事件；/stall 发送1个事件后停滞；/missing 返回404"""
+
+    def do_GET(self):
+        if self.path.startswith("/missing"):
+            self.send_empty(404)
+            return
+        self.start_stream()
+        if self.path.startswith("/slow/"):
+            name = self.path.rsplit("/", 1)[1]
+            for i in range(1, 4):
+                time.sleep(SLOW_DELAY)
+                self._chunk(b'id: %d\ndata: {"source": "%s", "n": %d}\n\n' % (i, name.encode(), i))
+        elif self.path.startswith("/stall"):
+            self._chunk(b'id: 1\ndata: {"source": "stall", "n": 1}\n\n')
+            time.sleep(SLOW_DELAY * 5)
+            try:
+                self._chunk(b"")
+            except OSError:
+                pass  # 客户端已因空闲超时断开
+            return
+        else:
+            for i in range(1, 11):
+                self._chunk(b'id: %d\ndata: {"source": "many", "n": %d}\n\n' % (i, i))
+        self._chunk(b"")
+
+
+def _invoke(parameters):
+    server, base = start_server(_SourcesHandler)
+    sources = [item if isinstance(item, str) else dict(item) for item in parameters["sources"]]
+    for i, item in enumerate(sources):
+        if isinstance(item, str):
+            sources[i] = base + item
+        else:
+            item["url"] = base + item["url"]
+    try:
+        tool = DifySseFanoutTool.from_credentials({})
+        start = time.time()
+        messages = list(tool._invoke({**parameters, "sources": json.dumps(sources)}))
+        elapsed = time.time() - start
+    finally:
+        server.shutdown()
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    variables = {m.message.variable_name: m.message.variable_value for m in messages
+                 if m.type.value == "variable" and not m.message.stream}
+    return result, variables, elapsed
+
+
+def test_streams_run_concurrently_and_merge_by_time():
+    """两个慢源并发监听，总耗时接近最慢的源；事件按接收时间交错合并并标注来源"""
+    result, variables, elapsed = _invoke({"sources": ["/slow/a", "/slow/b"]})
+    assert result["status"] == "completed"
+    assert elapsed < SLOW_DELAY * 3 * 1.8
+    events = variables["events_stream"]
+    assert [e["event_number"] for e in events] == list(range(1, 7))
+    assert sorted(e["source"] for e in events) == [0, 0, 0, 1, 1, 1]
+    # 两个源的事件交错出现，而不是一个源结束后才是另一个源
+    assert {events[0]["source"], events[1]["source"]} == {0, 1}
+    assert all(e["data"]["source"] == "ab"[e["source"]] for e in events)
+    assert [e["source_event_number"] for e in events if e["source"] == 1] == [1, 2, 3]
+
+
+def test_limits_and_failures_are_isolated():
+    """一个源达到自己的事件数上限、一个源失败，其余源不受影响"""
+    result, variables, _ = _invoke({"sources": [
+        {"url": "/many", "max_events": 3},
+        "/missing",
+        "/slow/c",
+    ]})
+    assert result["status"] == "partial"
+    many, missing, slow = variables["sources"]
+    assert (many["status"], many["total_events"], many["stop_reason"]) == ("completed", 3, "max_events")
+    assert missing["status"] == "failed" and "404" in missing["error"]
+    assert missing["attempts"][-1]["give_up_reason"] == "non_retryable"
+    assert (slow["status"], slow["total_events"], slow["stop_reason"]) == ("completed", 3, "server_closed")
+    assert variables["total_events"] == 6
+
+
+def test_sources_share_invocation_deadline():
+    """所有源共享调用截止时间：运行时上限先到时各源返回已收到的事件，stop_reason 为 deadline"""
+    original = invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE
+    # 预算1秒，慢源需要约1.2秒
+    invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE = 1.5, 0.5
+    try:
+        result, variables, elapsed = _invoke({"sources": ["/slow/a", "/slow/b"], "max_duration": 300})
+    finally:
+        invocation_deadline.MAX_REQUEST_TIMEOUT, invocation_deadline.OUTPUT_RESERVE = original
+    assert elapsed < 1.4
+    assert result["deadline"]["budget_s"] == 1.0 and result["deadline"]["capped_by_runtime"]
+    assert [(s["status"], s["stop_reason"], s["total_events"]) for s in variables["sources"]] == \
+        [("completed", "deadline", 2)] * 2
+
+
+def test_stalled_source_ends_at_idle_timeout():
+    """一个源停滞时由空闲超时单独结束，返回已收到的事件，其他源照常完成"""
+    result, variables, elapsed = _invoke({"sources": ["/stall", "/slow/d"], "idle_timeout": SLOW_DELAY * 1.5})
+    assert result["status"] == "completed"
+    stall, slow = variables["sources"]
+    assert (stall["stop_reason"], stall["total_events"]) == ("idle_timeout", 1)
+    assert (slow["stop_reason"], slow["total_events"]) == ("server_closed", 3)
+    assert elapsed < SLOW_DELAY * 4.5
+
+
+def test_invalid_sources():
+    """源列表为空或URL无效时返回错误"""
+    tool = DifySseFanoutTool.from_credentials({})
+    for sources in ("", '["ftp://example.com"]'):
+        messages = list(tool._invoke({"sources": sources}))
+        result = next(m.message.json_object for m in messages if m.type.value == "json")
+        assert result["status"] == "error"
+
+
+if __name__ == '__main__':
+    test_streams_run_concurrently_and_merge_by_time()
+    test_limits_and_failures_are_isolated()
+    test_sources_share_invocation_deadline()
+    test_stalled_source_ends_at_idle_timeout()
+    test_invalid_sources()
+    print("测试完成！")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+测试字节级增量SSE解析器
+"""
+from tools.dify_chatflow_sse import DifyChatflowSSEClient
+from tools.dify_sse_node_plugin import SSEClient
+from utils import json_codec
+from utils.sse_parser import SSEFrameParser
+
+
+def _parse_all(chunks):
+    parser = SSEFrameParser()
+    frames = []
+    for chunk in chunks:
+        frames.extend(parser.feed(chunk))
+    frames.extend(parser.flush())
+    return frames
+
+
+def test_line_endings():
+    """\\n、\\r\\n、\\r三种换行都应被识别"""
+    for sep in (b"\n", b"\r\n", b"\r"):
+        stream = b"event: message" + sep + b"data: a" + sep + b"data: b" + sep + sep + b"data: c" + sep + sep
+        frames = _parse_all([stream])
+        assert [f.data for f in frames] == ["a\nb", "c"]
+        assert frames[0].event_type == "message"
+
+
+def test_split_chunks():
+    """帧和CRLF被任意切分到多个数据块时结果不变"""
+    stream = "id: 7\r\ndata: {\"answer\": \"你好\"}\r\n\r\n: ping\r\ndata: done\r\n\r\n".encode("utf-8")
+    expected = [(f.event_id, f.data) for f in _parse_all([stream])]
+    assert expected == [("7", "{\"answer\": \"你好\"}"), ("", "done")]
+    for size in (1, 2, 3, 5):
+        chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+        assert [(f.event_id, f.data) for f in _parse_all(chunks)] == expected
+
+
+def test_field_semantics():
+    """只去掉冒号后的一个空格，注释行忽略，自定义字段保留"""
+    stream = b"\xef\xbb\xbfdata:  indented\n: comment\nretry: 3000\nretry: bad\nx-trace: 1\nx-trace: 2\n\n"
+    frames = _parse_all([stream])
+    assert len(frames) == 1
+    assert frames[0].data == " indented"
+    assert frames[0].retry == 3000
+    assert frames[0].fields == {"x-trace": ["1", "2"]}
+
+
+def test_unterminated_last_frame():
+    """流结束时没有空行的最后一帧也应返回"""
+    frames = _parse_all([b"data: first\n\ndata: last"])
+    assert [f.data for f in frames] == ["first", "last"]
+
+
+def test_json_event_keeps_received_text(monkeypatch):
+    """JSON载荷只解码一次，字符串形式直接使用收到的文本，不再重新序列化；合并自定义字段时才序列化"""
+    def fail(obj):
+        raise AssertionError("不应重新序列化")
+
+    for client in (SSEClient("http://h/"), DifyChatflowSSEClient("http://h/")):
+        monkeypatch.setattr(json_codec, "dumps", fail)
+        event = client.parse_sse_event(['data: {"answer": "你好", "n": 1}'])
+        assert event.parsed == {"answer": "你好", "n": 1}
+        assert event.data == '{"answer": "你好", "n": 1}'
+        monkeypatch.undo()
+        event = client.parse_sse_event(['data: {"n": 1}', 'x-trace: t1'])
+        assert event.data == '{"n":1,"_custom_fields":{"x-trace":"t1"}}'
+
+
+if __name__ == '__main__':
+    test_line_endings()
+    test_split_chunks()
+    test_field_semantics()
+    test_unterminated_last_frame()
+    print("测试完成！")
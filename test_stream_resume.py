@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试断线续传（Last-Event-ID）与事件去重
+"""
+import socket
+
+from conftest import SSEHandler, start_server
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils.stream_resume import ResumeState
+
+def _events(count):
+    return [b"id: %d\ndata: {\"n\": %d}\n\n" % (i, i) for i in range(1, count + 1)]
+
+
+EVENTS = _events(4)
+
+
+class _ResumableHandler(SSEHandler):
+    """首次请求发送 cut 个事件后断开；携带Last-Event-ID的请求从断点继续（honor_resume=False时从头重放）"""
+    honor_resume = True
+    events = EVENTS
+    cut = 2
+    last_event_ids = []
+
+    def do_GET(self):
+        last_id = self.headers.get("Last-Event-ID")
+        self.last_event_ids.append(last_id)
+        self.start_stream()
+        if last_id is None:
+            for event in self.events[:self.cut]:
+                self._chunk(event)
+            # 未发送结束块直接断开，模拟中途断线
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        start = int(last_id) if self.honor_resume else 0
+        for event in self.events[start:]:
+            self._chunk(event)
+        self._chunk(b"")
+
+
+def _invoke(monkeypatch, honor_resume, events=EVENTS, cut=2, **parameters):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    handler = type("Handler", (_ResumableHandler,), {"honor_resume": honor_resume, "events": events, "cut": cut,
+                                                     "last_event_ids": []})
+    server, base = start_server(handler)
+    try:
+        tool = DifySseNodePluginTool.from_credentials({})
+        url = base + "/stream"
+        messages = list(tool._invoke({"url": url, "method": "GET", **parameters}))
+    finally:
+        server.shutdown()
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    events = next(m.message.variable_value for m in messages
+                  if m.type.value == "variable" and m.message.variable_name == "events_stream")
+    return result, events, handler.last_event_ids
+
+
+def test_resume_from_last_event_id(monkeypatch):
+    """重连时携带Last-Event-ID，断点之后的事件计为续传恢复"""
+    result, events, last_event_ids = _invoke(monkeypatch, honor_resume=True)
+    assert last_event_ids == [None, "2"]
+    assert [e["event_id"] for e in events] == ["1", "2", "3", "4"]
+    assert [e["event_number"] for e in events] == [1, 2, 3, 4]
+    assert result["resume"]["recovered_events"] == 2
+    assert result["resume"]["duplicate_events"] == 0
+
+
+def test_full_replay_is_deduplicated(monkeypatch):
+    """服务端忽略Last-Event-ID从头重放时，按事件ID去重"""
+    result, events, _ = _invoke(monkeypatch, honor_resume=False)
+    assert [e["event_id"] for e in events] == ["1", "2", "3", "4"]
+    assert result["resume"]["duplicate_events"] == 2
+    assert result["resume"]["recovered_events"] == 2
+
+
+def test_replayed_duplicates_do_not_count_against_max_events(monkeypatch):
+    """从头重放的重复事件在客户端丢弃，不占用剩余的事件数额度"""
+    result, events, _ = _invoke(monkeypatch, honor_resume=False, max_events=4)
+    assert [e["event_id"] for e in events] == ["1", "2", "3", "4"]
+    assert result["resume"]["duplicate_events"] == 2
+    assert result["stop_reason"] == "max_events"
+
+
+def test_long_replay_is_fully_deduplicated(monkeypatch):
+    """重放范围超过1024个事件时仍能识别全部重复事件"""
+    result, events, _ = _invoke(monkeypatch, honor_resume=False, events=_events(1500), cut=1200, max_events=2000)
+    assert [e["event_number"] for e in events] == list(range(1, 1501))
+    assert [e["event_id"] for e in events[:3]] == ["1", "2", "3"]
+    assert result["total_events"] == 1500
+    assert result["resume"]["duplicate_events"] == 1200
+
+
+def test_without_ids_falls_back_to_replay():
+    """没有事件ID时无法续传，重试计为整体重放"""
+    state = ResumeState()
+    assert state.begin_attempt(0) is None
+    assert state.accept("")
+    assert state.begin_attempt(1) is None
+    assert state.full_replays == 1
+
+
+def test_seen_ids_are_bounded():
+    """去重集合有上限，最早的事件ID被淘汰"""
+    state = ResumeState(max_ids=2)
+    for event_id in ("a", "b", "c"):
+        assert state.accept(event_id)
+    assert state.accept("a")
+    assert not state.accept("c")
+    assert state.last_event_id == "a"
+
+
+if __name__ == '__main__':
+    test_without_ids_falls_back_to_replay()
+    test_seen_ids_are_bounded()
+    print("测试完成！")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+测试分阶段耗时：连接与复用、等待响应头、首事件、事件间隔，两个工具和两种引擎
+"""
+import json
+import os
+import time
+
+from conftest import SSEHandler, start_server
+from tools.dify_chatflow_sse import DifyChatflowSSETool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils.stream_timing import StreamTiming
+
+HEADERS_DELAY = 0.15
+EVENT_GAP = 0.05
+
+
+class _SlowHandler(SSEHandler):
+    """HEADERS_DELAY秒后返回响应头，然后每隔EVENT_GAP秒发送一个chatflow事件，共4个；/missing 返回404"""
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self.read_body()
+        self._handle()
+
+    def _handle(self):
+        time.sleep(HEADERS_DELAY)
+        if self.path.startswith("/missing"):
+            self.send_empty(404)
+            return
+        self.start_stream()
+        events = [{"event": "message", "task_id": "t1", "answer": "a"},
+                  {"event": "message", "task_id": "t1", "answer": "b"},
+                  {"event": "workflow_finished", "task_id": "t1", "data": {"outputs": {"answer": "ab"}}},
+                  {"event": "message_end", "task_id": "t1"}]
+        for i, event in enumerate(events):
+            if i:
+                time.sleep(EVENT_GAP)
+            self._chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+        self._chunk(b"")
+
+
+def _invoke(tool_cls, url, **parameters):
+    messages = list(tool_cls.from_credentials({})._invoke({"url": url, "method": "POST", "body": '{"query": "hi"}',
+                                                            **parameters}))
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    variables = {m.message.variable_name: m.message.variable_value for m in messages
+                 if m.type.value == "variable" and not m.message.stream}
+    return result, variables
+
+
+def _check_timing(timing, reused):
+    assert timing["connection_reused"] is reused
+    assert (timing["connect_ms"] is None) is reused
+    assert timing["server_wait_ms"] >= HEADERS_DELAY * 1000 * 0.9
+    assert timing["time_to_headers_ms"] >= timing["server_wait_ms"]
+    assert timing["time_to_headers_ms"] <= timing["time_to_first_byte_ms"] <= timing["time_to_first_event_ms"]
+    assert timing["total_ms"] >= timing["setup_ms"] + timing["time_to_first_event_ms"]
+    assert timing["events"] == 4
+    gaps = timing["gaps_ms"]
+    assert gaps["count"] == 3
+    assert EVENT_GAP * 1000 * 0.8 <= gaps["min"] <= gaps["p95"] <= gaps["max"] < EVENT_GAP * 1000 * 4
+    # 事件之间的时间在等待网络数据；异步引擎中把事件交给调用方线程的耗时计入consumer_ms
+    assert timing["network_wait_ms"] + timing["consumer_ms"] >= 3 * EVENT_GAP * 1000 * 0.8
+    assert timing["stream_ms"] >= gaps["min"] * 3
+
+
+def test_generic_tool_timing_and_reuse():
+    """首次调用新建连接，第二次复用连接时没有连接耗时"""
+    server, base = start_server(_SlowHandler)
+    try:
+        first, variables = _invoke(DifySseNodePluginTool, base + "/first")
+        second, _ = _invoke(DifySseNodePluginTool, base + "/second")
+    finally:
+        server.shutdown()
+    assert first["timing"] == variables["timing"]
+    _check_timing(first["timing"], reused=False)
+    _check_timing(second["timing"], reused=True)
+
+
+def test_chatflow_tool_timing_with_both_engines():
+    """chatflow工具在同步和异步引擎下都输出分阶段耗时"""
+    server, base = start_server(_SlowHandler)
+    try:
+        for engine in ("sync", "async"):
+            os.environ["SSE_ENGINE"] = engine
+            try:
+                result, variables = _invoke(DifyChatflowSSETool, f"{base}/{engine}/v1/chat-messages")
+            finally:
+                os.environ.pop("SSE_ENGINE", None)
+            assert result["chatflow_answer"] == "ab"
+            assert variables["timing"] == result["timing"]
+            _check_timing(result["timing"], reused=False)
+    finally:
+        server.shutdown()
+
+
+def test_failed_request_reports_timing():
+    """失败时返回最后一次尝试的耗时，可以看出时间花在等待响应上"""
+    server, base = start_server(_SlowHandler)
+    try:
+        result, variables = _invoke(DifySseNodePluginTool, base + "/missing")
+    finally:
+        server.shutdown()
+    assert result["status"] == "failed"
+    timing = variables["timing"]
+    assert timing["server_wait_ms"] >= HEADERS_DELAY * 1000 * 0.9
+    assert timing["time_to_first_event_ms"] is None and timing["events"] == 0
+    assert timing["gaps_ms"]["count"] == 0
+
+
+def test_consumer_time_is_separated_from_parsing():
+    """调用方处理事件的耗时计入consumer_ms，不计入解析和网络等待"""
+    from tools.dify_sse_node_plugin import SSEClient
+    from utils.debug_log import DebugLog
+    from utils.sse_parser import SSEFrameParser
+    import logging
+
+    client = SSEClient("http://localhost/")
+    client._begin_listen(100)
+    assert isinstance(client.timing, StreamTiming)
+    parser = SSEFrameParser()
+    for _ in client._events_from_chunk(parser, b"data: 1\n\ndata: 2\n\n", DebugLog(logging.getLogger("test"))):
+        time.sleep(0.02)
+    timing = client.timing.to_dict()
+    assert timing["consumer_ms"] >= 35
+    assert timing["parse_ms"] < 10
+    assert timing["events"] == 2 and timing["gaps_ms"]["count"] == 1
+
+
+if __name__ == '__main__':
+    test_generic_tool_timing_and_reuse()
+    test_chatflow_tool_timing_with_both_engines()
+    test_failed_request_reports_timing()
+    test_consumer_time_is_separated_from_parsing()
+    print("测试完成！")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+测试停滞看门狗：上游不发数据时按空闲超时和截止时间及时结束，涓流上游不超过最大时长
+"""
+import json
+import os
+import time
+
+from conftest import SSEHandler, start_server
+from tools.dify_chatflow_sse import DifyChatflowSSETool
+from tools.dify_sse_node_plugin import DifySseNodePluginTool
+from utils.stream_watchdog import IDLE_TIMEOUT, MAX_DURATION, StreamWatchdog
+
+
+class _StallHandler(SSEHandler):
+    """/silent 发送一个事件后不再发送数据；/trickle 每0.1秒发送一个心跳注释，都持续约5秒"""
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self.read_body()
+        self._handle()
+
+    def _handle(self):
+        self.start_stream()
+        event = {"event": "message", "task_id": "t1", "answer": "partial"}
+        try:
+            self._chunk(b"id: 1\ndata: " + json.dumps(event).encode() + b"\n\n")
+            for _ in range(50):
+                time.sleep(0.1)
+                if "trickle" in self.path:
+                    self._chunk(b": ping\n")
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def _invoke(tool_cls, url, **parameters):
+    start = time.monotonic()
+    messages = list(tool_cls.from_credentials({})._invoke({"url": url, "timeout": 30, **parameters}))
+    elapsed = time.monotonic() - start
+    result = next(m.message.json_object for m in messages if m.type.value == "json")
+    return result, elapsed
+
+
+def test_watchdog_conditions():
+    """截止时间优先于空闲超时；取消后不再触发"""
+    watchdog = StreamWatchdog(max_duration=10, idle_timeout=0.05)
+    assert watchdog.check() is None
+    assert watchdog.check(watchdog.last_activity + 0.06) == IDLE_TIMEOUT
+    assert watchdog.check(watchdog.deadline) == MAX_DURATION
+    assert "空闲" in watchdog.describe(IDLE_TIMEOUT)
+    assert StreamWatchdog(max_duration=10).check(time.monotonic() + 5) is None
+
+    watchdog.cancel()
+    assert watchdog._tick() is None and watchdog.fired is None
+
+
+def test_silent_upstream_idle_timeout_both_engines():
+    """上游连上后不发数据：空闲超时后关闭连接，返回已收到的事件"""
+    server, base = start_server(_StallHandler)
+    try:
+        result, elapsed = _invoke(DifySseNodePluginTool, base + "/silent", idle_timeout=0.3)
+        assert result["status"] == "completed"
+        assert result["stop_reason"] == "idle_timeout"
+        assert result["total_events"] == 1
+        assert elapsed < 2
+
+        os.environ["SSE_ENGINE"] = "async"
+        try:
+            result, elapsed = _invoke(DifyChatflowSSETool, base + "/silent", method="POST", body='{"query": "hi"}',
+                                      idle_timeout=0.3)
+        finally:
+            os.environ.pop("SSE_ENGINE", None)
+        assert result["stop_reason"] == "idle_timeout"
+        assert elapsed < 2
+    finally:
+        server.shutdown()
+
+
+def test_silent_upstream_max_duration():
+    """不设置空闲超时时，上游不发数据也按最大时长结束，而不是等到读超时"""
+    server, base = start_server(_StallHandler)
+    try:
+        for engine in ("sync", "async"):
+            os.environ["SSE_ENGINE"] = engine
+            try:
+                result, elapsed = _invoke(DifySseNodePluginTool, f"{base}/silent/{engine}", max_duration=1)
+            finally:
+                os.environ.pop("SSE_ENGINE", None)
+            assert result["stop_reason"] == "max_duration", engine
+            assert result["total_events"] == 1
+            assert 0.9 < elapsed < 2.5, (engine, elapsed)
+    finally:
+        server.shutdown()
+
+
+def test_trickling_upstream_respects_max_duration():
+    """心跳持续到达时空闲超时不触发，最大时长照常生效"""
+    server, base = start_server(_StallHandler)
+    try:
+        result, elapsed = _invoke(DifySseNodePluginTool, base + "/trickle", max_duration=1, idle_timeout=0.5)
+    finally:
+        server.shutdown()
+    assert result["stop_reason"] == "max_duration"
+    assert 0.9 < elapsed < 2.5
+
+
+if __name__ == '__main__':
+    test_watchdog_conditions()
+    test_silent_upstream_idle_timeout_both_engines()
+    test_silent_upstream_max_duration()
+    test_trickling_upstream_respects_max_duration()
+    print("测试完成！")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试SSE流终止条件
+"""
+import pytest
+
+from tools.dify_sse_node_plugin import SSEEvent
+from utils.terminal_conditions import TerminalConditions
+
+
+def test_empty_conditions():
+    """未配置终止条件时为假值"""
+    assert not TerminalConditions.parse("")
+    assert not TerminalConditions.parse("   ")
+
+
+def test_match_each_type():
+    """event / data / json 三种条件分别匹配"""
+    conditions = TerminalConditions.parse(
+        '[{"type": "event", "value": "close"},'
+        ' {"type": "data", "value": "[DONE]"},'
+        ' {"type": "json", "field": "event", "value": "message_end"},'
+        ' {"type": "json", "field": "data.status", "value": "succeeded"}]'
+    )
+    assert conditions.match(SSEEvent("close", "", parsed="")) == "event=close"
+    assert conditions.match(SSEEvent("message", "[DONE]", parsed="[DONE]")) == "data=[DONE]"
+    assert conditions.match(SSEEvent("message", None, parsed={"event": "message_end"})) == "json:event=message_end"
+    assert conditions.match(SSEEvent("message", None, parsed={"data": {"status": "succeeded"}})) == \
+        "json:data.status=succeeded"
+    assert conditions.match(SSEEvent("message", None, parsed={"event": "message", "data": "x"})) is None
+
+
+def test_single_object_accepted():
+    """单个对象等价于只有一个元素的数组"""
+    conditions = TerminalConditions.parse('{"type": "data", "value": "[DONE]"}')
+    assert conditions.match(SSEEvent("message", " [DONE] ", parsed=" [DONE] ")) == "data=[DONE]"
+
+
+@pytest.mark.parametrize("spec", [
+    "not json",
+    '"close"',
+    '[{"type": "event"}]',
+    '[{"type": "json", "value": "x"}]',
+    '[{"type": "regex", "value": "x"}]',
+])
+def test_invalid_conditions(spec):
+    with pytest.raises(ValueError):
+        TerminalConditions.parse(spec)
+
+
+if __name__ == '__main__':
+    test_empty_conditions()
+    test_match_each_type()
+    test_single_object_accepted()
+    print("测试完成！")
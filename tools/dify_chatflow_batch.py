@@ -0,0 +1,311 @@
+import asyncio
+import json
+import time
+from collections.abc import Generator
+from typing import Any, Dict, List, Optional, Tuple
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.dify_chatflow_sse import ChatflowAnswerAssembler, DifyChatflowSSEClient
+from utils import metrics
+from utils.async_engine import get_async_engine
+from utils.debug_log import DebugLog
+from utils.headers import parse_headers
+from utils.http_pool import AsyncHTTPClientPool
+from utils.invocation_deadline import InvocationDeadline
+from utils.latency_stats import summarize
+from utils.log_config import configure_log_level, install_queue_handler
+from utils.retry_policy import RetryPolicy
+from utils.stream_resume import ResumeState
+from utils.stream_watchdog import MAX_DURATION
+
+# 导入 logging 和队列日志处理器
+import logging
+
+# 插件日志经队列由独立线程写出，不阻塞SSE读取循环；级别按凭据中的log_level统一配置
+logger = install_queue_handler(logging.getLogger(__name__))
+
+# 并发上限的取值范围，上限低于连接池单主机的默认最大连接数
+MAX_CONCURRENCY = 50
+# 单次调用最多的查询数
+MAX_QUERIES = 1000
+
+
+class ChatflowBatch:
+    """在异步引擎的事件循环中并发执行多个Chatflow查询，并发数由信号量限制，连接由共享连接池复用"""
+
+    def __init__(self, url: str, headers: Dict[str, str], bodies: List[Dict[str, Any]], concurrency: int,
+                 timeout: int, max_events: int, max_duration: int, stop_when_complete: bool = True,
+                 pool: Optional[AsyncHTTPClientPool] = None, deadline: Optional[InvocationDeadline] = None,
+                 idle_timeout: float = 0):
+        self.url = url
+        self.headers = headers
+        self.bodies = bodies
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_events = max_events
+        self.max_duration = max_duration
+        self.stop_when_complete = stop_when_complete
+        self.pool = pool
+        # 整批共享的截止时间：每个查询只使用剩余预算，预算用完后不再开始新的查询
+        self.deadline = deadline or InvocationDeadline(0)
+        # 上游停滞时由看门狗结束该查询，不占用并发名额直到截止时间
+        self.idle_timeout = idle_timeout
+        # 正在监听的查询：序号 -> (客户端, 答案组装器)，调用被取消时用来停止仍在生成的Dify任务
+        self._listening: Dict[int, Tuple[DifyChatflowSSEClient, ChatflowAnswerAssembler]] = {}
+        # 已开始的查询的重试策略，调用结束时汇总尝试记录计入指标
+        self._retry_policies: List[RetryPolicy] = []
+
+    async def run(self) -> List[Dict[str, Any]]:
+        """执行全部查询，结果顺序与输入一致"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._run_query(index, body, semaphore)
+                                      for index, body in enumerate(self.bodies)))
+
+    async def _run_query(self, index: int, body: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """执行单个查询，重试与续传策略与 DifyChatflowSSETool 相同；失败只影响该查询"""
+        async with semaphore:
+            start_time = time.time()
+            deadline = self.deadline
+            retry_policy = RetryPolicy(total_budget=deadline.remaining())
+            self._retry_policies.append(retry_policy)
+            resume_state = ResumeState(max_ids=self.max_events)
+            assembler = ChatflowAnswerAssembler()
+            payload = json.dumps(body, ensure_ascii=False)
+            if deadline.remaining() <= 0:
+                logger.warning(f"[批量查询] 调用时间预算已用完，跳过第{index}个查询")
+                return self._result(index, body, start_time, "skipped", None, assembler, retry_policy,
+                                    "调用时间预算已用完，查询未开始")
+            status = "failed"
+            error = None
+            stop_reason = None
+            for attempt in range(retry_policy.max_attempts):
+                retry_policy.begin_attempt()
+                resume_from = resume_state.begin_attempt(attempt)
+                if attempt > 0 and not resume_from:
+                    assembler = ChatflowAnswerAssembler()  # 整体重放，重新组装答案
+                client = DifyChatflowSSEClient(self.url, "POST", self.headers, payload, "json",
+                                               deadline.attempt_timeout(self.timeout), last_event_id=resume_from,
+                                               idle_timeout=self.idle_timeout, resume_state=resume_state)
+                listen_duration = min(self.max_duration, deadline.remaining())
+                events = client.aconnect_and_listen(self.max_events, listen_duration, self.pool)
+                self._listening[index] = (client, assembler)
+                try:
+                    async for event in events:
+                        if event.retry:
+                            retry_policy.server_retry_ms = event.retry
+                        assembler.feed(event)
+                        if self.stop_when_complete and assembler.is_complete:
+                            client.stop_reason = "answer_complete"
+                            break
+                    retry_policy.record_success()
+                    status = "completed"
+                    error = None
+                    stop_reason = client.stop_reason
+                    if stop_reason == MAX_DURATION and listen_duration < self.max_duration:
+                        # 截止时间到达，答案可能不完整
+                        stop_reason = "deadline"
+                    break
+                except asyncio.CancelledError:
+                    # 调用被取消：记下停止原因，由finally关闭连接
+                    if client.stop_reason is None:
+                        client.stop_reason = "cancelled"
+                    raise
+                except Exception as e:
+                    error = str(e)
+                    retry_delay = retry_policy.record_failure(e)
+                    logger.warning(f"[批量查询] 第{index}个查询第{attempt + 1}次尝试失败: {error}")
+                    if retry_delay is None:
+                        break
+                    await asyncio.sleep(retry_delay)
+                finally:
+                    # 提前结束时立即关闭响应，把连接归还连接池；被取消的查询留给 stop_running_tasks 停止
+                    if client.stop_reason != "cancelled":
+                        self._listening.pop(index, None)
+                    await events.aclose()
+            return self._result(index, body, start_time, status, stop_reason, assembler, retry_policy, error)
+
+    def attempts(self) -> List[Dict[str, Any]]:
+        """所有查询的尝试记录，调用结束时计入指标"""
+        return [record for retry_policy in self._retry_policies for record in retry_policy.attempts]
+
+    def stop_running_tasks(self) -> int:
+        """调用被取消后停止仍在生成的Dify任务，不再消耗LLM token；返回停止请求的数量"""
+        stopped = 0
+        for client, assembler in list(self._listening.values()):
+            if assembler.task_id and not assembler.workflow_finished:
+                client.stop_task(assembler.task_id)
+                stopped += 1
+        return stopped
+
+    @staticmethod
+    def _result(index: int, body: Dict[str, Any], start_time: float, status: str, stop_reason: Optional[str],
+                assembler: ChatflowAnswerAssembler, retry_policy: RetryPolicy, error: Optional[str]) -> Dict[str, Any]:
+        return {
+            "index": index,
+            "query": body.get("query"),
+            "chatflow_answer": assembler.answer,
+            "duration": round(time.time() - start_time, 3),
+            "status": status,
+            "stop_reason": stop_reason,
+            "task_id": assembler.task_id,
+            "attempts": len(retry_policy.attempts),
+            "error": error,
+        }
+
+
+class DifyChatflowBatchTool(Tool):
+    """对同一个Dify Chatflow应用并发执行一批查询"""
+
+    def _parse_json_object(self, value: str, name: str) -> Dict[str, Any]:
+        """解析JSON对象参数"""
+        if not value or not value.strip():
+            return {}
+        try:
+            parsed = json.loads(value.replace('\xa0', ' ').strip())
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format for {name}: {e}")
+        if not isinstance(parsed, dict):
+            raise ValueError(f"{name} must be a JSON object")
+        return parsed
+
+    def _validate_url(self, url: str) -> None:
+        """验证URL格式"""
+        if not url:
+            raise ValueError("URL不能为空")
+        if not url.startswith(('http://', 'https://')):
+            raise ValueError("URL必须以http://或https://开头")
+
+    def _build_bodies(self, queries_str: str, template: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """把查询列表展开为请求体：JSON数组（元素为字符串或对象）或每行一个查询；对象中的字段覆盖模板"""
+        cleaned_str = queries_str.replace('\xa0', ' ').strip()
+        if cleaned_str.startswith('['):
+            try:
+                items = json.loads(cleaned_str)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON format for queries: {e}")
+        else:
+            items = [line.strip() for line in cleaned_str.splitlines() if line.strip()]
+        if not items:
+            raise ValueError("至少需要一个查询")
+        if len(items) > MAX_QUERIES:
+            raise ValueError(f"查询数量不能超过{MAX_QUERIES}个")
+
+        bodies = []
+        for index, item in enumerate(items):
+            if isinstance(item, str):
+                item = {"query": item}
+            if not isinstance(item, dict) or not isinstance(item.get("query"), str):
+                raise ValueError(f"第{index}个查询必须是字符串或包含query字段的对象")
+            body = dict(template)
+            body.update(item)
+            body["response_mode"] = "streaming"
+            bodies.append(body)
+        return bodies
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """并发执行一批Chatflow查询"""
+        invoke_start = time.time()
+        batch = None
+        try:
+            # 按凭据中的log_level配置日志级别，同一级别只配置一次
+            credentials = getattr(getattr(self, 'runtime', None), 'credentials', None) or {}
+            configure_log_level(credentials.get('log_level', 'INFO'))
+
+            logger.info("[工具调用] DifyChatflowBatchTool._invoke 开始执行")
+            dbg = DebugLog(logger)
+
+            url = (tool_parameters.get('url', '') or '').strip().strip('`').strip()
+            self._validate_url(url)
+            headers = parse_headers(tool_parameters.get('headers', '') or '')
+            template = self._parse_json_object(tool_parameters.get('body', '') or '', 'body')
+            bodies = self._build_bodies(tool_parameters.get('queries', '') or '', template)
+            concurrency = min(MAX_CONCURRENCY, max(1, int(tool_parameters.get('concurrency', 5) or 5)))
+            timeout = int(tool_parameters.get('timeout', 300))
+            max_events = int(tool_parameters.get('max_events', 10000))
+            max_duration = int(tool_parameters.get('max_duration', 600))
+            idle_timeout = float(tool_parameters.get('idle_timeout') or 0)
+            stop_when_complete = bool(tool_parameters.get('stop_when_complete', True))
+            logger.info(f"[批量查询] 共{len(bodies)}个查询，并发上限{concurrency}")
+            dbg.debug("[批量查询] URL: %s, 超时: %d秒, 最大事件: %d, 最大时长: %d秒, 空闲超时: %g秒",
+                      url, timeout, max_events, max_duration, idle_timeout)
+
+            # 批量调用整体不能超过插件运行时上限，否则守护进程结束调用时已完成的结果全部丢失
+            deadline = InvocationDeadline(0)
+            engine = get_async_engine()
+            batch = ChatflowBatch(url, headers, bodies, concurrency, timeout, max_events, max_duration,
+                                  stop_when_complete, deadline=deadline, idle_timeout=idle_timeout)
+            try:
+                results = engine.run(batch.run())
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    # 调用被取消（如greenlet被结束）：引擎已取消批量任务并关闭各查询的连接，再让Dify停止仍在生成的任务
+                    logger.info("[批量查询] 调用已取消，关闭连接")
+                    batch.stop_running_tasks()
+                    metrics.invocation_finished("dify_chatflow_batch", "cancelled", time.time() - invoke_start,
+                                                batch.attempts())
+                raise
+
+            duration = time.time() - invoke_start
+            succeeded = [r for r in results if r["status"] == "completed"]
+            skipped = sum(1 for r in results if r["status"] == "skipped")
+            failed = len(results) - len(succeeded) - skipped
+            if skipped:
+                logger.warning(f"[时间预算] 达到调用截止时间，{skipped}个查询未开始")
+            latency = summarize((r["duration"] for r in succeeded), percentiles=(50, 95))
+            # 只计成功完成的查询，未开始和失败的查询不计入吞吐
+            throughput = round(len(succeeded) / duration, 3) if duration > 0 else None
+            if not failed and not skipped:
+                status = "completed"
+            elif succeeded:
+                status = "partial"
+            else:
+                status = "failed"
+
+            final_result = {
+                "status": status,
+                "total_queries": len(results),
+                "succeeded": len(succeeded),
+                "failed": failed,
+                "skipped": skipped,
+                "concurrency": concurrency,
+                "deadline": deadline.to_dict(),
+                "duration": round(duration, 2),
+                "throughput": throughput,
+                "latency": latency,
+                "pool_stats": engine.pool.stats(url),
+                "summary": f"批量执行{len(results)}个查询，成功{len(succeeded)}个，未开始{skipped}个，耗时{duration:.2f}秒，"
+                           f"吞吐{throughput}个/秒，p50 {latency['p50']}秒，p95 {latency['p95']}秒"
+            }
+            logger.info(f"[批量查询] {final_result['summary']}")
+            metrics.invocation_finished("dify_chatflow_batch", status, duration, batch.attempts())
+
+            yield self.create_json_message(final_result)
+            yield self.create_text_message(final_result["summary"])
+            yield self.create_variable_message("results", results)
+            yield self.create_variable_message("connection_status", status)
+            yield self.create_variable_message("total_queries", len(results))
+            yield self.create_variable_message("throughput", throughput)
+            yield self.create_variable_message("latency_p50", latency["p50"])
+            yield self.create_variable_message("latency_p95", latency["p95"])
+
+            logger.info("[工具调用] DifyChatflowBatchTool._invoke 执行完成")
+
+        except Exception as e:
+            # 处理参数验证或其他错误
+            error_msg = f"参数错误或系统错误: {str(e)}"
+            logger.error(f"[系统错误] {error_msg}")
+            metrics.invocation_finished("dify_chatflow_batch", "error", time.time() - invoke_start,
+                                        batch.attempts() if batch is not None else None)
+
+            yield self.create_json_message({
+                "status": "error",
+                "total_queries": 0,
+                "summary": "批量查询执行失败",
+                "error": error_msg
+            })
+            yield self.create_text_message(f"批量查询执行失败\n错误信息: {error_msg}")
+            yield self.create_variable_message("results", [])
+            yield self.create_variable_message("connection_status", "error")
+            yield self.create_variable_message("total_queries", 0)
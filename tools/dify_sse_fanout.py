@@ -0,0 +1,377 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncGenerator, Generator
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlparse
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.dify_sse_node_plugin import SSEClient
+from utils import metrics
+from utils.async_engine import get_async_engine
+from utils.debug_log import DebugLog
+from utils.event_retention import EventRetention
+from utils.headers import parse_headers
+from utils.http_pool import AsyncHTTPClientPool
+from utils.invocation_deadline import InvocationDeadline
+from utils.log_config import configure_log_level, install_queue_handler
+from utils.retry_policy import RetryPolicy
+from utils.sse_event import SSEEvent
+from utils.stream_resume import ResumeState
+from utils.stream_watchdog import MAX_DURATION
+from utils.terminal_conditions import TerminalConditions
+
+# 导入 logging 和队列日志处理器
+import logging
+
+# 插件日志经队列由独立线程写出，不阻塞SSE读取循环；级别按凭据中的log_level统一配置
+logger = install_queue_handler(logging.getLogger(__name__))
+
+# 单次调用最多同时监听的源数量
+MAX_SOURCES = 20
+
+
+class FanoutSource:
+    """一个SSE源的请求参数与监听状态，各源的限制、重试和失败互不影响"""
+
+    def __init__(self, index: int, url: str, method: str, headers: Dict[str, str], body: str, body_type: str,
+                 max_events: int, terminal_conditions: TerminalConditions, retention_max_bytes: int):
+        self.index = index
+        self.url = url
+        self.method = method
+        self.headers = headers
+        self.body = body
+        self.body_type = body_type
+        self.max_events = max_events
+        self.terminal_conditions = terminal_conditions
+        self.retention = EventRetention("keep_first", retention_max_bytes)
+        self.event_count = 0
+        self.status = "pending"  # pending / completed / failed
+        self.stop_reason: Optional[str] = None
+        self.terminal_match: Optional[str] = None
+        self.error: Optional[str] = None
+        self.duration = 0.0
+        self.retry_policy = RetryPolicy()
+        self.resume_state = ResumeState(max_ids=max_events)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "source": self.index,
+            "url": self.url,
+            "status": self.status,
+            "total_events": self.event_count,
+            "duration": round(self.duration, 2),
+            "stop_reason": self.stop_reason,
+            "terminal_condition": self.terminal_match,
+            "error": self.error,
+            "attempts": self.retry_policy.attempts,
+            "resume": self.resume_state.to_dict(),
+            "retention": self.retention.stats(),
+        }
+
+
+class SSEFanout:
+    """在异步引擎的事件循环中并发监听多个SSE源，按到达顺序合并事件"""
+
+    def __init__(self, sources: List[FanoutSource], timeout: int, deadline: InvocationDeadline,
+                 keep_raw: bool = False, pool: Optional[AsyncHTTPClientPool] = None, idle_timeout: float = 0):
+        self.sources = sources
+        self.timeout = timeout
+        # 每个源各自的看门狗：一个源停滞不会拖住其他源，也不用等到截止时间
+        self.idle_timeout = idle_timeout
+        # 所有源共享调用截止时间：连接、重试等待和监听都不越过它
+        self.deadline = deadline
+        self.keep_raw = keep_raw
+        self.pool = pool
+        for source in sources:
+            source.retry_policy = RetryPolicy(total_budget=deadline.budget)
+
+    async def events(self) -> AsyncGenerator[Tuple[FanoutSource, SSEEvent], None]:
+        """产出 (源, 事件)，所有源结束后返回；提前关闭时取消仍在监听的源"""
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = [asyncio.ensure_future(self._listen(source, queue)) for source in self.sources]
+        pending = len(tasks)
+        try:
+            while pending:
+                item = await queue.get()
+                if item is None:
+                    pending -= 1
+                    continue
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel(self) -> int:
+        """调用被取消时把仍在监听的源记为 cancelled，连接随 events() 的关闭一起断开；返回这些源的数量"""
+        listening = [source for source in self.sources if source.status == "pending"]
+        for source in listening:
+            source.stop_reason = "cancelled"
+        return len(listening)
+
+    def attempts(self) -> List[Dict[str, Any]]:
+        """所有源的尝试记录，调用结束时计入指标"""
+        return [record for source in self.sources for record in source.retry_policy.attempts]
+
+    async def _listen(self, source: FanoutSource, queue: asyncio.Queue) -> None:
+        """监听单个源，按与 DifySseNodePluginTool 相同的策略重试和续传"""
+        start_time = time.time()
+        deadline = self.deadline
+        retry_policy = source.retry_policy
+        resume_state = source.resume_state
+        try:
+            for attempt in range(retry_policy.max_attempts):
+                retry_policy.begin_attempt()
+                resume_from = resume_state.begin_attempt(attempt)
+                client = SSEClient(source.url, source.method, source.headers, source.body, source.body_type,
+                                   deadline.attempt_timeout(self.timeout), keep_raw=self.keep_raw,
+                                   last_event_id=resume_from, terminal_conditions=source.terminal_conditions,
+                                   idle_timeout=self.idle_timeout, resume_state=resume_state)
+                try:
+                    async for event in client.aconnect_and_listen(source.max_events - source.event_count,
+                                                                  deadline.remaining(), self.pool):
+                        source.event_count += 1
+                        if event.retry:
+                            retry_policy.server_retry_ms = event.retry
+                        event.number = source.event_count
+                        source.retention.add(event, event.size)
+                        queue.put_nowait((source, event))
+                    retry_policy.record_success()
+                    source.status = "completed"
+                    source.stop_reason = client.stop_reason
+                    if source.stop_reason == MAX_DURATION and deadline.capped:
+                        source.stop_reason = "deadline"
+                    source.terminal_match = client.terminal_match
+                    return
+                except Exception as e:
+                    source.error = str(e)
+                    retry_delay = retry_policy.record_failure(e)
+                    logger.warning(f"[多源监听] 源#{source.index} 第{attempt + 1}次尝试失败: {source.error}")
+                    if source.event_count and not resume_state.last_event_id:
+                        # 已合并输出的事件无法撤回，没有事件ID时不能整体重放
+                        break
+                    if retry_delay is None:
+                        break
+                    await asyncio.sleep(retry_delay)
+            source.status = "failed"
+        finally:
+            source.duration = time.time() - start_time
+            queue.put_nowait(None)
+
+
+class DifySseFanoutTool(Tool):
+    """同时监听多个SSE源并合并为一条时间线"""
+
+    def _build_url_with_params(self, url: str, params: Dict[str, str]) -> str:
+        """构建带查询参数的URL"""
+        if not params:
+            return url
+
+        parsed_url = urlparse(url)
+        query_string = urlencode(params)
+
+        if parsed_url.query:
+            full_query = f"{parsed_url.query}&{query_string}"
+        else:
+            full_query = query_string
+
+        return f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}?{full_query}"
+
+    def _validate_url(self, url: str) -> None:
+        """验证URL格式"""
+        if not url:
+            raise ValueError("URL不能为空")
+        if not url.startswith(('http://', 'https://')):
+            raise ValueError("URL必须以http://或https://开头")
+
+    def _parse_sources(self, sources_str: str, tool_parameters: dict[str, Any]) -> List[FanoutSource]:
+        """解析源列表：JSON数组（元素为URL或对象），或每行一个URL；对象中未给出的字段使用工具参数"""
+        cleaned_str = sources_str.replace('\xa0', ' ').strip()
+        if cleaned_str.startswith('['):
+            try:
+                items = json.loads(cleaned_str)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON format for sources: {e}")
+        else:
+            items = [line.strip() for line in cleaned_str.splitlines() if line.strip()]
+        if not items:
+            raise ValueError("至少需要一个SSE源")
+        if len(items) > MAX_SOURCES:
+            raise ValueError(f"SSE源数量不能超过{MAX_SOURCES}个")
+
+        default_headers = parse_headers(tool_parameters.get('headers', '') or '')
+        default_conditions = tool_parameters.get('terminal_conditions', '') or ''
+        retention_max_mb = float(tool_parameters.get('retention_max_mb', 32) or 32)
+        # 保留预算在各源之间平分，一个源的大量事件不会挤掉其他源
+        retention_max_bytes = int(retention_max_mb * 1024 * 1024 / len(items))
+
+        sources = []
+        for index, item in enumerate(items):
+            if isinstance(item, str):
+                item = {"url": item}
+            if not isinstance(item, dict):
+                raise ValueError(f"第{index}个源必须是URL字符串或对象")
+            url = str(item.get('url', '')).strip().strip('`').strip()
+            self._validate_url(url)
+            headers = item.get('headers', default_headers)
+            if isinstance(headers, str):
+                headers = parse_headers(headers)
+            query_params = item.get('query_params') or {}
+            if isinstance(query_params, str):
+                query_params = json.loads(query_params) if query_params.strip() else {}
+            body = item.get('body', tool_parameters.get('body', '') or '')
+            if not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            conditions = item.get('terminal_conditions', default_conditions)
+            if not isinstance(conditions, str):
+                conditions = json.dumps(conditions, ensure_ascii=False)
+            sources.append(FanoutSource(
+                index=index,
+                url=self._build_url_with_params(url, query_params),
+                method=str(item.get('method', tool_parameters.get('method', 'GET') or 'GET')).strip().upper(),
+                headers=headers,
+                body=body.strip(),
+                body_type=item.get('body_type', tool_parameters.get('body_type', 'json') or 'json'),
+                max_events=int(item.get('max_events', tool_parameters.get('max_events', 100))),
+                terminal_conditions=TerminalConditions.parse(conditions),
+                retention_max_bytes=retention_max_bytes,
+            ))
+        return sources
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """并发监听多个SSE源"""
+        invoke_start = time.time()
+        time_to_first_output = None
+        fanout = None
+        try:
+            # 按凭据中的log_level配置日志级别，同一级别只配置一次
+            credentials = getattr(getattr(self, 'runtime', None), 'credentials', None) or {}
+            configure_log_level(credentials.get('log_level', 'INFO'))
+
+            logger.info("[工具调用] DifySseFanoutTool._invoke 开始执行")
+            dbg = DebugLog(logger)
+
+            timeout = int(tool_parameters.get('timeout', 30))
+            max_duration = int(tool_parameters.get('max_duration', 300))
+            idle_timeout = float(tool_parameters.get('idle_timeout') or 0)
+            include_raw_data = bool(tool_parameters.get('include_raw_data', False))
+            stream_output = (tool_parameters.get('output_mode', 'batch') or 'batch') == 'stream'
+
+            sources = self._parse_sources(tool_parameters.get('sources', '') or '', tool_parameters)
+            logger.info(f"[多源监听] 开始并发监听{len(sources)}个SSE源")
+            if dbg.enabled:
+                for source in sources:
+                    logger.debug(f"[多源监听] 源#{source.index}: {source.method} {source.url}, 最大事件数: {source.max_events}")
+
+            # max_duration 覆盖整个调用，且不超过插件运行时上限
+            deadline = InvocationDeadline(max_duration)
+            if deadline.capped:
+                logger.info(f"[时间预算] max_duration={max_duration}秒超过运行时上限，调用截止时间为{deadline.budget:g}秒后")
+            engine = get_async_engine()
+            fanout = SSEFanout(sources, timeout, deadline, keep_raw=include_raw_data, idle_timeout=idle_timeout)
+            events = engine.iterate(fanout.events())
+            try:
+                for source, event in events:
+                    if dbg.sampled():
+                        logger.debug("[多源监听] 源#%d 第%d个事件（每%d个采样一次）: %s",
+                                     source.index, event.number, dbg.sample_every, event.event_type)
+                    # 流式模式：事件到达即转发，每行以源序号开头
+                    if stream_output:
+                        if time_to_first_output is None:
+                            time_to_first_output = round(time.time() - invoke_start, 3)
+                        yield self.create_stream_variable_message("stream_output", f"[{source.index}] {event.data}\n")
+            except GeneratorExit:
+                # 调用被取消：记下停止原因，由finally立即断开所有源，不等生成器被垃圾回收
+                if fanout.cancel():
+                    logger.info("[多源监听] 调用已取消，关闭所有源的连接")
+                metrics.invocation_finished("dify_sse_fanout", "cancelled", time.time() - invoke_start,
+                                            fanout.attempts())
+                raise
+            finally:
+                # 异步引擎中取消各源的读取协程，由事件循环关闭连接
+                events.close()
+
+            duration = time.time() - invoke_start
+            if time_to_first_output is None:
+                time_to_first_output = round(duration, 3)
+
+            # 按接收时间合并各源保留的事件，标注来源
+            merged = sorted(
+                ((source, event) for source in sources for event in source.retention.events),
+                key=lambda item: item[1].clock.mono_start_ns + item[1].offset_ns,
+            )
+            events_stream = []
+            for number, (source, event) in enumerate(merged, 1):
+                event_info = event.to_dict(include_raw_data)
+                event_info["source_event_number"] = event_info["event_number"]
+                event_info["event_number"] = number
+                event_info["source"] = source.index
+                events_stream.append(event_info)
+
+            source_results = [source.to_dict() for source in sources]
+            completed = sum(1 for source in sources if source.status == "completed")
+            if completed == len(sources):
+                status = "completed"
+            elif completed:
+                status = "partial"
+            else:
+                status = "failed"
+            total_events = sum(source.event_count for source in sources)
+            slowest = max(source.duration for source in sources)
+
+            final_result = {
+                "status": status,
+                "total_events": total_events,
+                "connection_duration": round(duration, 2),
+                "slowest_source_duration": round(slowest, 2),
+                "time_to_first_output": time_to_first_output,
+                "sources": source_results,
+                "deadline": deadline.to_dict(),
+                "pool_stats": engine.pool.stats(),
+                "summary": f"并发监听{len(sources)}个SSE源，成功{completed}个，接收到{total_events}个事件，耗时{duration:.2f}秒"
+            }
+            logger.info(f"[多源监听] {final_result['summary']}，最慢的源耗时{slowest:.2f}秒")
+            metrics.invocation_finished("dify_sse_fanout", status, duration, fanout.attempts())
+
+            text_lines = [f"多源SSE监听{'完成' if status == 'completed' else '结束'}",
+                          f"源数量: {len(sources)}, 成功: {completed}",
+                          f"接收事件数: {total_events}",
+                          f"总耗时: {duration:.2f}秒（最慢的源 {slowest:.2f}秒）"]
+            for source in sources:
+                detail = source.stop_reason if source.status == "completed" else source.error
+                text_lines.append(f"[{source.index}] {source.url}: {source.status}, {source.event_count}个事件, {detail}")
+
+            yield self.create_json_message(final_result)
+            yield self.create_text_message("\n".join(text_lines))
+            yield self.create_variable_message("events_stream", events_stream)
+            yield self.create_variable_message("sources", source_results)
+            yield self.create_variable_message("connection_status", status)
+            yield self.create_variable_message("total_events", total_events)
+            yield self.create_variable_message("connection_duration", round(duration, 2))
+            yield self.create_variable_message("time_to_first_output", time_to_first_output)
+
+            logger.info("[工具调用] DifySseFanoutTool._invoke 执行完成")
+
+        except Exception as e:
+            # 处理参数验证或其他错误
+            error_msg = f"参数错误或系统错误: {str(e)}"
+            logger.error(f"[系统错误] {error_msg}")
+            metrics.invocation_finished("dify_sse_fanout", "error", time.time() - invoke_start,
+                                        fanout.attempts() if fanout is not None else None)
+
+            yield self.create_json_message({
+                "status": "error",
+                "total_events": 0,
+                "connection_duration": 0,
+                "summary": "多源SSE监听失败",
+                "error": error_msg
+            })
+            yield self.create_text_message(f"多源SSE监听失败\n错误信息: {error_msg}\n连接状态: 错误")
+            yield self.create_variable_message("events_stream", [])
+            yield self.create_variable_message("sources", [])
+            yield self.create_variable_message("connection_status", "error")
+            yield self.create_variable_message("total_events", 0)
+            yield self.create_variable_message("connection_duration", 0)
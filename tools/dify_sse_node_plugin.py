@@ -1,49 +1,65 @@
 import json
 import time
 import re
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from typing import Any, Dict, List, Optional
 from urllib.parse import urlencode, urlparse
 import httpx
-from datetime import datetime
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-# 导入 logging 和自定义处理器
-import logging
-from dify_plugin.config.logger_format import plugin_logger_handler
-
-# 使用自定义处理器设置日志
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)  # 设置为DEBUG以确保所有级别的日志都能被处理
-logger.addHandler(plugin_logger_handler)
+from utils import json_codec, metrics
+from utils.async_engine import engine_from_env, get_async_engine
+from utils.circuit_breaker import get_circuit_breaker
+from utils.debug_log import DebugLog
+from utils.event_retention import EventRetention
+from utils.headers import parse_headers
+from utils.host_limiter import get_host_limiter
+from utils.http_pool import AsyncHTTPClientPool, get_http_pool
+from utils.invocation_deadline import InvocationDeadline
+from utils.log_config import configure_log_level, install_queue_handler
+from utils.retry_policy import RetryPolicy, SSEHTTPStatusError, parse_retry_after
+from utils.sse_event import SSEEvent, StreamClock
+from utils.sse_parser import SSEFrame, SSEFrameParser
+from utils.stream_resume import ResumeState
+from utils.stream_timing import StreamTiming
+from utils.stream_watchdog import MAX_DURATION, StreamWatchdog
+from utils.terminal_conditions import TerminalConditions
 
-# 确保plugin_logger_handler初始设置为DEBUG级别，后续会动态调整
-plugin_logger_handler.setLevel(logging.INFO)
+# 导入 logging 和队列日志处理器
+import logging
 
-class SSEEvent:
-    """SSE事件数据结构"""
-    def __init__(self, event_type: str = "message", data: str = "", event_id: str = "", retry: int = 0):
-        self.event_type = event_type
-        self.data = data
-        self.event_id = event_id
-        self.retry = retry
-        self.timestamp = datetime.now().isoformat()
+# 插件日志经队列由独立线程写出，不阻塞SSE读取循环；级别按凭据中的log_level统一配置
+logger = install_queue_handler(logging.getLogger(__name__))
 
 
 class SSEClient:
     """SSE客户端实现"""
+    # 指标中的 client 标签
+    metrics_client = "generic"
     
     def __init__(self, url: str, method: str = 'GET', headers: Optional[Dict[str, str]] = None, 
-                 body: Optional[str] = None, body_type: str = "json", timeout: int = 30):
+                 body: Optional[str] = None, body_type: str = "json", timeout: int = 30,
+                 keep_raw: bool = False, last_event_id: Optional[str] = None,
+                 terminal_conditions: Optional[TerminalConditions] = None, idle_timeout: float = 0,
+                 resume_state: Optional[ResumeState] = None):
         self.url = url
         self.method = method.upper()
-        self.headers = headers or {}
+        self.headers = dict(headers or {})
         self.body = body
         self.body_type = body_type
         self.timeout = timeout
-        self.events: List[SSEEvent] = []
+        # 空闲超时（秒）：这么长时间没有收到任何数据时停止监听，0 表示只受读超时限制
+        self.idle_timeout = idle_timeout
+        self.keep_raw = keep_raw  # 是否保留事件data的原始字节
+        # 匹配到即关闭流的终止条件
+        self.terminal_conditions = terminal_conditions or TerminalConditions()
+        self.terminal_match: Optional[str] = None  # 匹配到的终止条件描述
+        # 监听结束原因：server_closed / max_events / max_duration / idle_timeout / terminal_condition
+        self.stop_reason: Optional[str] = None
+        self.clock = StreamClock()  # 事件时间戳的基准，每次连接时重置
+        self.timing = StreamTiming()  # 本次连接的分阶段耗时
         self.is_connected = False
         self.start_time = None
         
@@ -53,454 +69,522 @@ class SSEClient:
             'Cache-Control': 'no-cache',
             'Connection': 'keep-alive'
         })
-    
-    def parse_sse_line(self, line: str) -> Dict[str, str]:
-        """解析SSE数据行"""
-        line = line.strip()
-        if not line or line.startswith(':'):
-            return {}
-        
-        if ':' in line:
-            field, value = line.split(':', 1)
-            return {field.strip(): value.strip()}
-        else:
-            return {line: ''}
+        # 断线重连时携带上次收到的事件ID，由服务端从断点继续推送
+        if last_event_id:
+            self.headers['Last-Event-ID'] = last_event_id
+        # 跨重试的去重状态：从头重放的重复事件在这里丢弃，不产出也不计入事件数上限
+        self.resume_state = resume_state
     
     def parse_sse_event(self, event_lines: List[str]) -> Optional[SSEEvent]:
-        """解析完整的SSE事件"""
+        """解析完整的SSE事件（按行输入）"""
         if not event_lines:
             return None
         
-        event_type = "message"  # SSE规范默认事件类型
-        data_lines = []
-        event_id = ""
-        retry = 0
-        all_fields = {}  # 保存所有字段，包括自定义字段
-        
-        # 解析所有事件行
-        for line in event_lines:
-            parsed = self.parse_sse_line(line)
-            for field, value in parsed.items():
-                if field == 'event':
-                    event_type = value
-                elif field == 'data':
-                    data_lines.append(value)
-                elif field == 'id':
-                    event_id = value
-                elif field == 'retry':
-                    try:
-                        retry = int(value)
-                    except ValueError:
-                        retry = 0
-                else:
-                    # 保存其他自定义字段
-                    if field in all_fields:
-                        # 如果字段重复，转换为列表
-                        if not isinstance(all_fields[field], list):
-                            all_fields[field] = [all_fields[field]]
-                        all_fields[field].append(value)
-                    else:
-                        all_fields[field] = value
+        parser = SSEFrameParser()
+        frames = parser.feed(('\n'.join(event_lines) + '\n\n').encode('utf-8'))
+        return self.build_event(frames[0]) if frames else None
+    
+    def build_event(self, frame: SSEFrame) -> Optional[SSEEvent]:
+        """将解析器输出的SSE帧转换为事件对象，JSON载荷只解码一次"""
+        event_type = frame.event_type
+        event_id = frame.event_id
+        retry = frame.retry
+        all_fields = frame.fields  # 其他自定义字段
         
-        # 构建完整的事件数据
         # 即使没有data字段，也要创建事件对象（SSE规范允许只有event类型的事件）
-        if data_lines:
-            data = '\n'.join(data_lines)
-        else:
+        data = frame.data
+        if data is None:
             # 如果没有data字段，但有其他字段，也创建事件
             if event_type != "message" or event_id or retry or all_fields:
                 data = ""  # 空数据
             else:
                 return None  # 完全空的事件，不创建
         
-        # 如果有自定义字段，将它们添加到data中（作为JSON格式）
+        # 检查data是否是JSON格式，是则解码一次并保留对象（同时处理了Unicode转义序列）
+        parsed = None
+        data_stripped = data.strip()
+        if (data_stripped.startswith('{') and data_stripped.endswith('}')) or \
+           (data_stripped.startswith('[') and data_stripped.endswith(']')):
+            try:
+                parsed = json_codec.loads(data)
+            except json_codec.JSONDecodeError as e:
+                logger.debug("[数据解析] JSON解析失败: %s, 保持原始字符串格式", e)
+        
+        # 如果有自定义字段，将它们合并到解码后的对象中
         if all_fields:
+            if isinstance(parsed, dict):
+                parsed['_custom_fields'] = all_fields
+            elif data:
+                # data不是JSON对象，创建包装对象
+                parsed = {
+                    'original_data': data,
+                    '_custom_fields': all_fields
+                }
+            else:
+                # 没有data，只有自定义字段
+                parsed = dict(all_fields)
+        
+        if parsed is not None:
+            # 字符串形式直接使用收到的data文本；合并了自定义字段时文本与对象不一致，访问时再序列化
+            text = None if all_fields else data
+            return SSEEvent(event_type, text, event_id, retry, parsed, frame.raw, frame.size, self.clock)
+        
+        if not data:
+            return None
+        
+        if '\\u' in data:
+            # 对于非JSON格式但包含Unicode转义的数据，尝试直接解码
             try:
-                import json as json_lib
-                if data:
-                    # 如果已有data，尝试解析为JSON并合并自定义字段
-                    try:
-                        if data.strip().startswith('{') and data.strip().endswith('}'):
-                            parsed_data = json_lib.loads(data)
-                            if isinstance(parsed_data, dict):
-                                parsed_data['_custom_fields'] = all_fields
-                                data = json_lib.dumps(parsed_data, ensure_ascii=False, separators=(',', ':'))
-                            else:
-                                # data不是JSON对象，创建新的包装对象
-                                wrapped_data = {
-                                    'original_data': data,
-                                    '_custom_fields': all_fields
-                                }
-                                data = json_lib.dumps(wrapped_data, ensure_ascii=False, separators=(',', ':'))
-                        else:
-                            # data不是JSON格式，创建包装对象
-                            wrapped_data = {
-                                'original_data': data,
-                                '_custom_fields': all_fields
-                            }
-                            data = json_lib.dumps(wrapped_data, ensure_ascii=False, separators=(',', ':'))
-                    except json_lib.JSONDecodeError:
-                        # JSON解析失败，创建包装对象
-                        wrapped_data = {
-                            'original_data': data,
-                            '_custom_fields': all_fields
-                        }
-                        data = json_lib.dumps(wrapped_data, ensure_ascii=False, separators=(',', ':'))
-                else:
-                    # 没有data，只有自定义字段
-                    data = json_lib.dumps(all_fields, ensure_ascii=False, separators=(',', ':'))
-            except Exception as e:
-                logger.debug(f"[自定义字段处理] 处理自定义字段时出错: {e}")
-                # 出错时保持原始data不变
-                pass
+                data = data.encode().decode('unicode_escape')
+            except Exception as decode_error:
+                logger.debug("[Unicode解码] 非JSON解码失败: %s", decode_error)
+                # 解码失败，保持原始数据
         
-        # 继续原有的Unicode解码逻辑
-        if data:
+        return SSEEvent(event_type, data, event_id, retry, raw=frame.raw, size=frame.size, clock=self.clock)
+    
+    def _begin_listen(self, max_events: int) -> None:
+        """重置一次连接的监听状态"""
+        self.clock = StreamClock()
+        self.timing = StreamTiming()
+        self._event_count = 0
+        self._max_events = max_events
+        self._stopped = False
+
+    def _build_stream_kwargs(self, dbg: DebugLog) -> Dict[str, Any]:
+        """根据方法和body参数构建请求参数，同步与异步引擎共用"""
+        # 根据方法和body参数构建请求
+        if self.method == "GET":
+            stream_kwargs = {
+                "method": "GET",
+                "url": self.url,
+                "headers": self.headers,
+                "timeout": self.timeout
+            }
+        else:
+            # 根据body_type设置Content-Type和处理body
+            headers = self.headers.copy()
+            stream_kwargs = {
+                "method": self.method,
+                "url": self.url,
+                "headers": headers,
+                "timeout": self.timeout
+            }
             
-            # 处理Unicode转义序列，将其解码为可读的中文
-            try:
-                # 尝试解析data中的JSON，如果包含Unicode转义序列则解码
-                import json as json_lib
-                
-                # 检查data是否是JSON格式
-                if data.strip().startswith('{') and data.strip().endswith('}'):
+            if self.body:
+                if self.body_type == "json":
+                    headers["Content-Type"] = "application/json"
+                    # 对于JSON，先清理无效字符，再解析并重新序列化，确保格式正确
                     try:
-                        # 解析JSON，这会自动处理Unicode转义序列
-                        parsed_data = json_lib.loads(data)
+                        import json as json_lib
                         
-                        # 重新序列化，使用ensure_ascii=False确保中文字符正常显示
-                        decoded_data = json_lib.dumps(parsed_data, ensure_ascii=False, separators=(',', ':'))
+                        # 控制台日志：JSON处理开始
+                        dbg.debug("[JSON处理] 开始处理JSON body，长度: %d", len(self.body))
+                        dbg.debug("[JSON处理] 原始body前100字符: %.100r", self.body)
                         
-                        logger.debug(f"[Unicode解码] 原始data: {data[:100]}...")
-                        logger.debug(f"[Unicode解码] 解码后data: {decoded_data[:100]}...")
+                        # 清理控制字符 - 使用更简单直接的方法
+                        import re
                         
-                        data = decoded_data
+                        # 第一步：清理JSON字符串中的无效字符
+                        cleaned_body = self.body
+                        test_parsed = None
                         
-                    except json_lib.JSONDecodeError:
-                        # 如果不是有效的JSON，尝试直接解码Unicode转义序列
+                        # 方法1：先尝试直接解析，如果失败再进行清理
                         try:
-                            # 使用encode().decode('unicode_escape')处理Unicode转义
-                            if '\\u' in data:
-                                decoded_data = data.encode().decode('unicode_escape')
-                                logger.debug(f"[Unicode解码] 直接解码 - 原始: {data[:100]}...")
-                                logger.debug(f"[Unicode解码] 直接解码 - 结果: {decoded_data[:100]}...")
-                                data = decoded_data
-                        except Exception as decode_error:
-                            logger.debug(f"[Unicode解码] 直接解码失败: {decode_error}")
-                            # 解码失败，保持原始数据
-                            pass
+                            # 直接尝试解析原始JSON
+                            test_parsed = json_codec.loads(cleaned_body)
+                            dbg.debug("[JSON处理] 原始JSON解析成功，无需清理")
+                        except json_lib.JSONDecodeError:
+                            dbg.debug("[JSON处理] 原始JSON解析失败，开始清理控制字符")
+                            test_parsed = None
                             
-                elif '\\u' in data:
-                    # 对于非JSON格式但包含Unicode转义的数据，尝试直接解码
-                    try:
-                        decoded_data = data.encode().decode('unicode_escape')
-                        logger.debug(f"[Unicode解码] 非JSON解码 - 原始: {data[:100]}...")
-                        logger.debug(f"[Unicode解码] 非JSON解码 - 结果: {decoded_data[:100]}...")
-                        data = decoded_data
-                    except Exception as decode_error:
-                        logger.debug(f"[Unicode解码] 非JSON解码失败: {decode_error}")
-                        # 解码失败，保持原始数据
-                        pass
+                            # 方法2：移除JSON结构中的格式化字符，保留字符串值内的内容
+                            # 先压缩所有空白字符（包括换行、制表符等）为单个空格
+                            cleaned_body = re.sub(r'\s+', ' ', cleaned_body)
+                            
+                            # 然后清理字符串值内的实际控制字符
+                            # 使用简单的字符串替换来处理常见的控制字符
+                            cleaned_body = cleaned_body.replace('\n', ' ')  # 换行符替换为空格
+                            cleaned_body = cleaned_body.replace('\r', ' ')  # 回车符替换为空格
+                            cleaned_body = cleaned_body.replace('\t', ' ')  # 制表符替换为空格
+                            cleaned_body = cleaned_body.replace('\b', ' ')  # 退格符替换为空格
+                            cleaned_body = cleaned_body.replace('\f', ' ')  # 换页符替换为空格
+                            
+                            # 清理多余的空格
+                            cleaned_body = re.sub(r'\s+', ' ', cleaned_body)
+                            cleaned_body = cleaned_body.strip()
+                            
+                            dbg.debug("[JSON处理] 控制字符清理完成")
                         
-            except Exception as e:
-                logger.debug(f"[Unicode解码] 处理过程中出错: {e}")
-                # 出错时保持原始数据
-                pass
-            
-            return SSEEvent(event_type, data, event_id, retry)
+                        body_before_space_cleanup = cleaned_body
+                        
+                        # 清理不间断空格(\xa0)和其他常见的无效字符
+                        cleaned_body = cleaned_body.replace('\xa0', ' ')  # 不间断空格替换为普通空格
+                        cleaned_body = cleaned_body.replace('\u00a0', ' ')  # Unicode不间断空格
+                        cleaned_body = cleaned_body.replace('\u2000', ' ')  # En Quad
+                        cleaned_body = cleaned_body.replace('\u2001', ' ')  # Em Quad
+                        cleaned_body = cleaned_body.replace('\u2002', ' ')  # En Space
+                        cleaned_body = cleaned_body.replace('\u2003', ' ')  # Em Space
+                        cleaned_body = cleaned_body.replace('\u2004', ' ')  # Three-Per-Em Space
+                        cleaned_body = cleaned_body.replace('\u2005', ' ')  # Four-Per-Em Space
+                        cleaned_body = cleaned_body.replace('\u2006', ' ')  # Six-Per-Em Space
+                        cleaned_body = cleaned_body.replace('\u2007', ' ')  # Figure Space
+                        cleaned_body = cleaned_body.replace('\u2008', ' ')  # Punctuation Space
+                        cleaned_body = cleaned_body.replace('\u2009', ' ')  # Thin Space
+                        cleaned_body = cleaned_body.replace('\u200a', ' ')  # Hair Space
+                        cleaned_body = cleaned_body.replace('\u202f', ' ')  # Narrow No-Break Space
+                        cleaned_body = cleaned_body.replace('\u205f', ' ')  # Medium Mathematical Space
+                        cleaned_body = cleaned_body.replace('\u3000', ' ')  # Ideographic Space
+                        
+                        dbg.debug("[JSON处理] 清理后body长度: %d", len(cleaned_body))
+                        dbg.debug("[JSON处理] 清理后body前100字符: %.100r", cleaned_body)
+                        
+                        # 第二步：尝试解析JSON
+                        # 空白清理未改变内容时直接复用第一次的解析结果，避免重复解析
+                        if test_parsed is not None and cleaned_body == body_before_space_cleanup:
+                            parsed_json = test_parsed
+                        else:
+                            parsed_json = json_codec.loads(cleaned_body)
+                        dbg.debug("[JSON处理] JSON解析成功，类型: %s", type(parsed_json))
+                        
+                        # 第三步：重新序列化JSON以确保格式正确
+                        normalized_json = json_codec.dumps(parsed_json)
+                        dbg.debug("[JSON处理] JSON重新序列化成功，新长度: %d", len(normalized_json))
+                        dbg.debug("[JSON处理] 序列化后前100字符: %.100r", normalized_json)
+                        
+                        # 第四步：编码为UTF-8字节
+                        stream_kwargs['content'] = normalized_json.encode('utf-8')
+                        dbg.debug("[JSON处理] 编码为UTF-8成功，最终长度: %d", len(stream_kwargs['content']))
+                        
+                    except json_lib.JSONDecodeError as e:
+                        # JSON格式错误，输出详细错误信息
+                        error_msg = f"Invalid JSON format in body: {e}"
+                        logger.debug(f"[JSON错误] {error_msg}")
+                        logger.debug(f"[JSON错误] 原始body错误位置附近: {repr(self.body[max(0, e.pos-20):e.pos+20])}")
+                        logger.debug(f"[JSON错误] 清理后body错误位置附近: {repr(cleaned_body[max(0, e.pos-20):e.pos+20])}")
+                        raise ValueError(error_msg)
+                    except Exception as e:
+                        # 其他错误
+                        error_msg = f"Unexpected error in JSON processing: {e}"
+                        logger.debug(f"[JSON错误] {error_msg}")
+                        raise ValueError(error_msg)
+                elif self.body_type == "form":
+                    if "Content-Type" not in headers:
+                        headers["Content-Type"] = "application/x-www-form-urlencoded"
+                    stream_kwargs["content"] = self.body.encode('utf-8')
+                elif self.body_type == "xml":
+                    if "Content-Type" not in headers:
+                        headers["Content-Type"] = "application/xml"
+                    stream_kwargs["content"] = self.body.encode('utf-8')
+                else:  # text
+                    if "Content-Type" not in headers:
+                        headers["Content-Type"] = "text/plain"
+                    stream_kwargs["content"] = self.body.encode('utf-8')
+
+        return stream_kwargs
+
+    def _read_error_text(self, response: httpx.Response) -> str:
+        """尽量读取非200响应的内容，用于错误信息"""
+        response_text = ""
         
-        return None
-    
+        # 尝试读取响应内容
+        try:
+            # 首先尝试直接读取响应文本
+            response_text = response.text
+            
+            # 如果直接读取失败，尝试其他方法
+            if not response_text:
+                try:
+                    # 尝试读取原始字节并解码
+                    content_bytes = response.content
+                    if content_bytes:
+                        response_text = content_bytes.decode('utf-8', errors='ignore')
+                    else:
+                        response_text = "响应内容为空"
+                except Exception as decode_error:
+                    response_text = f"解码响应内容失败: {str(decode_error)}"
+                    
+        except Exception as e:
+            # 如果所有方法都失败，尝试从流中读取
+            try:
+                content_bytes = b""
+                for chunk in response.iter_bytes(chunk_size=1024):
+                    content_bytes += chunk
+                    if len(content_bytes) > 4096:  # 增加读取限制
+                        break
+                if content_bytes:
+                    response_text = content_bytes.decode('utf-8', errors='ignore')
+                else:
+                    response_text = "无法从响应流中读取内容"
+            except Exception as stream_error:
+                response_text = f"读取响应流时出错: {str(stream_error)}, 原始错误: {str(e)}"
+        return response_text
+
+    @staticmethod
+    async def _aread_error_text(response: httpx.Response) -> str:
+        """_read_error_text 的异步版本，最多读取4096字节"""
+        try:
+            content_bytes = b""
+            async for chunk in response.aiter_bytes(chunk_size=1024):
+                content_bytes += chunk
+                if len(content_bytes) > 4096:
+                    break
+            return content_bytes.decode('utf-8', errors='ignore') if content_bytes else "响应内容为空"
+        except Exception as stream_error:
+            return f"读取响应流时出错: {str(stream_error)}"
+
+    def _status_error(self, response: httpx.Response, response_text: str, method: str, url: str,
+                      stream_kwargs: Dict[str, Any]) -> SSEHTTPStatusError:
+        """构造包含请求与响应详情的HTTP状态错误"""
+        error_details = {
+            "status_code": response.status_code,
+            "response_headers": dict(response.headers),
+            "response_text": response_text[:2000] if response_text else "空响应",  # 增加长度限制
+            "request_url": url,
+            "request_method": method,
+            "request_headers": dict(stream_kwargs.get("headers", {})),
+            "request_body": self.body[:1000] if self.body else None  # 增加长度限制
+        }
+        return SSEHTTPStatusError(f"SSE连接失败，详细信息: {json.dumps(error_details, ensure_ascii=False, indent=2)}",
+                                  response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+
+    def _events_from_chunk(self, parser: SSEFrameParser, chunk: bytes, dbg: DebugLog) -> Generator[SSEEvent, None, None]:
+        """把一个字节块交给解析器并产出事件，需要停止监听时设置 self._stopped"""
+        timing = self.timing
+        mark = time.perf_counter()
+        for frame in parser.feed(chunk):
+            event = self.build_event(frame)
+            if event and self._is_replayed(event, dbg):
+                continue
+            if event:
+                self._event_count += 1
+                now = time.perf_counter()
+                timing.parse += now - mark
+                timing.event_received(now)
+                if dbg.sampled():
+                    logger.debug("[SSE事件解析] 事件#%d（每%d个采样一次）: 类型=%s, ID=%s, 大小=%d字节, 数据=%.200r",
+                                 self._event_count, dbg.sample_every, event.event_type, event.event_id, event.size, event.data)
+                yield event
+                # 生成器让出期间是调用方处理事件的耗时
+                mark = time.perf_counter()
+                timing.consumer += mark - now
+                # 检查终止条件，匹配即关闭流
+                if self.terminal_conditions:
+                    self.terminal_match = self.terminal_conditions.match(event)
+                    if self.terminal_match:
+                        logger.info(f"[SSE监听] 匹配终止条件 {self.terminal_match}，停止监听")
+                        self.stop_reason = "terminal_condition"
+                        self._stopped = True
+                        return
+            else:
+                dbg.debug("[SSE事件解析] 解析结果为空，跳过此事件")
+
+            # 检查事件数量限制
+            if self._event_count >= self._max_events:
+                logger.info(f"[SSE监听] 达到最大事件数限制 {self._max_events}，停止监听")
+                self.stop_reason = "max_events"
+                self._stopped = True
+                return
+        timing.parse += time.perf_counter() - mark
+
+    def _is_replayed(self, event: SSEEvent, dbg: DebugLog) -> bool:
+        """服务端不支持续传而从头重放时，已收到过的事件返回True"""
+        if self.resume_state is None or self.resume_state.accept(event.event_id):
+            return False
+        dbg.debug("[SSE续传] 跳过重复事件: ID=%s", event.event_id)
+        return True
+
+    def _watchdog_stop(self, watchdog: StreamWatchdog) -> None:
+        """看门狗到期后结束监听，解析器中残留的不完整事件不再产出"""
+        self.stop_reason = watchdog.check()
+        self._stopped = True
+        logger.info(f"[SSE监听] {watchdog.describe(self.stop_reason)}，停止监听")
+
+    def _finish_events(self, parser: SSEFrameParser, dbg: DebugLog) -> Generator[SSEEvent, None, None]:
+        """流结束时产出解析器中剩余的最后一个事件（没有以空行结尾时）"""
+        if self.stop_reason is None:
+            self.stop_reason = "server_closed"
+
+        if not self._stopped:
+            for frame in parser.flush():
+                event = self.build_event(frame)
+                if event and not self._is_replayed(event, dbg):
+                    self._event_count += 1
+                    dbg.debug("[SSE事件解析] 成功解析最后一个事件#%d: 类型=%s, ID=%s", self._event_count, event.event_type, event.event_id)
+                    yield event
+
+        logger.info(f"[SSE监听] 监听结束，共处理{parser.line_count}行原始数据，解析出{self._event_count}个有效事件")
+
     def connect_and_listen(self, max_events: int = 100, max_duration: int = 300) -> Generator[SSEEvent, None, None]:
         """连接SSE服务器并监听事件"""
-        start_time = time.time()
-        event_count = 0
-        
+        watchdog = StreamWatchdog(max_duration, self.idle_timeout)
+        self._begin_listen(max_events)
+        dbg = DebugLog(logger)  # 热循环中只判断布尔值，逐事件跟踪按1/N采样
+        limiter = None
+        circuit = None  # 熔断器放行的请求，收到响应头或连接失败时报告结果
+
         try:
-            # 根据方法和body参数构建请求
-            if self.method == "GET":
-                stream_kwargs = {
-                    "method": "GET",
-                    "url": self.url,
-                    "headers": self.headers,
-                    "timeout": self.timeout
-                }
-            else:
-                # 根据body_type设置Content-Type和处理body
-                headers = self.headers.copy()
-                stream_kwargs = {
-                    "method": self.method,
-                    "url": self.url,
-                    "headers": headers,
-                    "timeout": self.timeout
-                }
-                
-                if self.body:
-                    if self.body_type == "json":
-                        headers["Content-Type"] = "application/json"
-                        # 对于JSON，先清理无效字符，再解析并重新序列化，确保格式正确
-                        try:
-                            import json as json_lib
-                            
-                            # 控制台日志：JSON处理开始
-                            logger.debug(f"[JSON处理] 开始处理JSON body，长度: {len(self.body)}")
-                            logger.debug(f"[JSON处理] 原始body前100字符: {repr(self.body[:100])}")
-                            
-                            # 清理控制字符 - 使用更简单直接的方法
-                            import re
-                            
-                            # 第一步：清理JSON字符串中的无效字符
-                            cleaned_body = self.body
-                            
-                            # 方法1：先尝试直接解析，如果失败再进行清理
-                            try:
-                                # 直接尝试解析原始JSON
-                                test_parsed = json_lib.loads(cleaned_body)
-                                logger.debug(f"[JSON处理] 原始JSON解析成功，无需清理")
-                            except json_lib.JSONDecodeError:
-                                logger.debug(f"[JSON处理] 原始JSON解析失败，开始清理控制字符")
-                                
-                                # 方法2：移除JSON结构中的格式化字符，保留字符串值内的内容
-                                # 先压缩所有空白字符（包括换行、制表符等）为单个空格
-                                cleaned_body = re.sub(r'\s+', ' ', cleaned_body)
-                                
-                                # 然后清理字符串值内的实际控制字符
-                                # 使用简单的字符串替换来处理常见的控制字符
-                                cleaned_body = cleaned_body.replace('\n', ' ')  # 换行符替换为空格
-                                cleaned_body = cleaned_body.replace('\r', ' ')  # 回车符替换为空格
-                                cleaned_body = cleaned_body.replace('\t', ' ')  # 制表符替换为空格
-                                cleaned_body = cleaned_body.replace('\b', ' ')  # 退格符替换为空格
-                                cleaned_body = cleaned_body.replace('\f', ' ')  # 换页符替换为空格
-                                
-                                # 清理多余的空格
-                                cleaned_body = re.sub(r'\s+', ' ', cleaned_body)
-                                cleaned_body = cleaned_body.strip()
-                                
-                                logger.debug(f"[JSON处理] 控制字符清理完成")
-                            
-                            # 清理不间断空格(\xa0)和其他常见的无效字符
-                            cleaned_body = cleaned_body.replace('\xa0', ' ')  # 不间断空格替换为普通空格
-                            cleaned_body = cleaned_body.replace('\u00a0', ' ')  # Unicode不间断空格
-                            cleaned_body = cleaned_body.replace('\u2000', ' ')  # En Quad
-                            cleaned_body = cleaned_body.replace('\u2001', ' ')  # Em Quad
-                            cleaned_body = cleaned_body.replace('\u2002', ' ')  # En Space
-                            cleaned_body = cleaned_body.replace('\u2003', ' ')  # Em Space
-                            cleaned_body = cleaned_body.replace('\u2004', ' ')  # Three-Per-Em Space
-                            cleaned_body = cleaned_body.replace('\u2005', ' ')  # Four-Per-Em Space
-                            cleaned_body = cleaned_body.replace('\u2006', ' ')  # Six-Per-Em Space
-                            cleaned_body = cleaned_body.replace('\u2007', ' ')  # Figure Space
-                            cleaned_body = cleaned_body.replace('\u2008', ' ')  # Punctuation Space
-                            cleaned_body = cleaned_body.replace('\u2009', ' ')  # Thin Space
-                            cleaned_body = cleaned_body.replace('\u200a', ' ')  # Hair Space
-                            cleaned_body = cleaned_body.replace('\u202f', ' ')  # Narrow No-Break Space
-                            cleaned_body = cleaned_body.replace('\u205f', ' ')  # Medium Mathematical Space
-                            cleaned_body = cleaned_body.replace('\u3000', ' ')  # Ideographic Space
-                            
-                            logger.debug(f"[JSON处理] 清理后body长度: {len(cleaned_body)}")
-                            logger.debug(f"[JSON处理] 清理后body前100字符: {repr(cleaned_body[:100])}")
-                            
-                            # 第二步：尝试解析JSON
-                            parsed_json = json.loads(cleaned_body)
-                            logger.debug(f"[JSON处理] JSON解析成功，类型: {type(parsed_json)}")
-                            
-                            # 第三步：重新序列化JSON以确保格式正确
-                            normalized_json = json.dumps(parsed_json, ensure_ascii=False, separators=(',', ':'))
-                            logger.debug(f"[JSON处理] JSON重新序列化成功，新长度: {len(normalized_json)}")
-                            logger.debug(f"[JSON处理] 序列化后前100字符: {repr(normalized_json[:100])}")
-                            
-                            # 第四步：编码为UTF-8字节
-                            stream_kwargs['content'] = normalized_json.encode('utf-8')
-                            logger.debug(f"[JSON处理] 编码为UTF-8成功，最终长度: {len(stream_kwargs['content'])}")
-                            
-                        except json_lib.JSONDecodeError as e:
-                            # JSON格式错误，输出详细错误信息
-                            error_msg = f"Invalid JSON format in body: {e}"
-                            logger.debug(f"[JSON错误] {error_msg}")
-                            logger.debug(f"[JSON错误] 原始body错误位置附近: {repr(self.body[max(0, e.pos-20):e.pos+20])}")
-                            logger.debug(f"[JSON错误] 清理后body错误位置附近: {repr(cleaned_body[max(0, e.pos-20):e.pos+20])}")
-                            raise ValueError(error_msg)
-                        except Exception as e:
-                            # 其他错误
-                            error_msg = f"Unexpected error in JSON processing: {e}"
-                            logger.debug(f"[JSON错误] {error_msg}")
-                            raise ValueError(error_msg)
-                    elif self.body_type == "form":
-                        if "Content-Type" not in headers:
-                            headers["Content-Type"] = "application/x-www-form-urlencoded"
-                        stream_kwargs["content"] = self.body.encode('utf-8')
-                    elif self.body_type == "xml":
-                        if "Content-Type" not in headers:
-                            headers["Content-Type"] = "application/xml"
-                        stream_kwargs["content"] = self.body.encode('utf-8')
-                    else:  # text
-                        if "Content-Type" not in headers:
-                            headers["Content-Type"] = "text/plain"
-                        stream_kwargs["content"] = self.body.encode('utf-8')
-            
+            metrics.stream_started(self.metrics_client)
+            stream_kwargs = self._build_stream_kwargs(dbg)
             # 从stream_kwargs中提取参数，避免重复传递
             method = stream_kwargs.pop("method")
             url = stream_kwargs.pop("url")
-                
-            with httpx.stream(method, url, **stream_kwargs) as response:
-                
+
+            # 主机熔断中时直接失败，不排队也不发出请求
+            breaker = get_circuit_breaker(url)
+            if breaker is not None:
+                circuit = breaker.acquire()
+
+            # 按主机排队获取连接名额，排队时间单独记录，不计入连接耗时
+            host_limiter = get_host_limiter(url, stream_kwargs.get("headers"))
+            if host_limiter is not None:
+                self.timing.queue_wait = host_limiter.acquire(max_duration)
+                limiter = host_limiter
+
+            # 通过httpcore的trace扩展记录连接、TLS、发送请求和等待响应头的耗时
+            timing = self.timing
+            stream_kwargs["extensions"] = {"trace": timing.trace}
+            timing.start_request()
+
+            # 使用进程级共享连接池，复用TCP连接和TLS握手
+            with get_http_pool().stream(method, url, **stream_kwargs) as response:
+                timing.headers_received()
+                if circuit is not None:
+                    circuit.report_status(response.status_code)
                 if response.status_code != 200:
-                    # 收集详细的错误信息
-                    response_headers = dict(response.headers)
-                    response_text = ""
-                    
-                    # 尝试读取响应内容
-                    try:
-                        # 首先尝试直接读取响应文本
-                        response_text = response.text
-                        
-                        # 如果直接读取失败，尝试其他方法
-                        if not response_text:
-                            try:
-                                # 尝试读取原始字节并解码
-                                content_bytes = response.content
-                                if content_bytes:
-                                    response_text = content_bytes.decode('utf-8', errors='ignore')
-                                else:
-                                    response_text = "响应内容为空"
-                            except Exception as decode_error:
-                                response_text = f"解码响应内容失败: {str(decode_error)}"
-                                
-                    except Exception as e:
-                        # 如果所有方法都失败，尝试从流中读取
-                        try:
-                            content_bytes = b""
-                            for chunk in response.iter_bytes(chunk_size=1024):
-                                content_bytes += chunk
-                                if len(content_bytes) > 4096:  # 增加读取限制
-                                    break
-                            if content_bytes:
-                                response_text = content_bytes.decode('utf-8', errors='ignore')
-                            else:
-                                response_text = "无法从响应流中读取内容"
-                        except Exception as stream_error:
-                            response_text = f"读取响应流时出错: {str(stream_error)}, 原始错误: {str(e)}"
-                    
-                    error_details = {
-                        "status_code": response.status_code,
-                        "response_headers": response_headers,
-                        "response_text": response_text[:2000] if response_text else "空响应",  # 增加长度限制
-                        "request_url": url,
-                        "request_method": method,
-                        "request_headers": dict(stream_kwargs.get("headers", {})),
-                        "request_body": self.body[:1000] if self.body else None  # 增加长度限制
-                    }
-                    raise Exception(f"SSE连接失败，详细信息: {json.dumps(error_details, ensure_ascii=False, indent=2)}")
-                
-                event_lines = []
-                line_count = 0
-                
-                for line in response.iter_lines():
-                    # 检查超时和事件数量限制
-                    if time.time() - start_time > max_duration:
-                        logger.info(f"[SSE监听] 达到最大时长限制 {max_duration}秒，停止监听")
-                        break
-                    if event_count >= max_events:
-                        logger.info(f"[SSE监听] 达到最大事件数限制 {max_events}，停止监听")
-                        break
-                    
-                    line_count += 1
-                    line = line.strip()
-                    
-                    # 调试：输出原始行数据
-                    if line:
-                        logger.debug(f"[SSE原始行#{line_count}] {repr(line)}")
-                    else:
-                        logger.debug(f"[SSE原始行#{line_count}] <空行，事件分隔符>")
-                    
-                    # 空行表示事件结束
-                    if not line:
-                        if event_lines:
-                            logger.debug(f"[SSE事件解析] 开始解析事件，包含{len(event_lines)}行数据:")
-                            for i, event_line in enumerate(event_lines, 1):
-                                logger.debug(f"  行{i}: {repr(event_line)}")
-                            
-                            event = self.parse_sse_event(event_lines)
-                            if event:
-                                self.events.append(event)
-                                event_count += 1
-                                logger.debug(f"[SSE事件解析] 成功解析事件#{event_count}: 类型={event.event_type}, ID={event.event_id}")
-                                yield event
-                            else:
-                                logger.debug(f"[SSE事件解析] 解析结果为空，跳过此事件")
-                            event_lines = []
-                        else:
-                            logger.debug(f"[SSE事件解析] 空行但无待解析数据，跳过")
-                    else:
-                        event_lines.append(line)
-                
-                # 处理最后一个事件（如果没有以空行结尾）
-                if event_lines:
-                    logger.debug(f"[SSE事件解析] 处理最后一个事件，包含{len(event_lines)}行数据:")
-                    for i, event_line in enumerate(event_lines, 1):
-                        logger.debug(f"  行{i}: {repr(event_line)}")
-                    
-                    event = self.parse_sse_event(event_lines)
-                    if event:
-                        self.events.append(event)
-                        event_count += 1
-                        logger.debug(f"[SSE事件解析] 成功解析最后一个事件#{event_count}: 类型={event.event_type}, ID={event.event_id}")
-                        yield event
-                    else:
-                        logger.debug(f"[SSE事件解析] 最后一个事件解析结果为空，跳过")
-                
-                logger.info(f"[SSE监听] 监听结束，共处理{line_count}行原始数据，解析出{event_count}个有效事件")
-                        
-        except httpx.TimeoutException:
-            raise Exception(f"SSE连接超时（{self.timeout}秒）")
+                    raise self._status_error(response, self._read_error_text(response), method, url, stream_kwargs)
+
+                parser = SSEFrameParser(keep_raw=self.keep_raw)
+                # 没有数据到达时，由看门狗按截止时间和空闲超时关闭连接
+                watchdog.watch(response)
+                try:
+                    # 直接处理原始字节块，由增量解析器切分帧
+                    for chunk in response.iter_bytes():
+                        timing.chunk_received(len(chunk))
+                        watchdog.touch()
+                        # 数据持续涓流到达时同样按截止时间结束
+                        if watchdog.check():
+                            break
+                        yield from self._events_from_chunk(parser, chunk, dbg)
+                        if self._stopped:
+                            break
+                        timing.wait_for_chunk()
+                except httpx.TransportError:
+                    # 看门狗关闭连接导致的读取错误属于正常结束
+                    if watchdog.fired is None:
+                        raise
+                finally:
+                    watchdog.cancel()
+
+                if not self._stopped and watchdog.check():
+                    self._watchdog_stop(watchdog)
+                yield from self._finish_events(parser, dbg)
+
+        except httpx.TimeoutException as e:
+            if circuit is not None:
+                circuit.failure()
+            raise Exception(f"SSE连接超时（{self.timeout}秒）") from e
+        except httpx.RequestError as e:
+            if circuit is not None:
+                circuit.failure()
+            raise Exception(f"SSE连接错误: {str(e)}") from e
+        finally:
+            if circuit is not None:
+                circuit.release()
+            if limiter is not None:
+                limiter.release()
+            self.timing.finish()
+            metrics.stream_finished(self.metrics_client, self.timing, self.stop_reason)
+
+    async def aconnect_and_listen(self, max_events: int = 100, max_duration: int = 300,
+                                  pool: Optional[AsyncHTTPClientPool] = None) -> AsyncGenerator[SSEEvent, None]:
+        """connect_and_listen 的asyncio版本，在异步引擎的事件循环中运行，解析与输出语义相同"""
+        watchdog = StreamWatchdog(max_duration, self.idle_timeout)
+        self._begin_listen(max_events)
+        dbg = DebugLog(logger)
+        pool = pool or get_async_engine().pool
+        limiter = None
+        circuit = None  # 熔断器放行的请求，收到响应头或连接失败时报告结果
+
+        try:
+            metrics.stream_started(self.metrics_client)
+            stream_kwargs = self._build_stream_kwargs(dbg)
+            method = stream_kwargs.pop("method")
+            url = stream_kwargs.pop("url")
+
+            # 主机熔断中时直接失败，不排队也不发出请求
+            breaker = get_circuit_breaker(url)
+            if breaker is not None:
+                circuit = breaker.acquire()
+
+            host_limiter = get_host_limiter(url, stream_kwargs.get("headers"))
+            if host_limiter is not None:
+                self.timing.queue_wait = await host_limiter.aacquire(max_duration)
+                limiter = host_limiter
+
+            timing = self.timing
+            stream_kwargs["extensions"] = {"trace": timing.atrace}
+            timing.start_request()
+
+            async with pool.stream(method, url, **stream_kwargs) as response:
+                timing.headers_received()
+                if circuit is not None:
+                    circuit.report_status(response.status_code)
+                if response.status_code != 200:
+                    raise self._status_error(response, await self._aread_error_text(response), method, url, stream_kwargs)
+
+                parser = SSEFrameParser(keep_raw=self.keep_raw)
+                watchdog.awatch(response)
+                try:
+                    async for chunk in response.aiter_bytes():
+                        timing.chunk_received(len(chunk))
+                        watchdog.touch()
+                        if watchdog.check():
+                            break
+                        for event in self._events_from_chunk(parser, chunk, dbg):
+                            yield event
+                        if self._stopped:
+                            break
+                        timing.wait_for_chunk()
+                except httpx.TransportError:
+                    if watchdog.fired is None:
+                        raise
+                finally:
+                    watchdog.cancel()
+
+                if not self._stopped and watchdog.check():
+                    self._watchdog_stop(watchdog)
+                for event in self._finish_events(parser, dbg):
+                    yield event
+
+        except httpx.TimeoutException as e:
+            if circuit is not None:
+                circuit.failure()
+            raise Exception(f"SSE连接超时（{self.timeout}秒）") from e
         except httpx.RequestError as e:
-            raise Exception(f"SSE连接错误: {str(e)}")
+            if circuit is not None:
+                circuit.failure()
+            raise Exception(f"SSE连接错误: {str(e)}") from e
+        finally:
+            if circuit is not None:
+                circuit.release()
+            if limiter is not None:
+                limiter.release()
+            self.timing.finish()
+            metrics.stream_finished(self.metrics_client, self.timing, self.stop_reason)
 
 
 class DifySseNodePluginTool(Tool):
     """Dify SSE请求工具"""
     
-    def _parse_event_data(self, data: str) -> Any:
-        """尝试解析事件数据，如果是JSON格式则返回对象，否则返回原始字符串"""
-        if not data:
-            return data
-        
-        # 检查是否是JSON格式
-        data_stripped = data.strip()
-        if (data_stripped.startswith('{') and data_stripped.endswith('}')) or \
-           (data_stripped.startswith('[') and data_stripped.endswith(']')):
-            try:
-                import json as json_lib
-                parsed_data = json_lib.loads(data)
-                logger.debug(f"[数据解析] 成功解析JSON数据: {type(parsed_data)}")
-                return parsed_data
-            except json_lib.JSONDecodeError as e:
-                logger.debug(f"[数据解析] JSON解析失败: {e}, 保持原始字符串格式")
-                return data
-        else:
-            # 不是JSON格式，返回原始字符串
-            return data
-    
-    def _parse_headers(self, headers_str: str) -> Dict[str, str]:
-        """Parse headers from JSON string format to dictionary"""
-        headers = {}
-        if headers_str:
-            try:
-                # 清理字符串中的特殊字符（如\xa0不间断空格）
-                cleaned_str = headers_str.replace('\xa0', ' ').replace('\u00a0', ' ')
-                # 移除其他可能的Unicode空白字符
-                cleaned_str = ''.join(char if ord(char) < 128 or not char.isspace() else ' ' for char in cleaned_str)
-                cleaned_str = cleaned_str.strip()
-                
-                logger.debug(f"[Headers清理] 原始: {repr(headers_str)}")
-                logger.debug(f"[Headers清理] 清理后: {repr(cleaned_str)}")
-                
-                headers = json.loads(cleaned_str)
-                if not isinstance(headers, dict):
-                    raise ValueError("Headers must be a JSON object")
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Invalid JSON format for headers: {e}")
-        return headers
-    
+    @staticmethod
+    def _cancel_stream(sse_client) -> bool:
+        """调用被取消时记录停止原因，连接由监听循环的finally关闭；仍在监听时返回True"""
+        if sse_client is None or sse_client.stop_reason is not None:
+            return False
+        logger.info("[SSE监听] 调用已取消，关闭连接")
+        sse_client.stop_reason = "cancelled"
+        return True
+
     def _parse_query_params(self, params_str: str) -> Dict[str, str]:
         """Parse query parameters from JSON string format to dictionary"""
         params = {}
@@ -512,8 +596,8 @@ class DifySseNodePluginTool(Tool):
                 cleaned_str = ''.join(char if ord(char) < 128 or not char.isspace() else ' ' for char in cleaned_str)
                 cleaned_str = cleaned_str.strip()
                 
-                logger.debug(f"[Query清理] 原始: {repr(params_str)}")
-                logger.debug(f"[Query清理] 清理后: {repr(cleaned_str)}")
+                logger.debug("[Query清理] 原始: %r", params_str)
+                logger.debug("[Query清理] 清理后: %r", cleaned_str)
                 
                 params = json.loads(cleaned_str)
                 if not isinstance(params, dict):
@@ -546,11 +630,20 @@ class DifySseNodePluginTool(Tool):
     
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """执行SSE请求"""
+        invoke_start = time.time()
+        invoke_clock = time.perf_counter()  # 分阶段耗时的基准
+        time_to_first_output = None  # 从调用开始到第一条输出的耗时
         try:
+            # 按凭据中的log_level配置日志级别，同一级别只配置一次
+            credentials = getattr(getattr(self, 'runtime', None), 'credentials', None) or {}
+            configure_log_level(credentials.get('log_level', 'INFO'))
+            
             # 控制台日志：输出入参
             logger.debug("=" * 80)
             logger.info("[工具调用] DifySseNodePluginTool._invoke 开始执行")
-            logger.debug(f"[入参] 原始参数: {json.dumps(tool_parameters, ensure_ascii=False, indent=2)}")
+            dbg = DebugLog(logger)  # 日志级别确定后创建，DEBUG关闭时不构造任何调试字符串
+            if dbg.enabled:
+                logger.debug(f"[入参] 原始参数: {json.dumps(tool_parameters, ensure_ascii=False, indent=2)}")
             
             # 获取参数
             url = tool_parameters.get('url', '').strip()
@@ -564,96 +657,184 @@ class DifySseNodePluginTool(Tool):
             timeout = int(tool_parameters.get('timeout', 30))
             max_events = int(tool_parameters.get('max_events', 100))
             max_duration = int(tool_parameters.get('max_duration', 300))
+            idle_timeout = float(tool_parameters.get('idle_timeout') or 0)
+            include_raw_data = bool(tool_parameters.get('include_raw_data', False))
+            # 输出模式：batch（结束后统一输出）或 stream（事件到达即实时转发）
+            output_mode = tool_parameters.get('output_mode', 'batch') or 'batch'
+            stream_output = output_mode == 'stream'
+            # 事件保留策略与字节预算（MB），超出预算的事件按策略丢弃
+            retention_policy = tool_parameters.get('retention_policy', 'keep_first') or 'keep_first'
+            retention_max_mb = float(tool_parameters.get('retention_max_mb', 32) or 32)
+            terminal_conditions_str = tool_parameters.get('terminal_conditions', '') or ''
             
             # 控制台日志：输出解析后的参数
-            logger.debug(f"[参数解析] URL: {url}")
-            logger.debug(f"[参数解析] Method: {method}")
-            logger.debug(f"[参数解析] Headers字符串: {headers_str}")
-            logger.debug(f"[参数解析] Query参数字符串: {query_params_str}")
-            logger.debug(f"[参数解析] Body长度: {len(body) if body else 0}")
-            logger.debug(f"[参数解析] Body类型: {body_type}")
-            logger.debug(f"[参数解析] Body前200字符: {repr(body[:200]) if body else 'None'}")
-            logger.debug(f"[参数解析] Timeout: {timeout}, Max Events: {max_events}, Max Duration: {max_duration}")
+            if dbg.enabled:
+                logger.debug(f"[参数解析] URL: {url}")
+                logger.debug(f"[参数解析] Method: {method}")
+                logger.debug(f"[参数解析] Headers字符串: {headers_str}")
+                logger.debug(f"[参数解析] Query参数字符串: {query_params_str}")
+                logger.debug(f"[参数解析] Body长度: {len(body) if body else 0}")
+                logger.debug(f"[参数解析] Body类型: {body_type}")
+                logger.debug(f"[参数解析] Body前200字符: {repr(body[:200]) if body else 'None'}")
+                logger.debug(f"[参数解析] Timeout: {timeout}, Max Events: {max_events}, Max Duration: {max_duration}, Idle Timeout: {idle_timeout}")
+                logger.debug(f"[参数解析] Output Mode: {output_mode}")
+                logger.debug(f"[参数解析] Retention: {retention_policy}, {retention_max_mb}MB")
             
             # 验证必需参数
-            logger.debug(f"[URL验证] 开始验证URL: {url}")
+            dbg.debug("[URL验证] 开始验证URL: %s", url)
             self._validate_url(url)
-            logger.debug(f"[URL验证] URL验证通过")
+            dbg.debug("[URL验证] URL验证通过")
             
             # 解析headers和查询参数
-            logger.debug(f"[Headers解析] 开始解析Headers: {headers_str}")
-            headers = self._parse_headers(headers_str)
-            logger.debug(f"[Headers解析] Headers解析结果: {json.dumps(headers, ensure_ascii=False, indent=2)}")
+            dbg.debug("[Headers解析] 开始解析Headers: %s", headers_str)
+            headers = parse_headers(headers_str)
+            dbg.debug("[Headers解析] Headers解析结果: %s", headers)
             
-            logger.debug(f"[Query解析] 开始解析Query参数: {query_params_str}")
+            dbg.debug("[Query解析] 开始解析Query参数: %s", query_params_str)
             query_params = self._parse_query_params(query_params_str)
-            logger.debug(f"[Query解析] Query参数解析结果: {json.dumps(query_params, ensure_ascii=False, indent=2)}")
+            dbg.debug("[Query解析] Query参数解析结果: %s", query_params)
+            
+            terminal_conditions = TerminalConditions.parse(terminal_conditions_str)
+            dbg.debug("[终止条件] 解析结果: %s", terminal_conditions_str or '无')
             
             # 构建完整URL
-            logger.debug(f"[URL构建] 开始构建完整URL")
+            dbg.debug("[URL构建] 开始构建完整URL")
             full_url = self._build_url_with_params(url, query_params)
-            logger.debug(f"[URL构建] 完整URL: {full_url}")
+            dbg.debug("[URL构建] 完整URL: %s", full_url)
             
             # 调试信息只在控制台输出，不作为工具结果返回
-            logger.debug(f"[调试信息] 解析后的参数:")
-            logger.debug(f"  - URL: {full_url}")
-            logger.debug(f"  - Method: {method}")
-            logger.debug(f"  - Headers: {json.dumps(headers, ensure_ascii=False)}")
-            logger.debug(f"  - Body长度: {len(body) if body else 0}")
-            logger.debug(f"  - 超时设置: {timeout}秒, 最大事件: {max_events}, 最大时长: {max_duration}秒")
+            if dbg.enabled:
+                logger.debug(f"[调试信息] 解析后的参数:")
+                logger.debug(f"  - URL: {full_url}")
+                logger.debug(f"  - Method: {method}")
+                logger.debug(f"  - Headers: {json.dumps(headers, ensure_ascii=False)}")
+                logger.debug(f"  - Body长度: {len(body) if body else 0}")
+                logger.debug(f"  - 超时设置: {timeout}秒, 最大事件: {max_events}, 最大时长: {max_duration}秒, 空闲超时: {idle_timeout}秒")
             
             # 尝试连接SSE服务器
             logger.info(f"[SSE连接] 开始尝试连接SSE服务器")
             connection_successful = False
             last_error = None
-            retry_attempts = 3  # 固定重试次数
-            all_events = []  # 收集所有事件
+            # 调用级截止时间：连接、重试等待和流式读取共享，在运行时强制结束调用之前返回部分结果
+            deadline = InvocationDeadline(max_duration)
+            if deadline.capped:
+                logger.info(f"[时间预算] max_duration={max_duration}秒超过运行时上限，调用截止时间为{deadline.budget:g}秒后")
+            retry_policy = RetryPolicy(total_budget=deadline.budget)  # 指数退避重试，只重试暂时性故障
+            # 按字节预算保留事件，每个事件只保存一份
+            retention = EventRetention(retention_policy, int(retention_max_mb * 1024 * 1024))
+            event_count = 0
+            # 跨重试的续传与去重状态：记住最多 max_events 个事件ID，整个重放范围内的重复事件都能识别
+            resume_state = ResumeState(max_ids=max_events)
+            sse_client = None
+            cancelled = False  # 监听过程中调用被取消
+            # SSE_ENGINE=async 时在共享事件循环中读取流，否则使用同步引擎
+            engine = get_async_engine() if engine_from_env() == "async" else None
             
-            for attempt in range(retry_attempts + 1):
+            for attempt in range(retry_policy.max_attempts):
                 try:
-                    logger.debug(f"[SSE连接] 第{attempt + 1}次尝试连接")
+                    retry_policy.begin_attempt()
+                    dbg.debug("[SSE连接] 第%d次尝试连接", attempt + 1)
+                    resume_from = resume_state.begin_attempt(attempt)
+                    if resume_from:
+                        logger.info(f"[SSE续传] 携带Last-Event-ID={resume_from}重连，已收到{event_count}个事件")
+                    elif attempt > 0:
+                        # 流中没有事件ID，无法续传，丢弃上次的部分结果整体重放
+                        logger.info(f"[SSE续传] 无可用事件ID，整体重放，丢弃已收到的{event_count}个事件")
+                        retention.clear()
+                        event_count = 0
                     # 创建SSE客户端
-                    sse_client = SSEClient(full_url, method, headers, body, body_type, timeout)
-                    logger.debug(f"[SSE连接] SSE客户端创建成功")
+                    sse_client = SSEClient(full_url, method, headers, body, body_type,
+                                           deadline.attempt_timeout(timeout), keep_raw=include_raw_data,
+                                           last_event_id=resume_from, terminal_conditions=terminal_conditions,
+                                           idle_timeout=idle_timeout, resume_state=resume_state)
+                    dbg.debug("[SSE连接] SSE客户端创建成功")
                     
                     # 连接并监听事件
                     logger.info(f"[SSE连接] 开始连接并监听事件")
                     start_time = time.time()
-                    event_count = 0
                     
                     # 收集所有事件到数组中
-                    for event in sse_client.connect_and_listen(max_events, max_duration):
-                        event_count += 1
-                        # 尝试解析data字段，如果是JSON则转换为对象
-                        parsed_data = self._parse_event_data(event.data)
+                    if engine is not None:
+                        events = engine.iterate(sse_client.aconnect_and_listen(max_events - event_count, deadline.remaining()))
+                    else:
+                        events = sse_client.connect_and_listen(max_events - event_count, deadline.remaining())
+                    try:
+                        for event in events:
+                            event_count += 1
+                            if event.retry:
+                                # 服务端下发的重连时间作为后续重试的退避基数
+                                retry_policy.server_retry_ms = event.retry
+                            # data字段在解析阶段已解码，直接使用解码后的对象
+                            parsed_data = event.parsed
                         
-                        event_info = {
-                            "event_number": event_count,
-                            "event_type": event.event_type,
-                            "data": parsed_data,  # 使用解析后的数据
-                            "event_id": event.event_id,
-                            "timestamp": event.timestamp,
-                            "retry": event.retry
-                        }
-                        all_events.append(event_info)
-                        logger.debug(f"[事件收集] 收集到第{event_count}个事件: {event.event_type}, 数据类型: {type(parsed_data)}")
+                            # 保留紧凑的事件对象本身，输出用的字典在结束时才生成
+                            event.number = event_count
+                            if not retention.add(event, event.size):
+                                dbg.debug("[事件保留] 按%s策略丢弃第%d个事件，大小%d字节", retention_policy, event_count, event.size)
+                            if dbg.sampled():
+                                logger.debug("[事件收集] 收集到第%d个事件（每%d个采样一次）: %s, 数据类型: %s",
+                                             event_count, dbg.sample_every, event.event_type, type(parsed_data).__name__)
+                        
+                            # 流式模式：事件到达即转发，每个事件的data占一行
+                            if stream_output:
+                                if time_to_first_output is None:
+                                    time_to_first_output = round(time.time() - invoke_start, 3)
+                                    logger.info(f"[流式输出] 首个输出耗时: {time_to_first_output}秒")
+                                yield self.create_stream_variable_message("stream_output", event.data + "\n")
+                    except GeneratorExit:
+                        # 调用被取消：先记下停止原因，再由finally关闭连接
+                        cancelled = self._cancel_stream(sse_client)
+                        raise
+                    finally:
+                        # 提前结束（break）或出错时立即关闭生成器：释放连接、限流名额和看门狗，异步引擎停止读取
+                        events.close()
                     
+                    # 异步引擎中生成器在引擎线程里收尾，这里先记录读取结束的时间
+                    sse_client.timing.finish()
+                    if sse_client.stop_reason == MAX_DURATION and deadline.capped:
+                        sse_client.stop_reason = "deadline"
+                        logger.warning(f"[时间预算] 达到调用截止时间，返回已收到的{event_count}个事件")
                     connection_successful = True
+                    retry_policy.record_success()
                     end_time = time.time()
                     duration = end_time - start_time
                     
+                    # 连接池统计，用于确认连接是否被复用
+                    pool_stats = (engine.pool if engine is not None else get_http_pool()).stats(full_url)
+                    logger.info(f"[连接池] 统计: {pool_stats}")
+                    
+                    if time_to_first_output is None:
+                        time_to_first_output = round(time.time() - invoke_start, 3)
+                    
+                    # 分阶段耗时：连接、响应头、首事件、网络等待、解析与下游处理，以及事件间隔
+                    timing = sse_client.timing.to_dict(invoke_clock)
+                    logger.info(f"[耗时分解] 连接{timing['connect_ms']}ms，响应头{timing['time_to_headers_ms']}ms，"
+                                f"首事件{timing['time_to_first_event_ms']}ms，网络等待{timing['network_wait_ms']}ms，"
+                                f"解析{timing['parse_ms']}ms，下游处理{timing['consumer_ms']}ms")
+                    
                     # 构建最终结果对象，不包含events字段（已通过events_stream变量提供）
                     final_result = {
                         "status": "completed",
                         "total_events": event_count,
                         "connection_duration": round(duration, 2),
+                        "time_to_first_output": time_to_first_output,
+                        "timing": timing,
+                        "stop_reason": sse_client.stop_reason,
+                        "terminal_condition": sse_client.terminal_match,
+                        "pool_stats": pool_stats,
+                        "resume": resume_state.to_dict(),
+                        "retention": retention.stats(),
+                        "attempts": retry_policy.attempts,
+                        "deadline": deadline.to_dict(),
                         "summary": f"SSE连接成功，接收到{event_count}个事件，耗时{duration:.2f}秒"
                     }
                     
                     # 构建文本摘要
-                    text_summary = f"SSE连接成功完成\n连接URL: {full_url}\n接收事件数: {event_count}\n连接时长: {duration:.2f}秒\n连接状态: 成功"
+                    text_summary = f"SSE连接成功完成\n连接URL: {full_url}\n接收事件数: {event_count}\n连接时长: {duration:.2f}秒\n结束原因: {sse_client.stop_reason}\n连接状态: 成功"
+                    
+                    dbg.debug("[最终结果] 构建完成，保留%d个事件，%s", len(retention), retention.stats())
                     
-                    logger.debug(f"[最终结果] 构建完成，包含{len(all_events)}个事件")
+                    metrics.invocation_finished("dify_sse_node_plugin", "completed", time.time() - invoke_start, retry_policy.attempts)
                     
                     # 返回JSON结果
                     yield self.create_json_message(final_result)
@@ -662,7 +843,7 @@ class DifySseNodePluginTool(Tool):
                     yield self.create_text_message(text_summary)
                     
                     # 返回自定义变量 - 事件流数组
-                    yield self.create_variable_message("events_stream", all_events)
+                    yield self.create_variable_message("events_stream", [e.to_dict(include_raw_data) for e in retention.events])
                     
                     # 返回自定义变量 - 连接状态
                     yield self.create_variable_message("connection_status", "completed")
@@ -673,33 +854,59 @@ class DifySseNodePluginTool(Tool):
                     # 返回自定义变量 - 连接时长
                     yield self.create_variable_message("connection_duration", round(duration, 2))
                     
+                    # 返回自定义变量 - 首个输出耗时
+                    yield self.create_variable_message("time_to_first_output", time_to_first_output)
+                    
+                    # 返回自定义变量 - 分阶段耗时
+                    yield self.create_variable_message("timing", timing)
+                    
+                    # 返回自定义变量 - 监听结束原因
+                    yield self.create_variable_message("stop_reason", sse_client.stop_reason)
+                    
                     break
                     
+                except GeneratorExit:
+                    # 调用方提前关闭了工具生成器（如工作流被取消）：立即断开连接，不等垃圾回收
+                    if cancelled:
+                        metrics.invocation_finished("dify_sse_node_plugin", "cancelled", time.time() - invoke_start,
+                                                    retry_policy.attempts)
+                    raise
                 except Exception as e:
                     last_error = str(e)
+                    retry_delay = retry_policy.record_failure(e)
                     logger.warning(f"[SSE错误] 第{attempt + 1}次尝试失败: {last_error}")
-                    if attempt < retry_attempts:
-                        logger.info(f"[SSE重试] 等待2秒后进行第{attempt + 2}次重试...")
-                        time.sleep(2)  # 等待2秒后重试
-                    else:
-                        logger.error(f"[SSE错误] 所有重试都失败了")
+                    if stream_output and time_to_first_output is not None and not resume_state.last_event_id:
+                        # 已有事件实时输出且无法续传，整体重放会重复输出，直接结束
+                        logger.error(f"[SSE错误] 流式输出已开始且无法续传，不再重试")
+                        break
+                    if retry_delay is None:
+                        logger.error(f"[SSE错误] 不再重试: {retry_policy.attempts[-1]['give_up_reason']}")
                         break
+                    logger.info(f"[SSE重试] 等待{retry_delay:.2f}秒后进行第{attempt + 2}次重试...")
+                    time.sleep(retry_delay)
             
             # 如果所有重试都失败了
             if not connection_successful:
                 logger.error(f"[SSE错误] 连接最终失败，错误: {last_error}")
                 final_result = {
                     "status": "failed",
-                    "total_events": 0,
+                    # 截止时间到达或放弃重试前已收到的部分结果
+                    "total_events": event_count,
                     "connection_duration": 0,
-                    "summary": f"SSE连接失败，重试{retry_attempts + 1}次后仍无法连接",
-                    "error": last_error or "未知错误"
+                    "summary": f"SSE连接失败，尝试{len(retry_policy.attempts)}次后仍无法连接",
+                    "error": last_error or "未知错误",
+                    "attempts": retry_policy.attempts,
+                    "deadline": deadline.to_dict(),
+                    # 最后一次尝试的分阶段耗时，用于判断卡在连接还是等待响应
+                    "timing": sse_client.timing.to_dict(invoke_clock) if sse_client else None
                 }
                 
                 # 构建失败文本摘要
-                text_summary = f"SSE连接失败\n连接URL: {full_url}\n错误信息: {last_error or '未知错误'}\n重试次数: {retry_attempts + 1}\n连接状态: 失败"
+                text_summary = f"SSE连接失败\n连接URL: {full_url}\n错误信息: {last_error or '未知错误'}\n尝试次数: {len(retry_policy.attempts)}\n连接状态: 失败"
                 
-                logger.debug(f"[出参] 输出错误结果")
+                dbg.debug("[出参] 输出错误结果")
+                
+                metrics.invocation_finished("dify_sse_node_plugin", "failed", time.time() - invoke_start, retry_policy.attempts)
                 
                 # 返回JSON结果
                 yield self.create_json_message(final_result)
@@ -707,17 +914,20 @@ class DifySseNodePluginTool(Tool):
                 # 返回文本摘要
                 yield self.create_text_message(text_summary)
                 
-                # 返回自定义变量 - 空事件流
-                yield self.create_variable_message("events_stream", [])
+                # 返回自定义变量 - 已收到的部分事件
+                yield self.create_variable_message("events_stream", [e.to_dict(include_raw_data) for e in retention.events])
                 
                 # 返回自定义变量 - 连接状态
                 yield self.create_variable_message("connection_status", "failed")
                 
                 # 返回自定义变量 - 事件总数
-                yield self.create_variable_message("total_events", 0)
+                yield self.create_variable_message("total_events", event_count)
                 
                 # 返回自定义变量 - 连接时长
                 yield self.create_variable_message("connection_duration", 0)
+                
+                # 返回自定义变量 - 分阶段耗时
+                yield self.create_variable_message("timing", final_result["timing"])
             
             logger.info(f"[工具调用] DifySseNodePluginTool._invoke 执行完成")
             logger.debug("=" * 80)
@@ -725,6 +935,7 @@ class DifySseNodePluginTool(Tool):
         except Exception as e:
             # 处理参数验证或其他错误
             error_msg = f"参数错误或系统错误: {str(e)}"
+            metrics.invocation_finished("dify_sse_node_plugin", "error", time.time() - invoke_start)
             logger.error(f"[系统错误] {error_msg}")
             final_result = {
                 "status": "error",
@@ -737,7 +948,7 @@ class DifySseNodePluginTool(Tool):
             # 构建错误文本摘要
             text_summary = f"SSE工具执行错误\n错误信息: {error_msg}\n连接状态: 错误"
             
-            logger.debug(f"[出参] 输出系统错误结果")
+            logger.debug("[出参] 输出系统错误结果")
             
             # 返回JSON结果
             yield self.create_json_message(final_result)
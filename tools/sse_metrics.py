@@ -0,0 +1,30 @@
+import json
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.metrics import REGISTRY
+
+
+class SSEMetricsTool(Tool):
+    """返回插件进程内的指标，用于诊断"""
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        output_format = tool_parameters.get('format', 'prometheus') or 'prometheus'
+        text = REGISTRY.render()
+        snapshot = REGISTRY.snapshot()
+        # 配置了SSE_METRICS_FILE时顺便写出一次，不受节流间隔限制
+        metrics_file = REGISTRY.maybe_dump(force=True)
+
+        yield self.create_json_message({
+            "status": "completed" if REGISTRY.enabled else "disabled",
+            "metrics": snapshot,
+            "metrics_file": metrics_file,
+        })
+        if output_format == 'json':
+            yield self.create_text_message(json.dumps(snapshot, ensure_ascii=False, indent=2))
+        else:
+            yield self.create_text_message(text)
+        yield self.create_variable_message("metrics_text", text)
@@ -0,0 +1 @@
+# SSE工具共享的辅助模块（连接池、解析器等），供tools下的各个工具复用
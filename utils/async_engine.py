@@ -0,0 +1,223 @@
+"""
+asyncio SSE引擎
+
+多个长连接SSE流共享一个事件循环：事件循环运行在独立的原生线程中，流的读取和解析都以协程方式
+进行，空闲的流只占用一个socket和一个挂起的协程，不再各自占用一个线程。同步的 _invoke 生成器通过
+AsyncSSEEngine.iterate 消费客户端 aconnect_and_listen 产出的事件，解析与输出语义与同步引擎一致。
+
+dify_plugin 导入时做了 gevent monkey patch，asyncio 在同一个系统线程中只允许运行一个事件循环，
+无法在每个调用协程里各建一个循环，所以统一交给引擎线程；调用方通过 gevent 的跨线程 Event 等待，
+等待期间不会阻塞插件的其他请求。
+
+通过环境变量 SSE_ENGINE=async 启用，默认仍使用同步引擎（sync）。
+"""
+import asyncio
+import atexit
+import collections
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, Optional, TypeVar
+
+from utils.http_pool import AsyncHTTPClientPool, PoolConfig
+from utils.native import original
+
+try:
+    from gevent.event import Event as _WakeEvent
+    from gevent.threadpool import ThreadPoolExecutor as _NativeExecutor
+except ImportError:  # pragma: no cover - 未安装gevent时直接使用标准库
+    from concurrent.futures import ThreadPoolExecutor as _NativeExecutor
+    _WakeEvent = threading.Event
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ENGINES = ("sync", "async")
+DEFAULT_MAX_BUFFER = 256
+
+
+def engine_from_env() -> str:
+    """从环境变量 SSE_ENGINE 读取引擎类型，无效值回退到 sync"""
+    engine = os.getenv("SSE_ENGINE", "sync").strip().lower()
+    return engine if engine in ENGINES else "sync"
+
+
+class AsyncSSEEngine:
+    """在独立原生线程中运行的共享事件循环及其异步连接池"""
+
+    def __init__(self, config: Optional[PoolConfig] = None, max_buffer: int = DEFAULT_MAX_BUFFER):
+        self.config = config or PoolConfig.from_env()
+        # 每个流在引擎侧最多缓冲的事件数，调用方消费变慢时读取协程暂停，形成背压
+        self.max_buffer = max(1, max_buffer)
+        self._pool: Optional[AsyncHTTPClientPool] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> AsyncHTTPClientPool:
+        """引擎事件循环使用的异步连接池，只能在引擎循环中的协程里发起请求"""
+        self._ensure_started()
+        return self._pool
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """首次使用时启动引擎线程"""
+        loop = self._loop
+        if loop is not None:
+            return loop
+        with self._lock:
+            if self._loop is None:
+                ready = _WakeEvent()
+                self._stopped = original('_thread', 'allocate_lock')()
+                self._stopped.acquire()
+                original('_thread', 'start_new_thread')(self._run, (ready,))
+                ready.wait()
+                logger.info("[异步引擎] 事件循环线程已启动")
+            return self._loop
+
+    def _run(self, ready) -> None:
+        loop = asyncio.new_event_loop()
+        # DNS解析等阻塞调用放到原生线程池，默认执行器的线程被patch后不会被调度
+        executor = _NativeExecutor(max_workers=4)
+        loop.set_default_executor(executor)
+        asyncio.set_event_loop(loop)
+        self._pool = AsyncHTTPClientPool(self.config)
+        self._loop = loop
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                loop.run_until_complete(self._pool.aclose())
+                executor.shutdown(wait=False)
+                loop.close()
+            finally:
+                self._stopped.release()
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """在引擎事件循环中运行协程并等待结果，只挂起当前调用"""
+        loop = self._ensure_started()
+        done = _WakeEvent()
+        box: Dict[str, Any] = {}
+
+        def on_done(task: asyncio.Task) -> None:
+            if task.cancelled():
+                box["error"] = asyncio.CancelledError()
+            elif task.exception() is not None:
+                box["error"] = task.exception()
+            else:
+                box["result"] = task.result()
+            done.set()
+
+        def start() -> None:
+            box["task"] = loop.create_task(coro)
+            box["task"].add_done_callback(on_done)
+
+        loop.call_soon_threadsafe(start)
+        try:
+            if not done.wait(timeout):
+                raise TimeoutError(f"异步任务在 {timeout} 秒内未完成")
+        except BaseException:
+            if not done.is_set():
+                self._call_soon(loop, lambda: box["task"].cancel())
+            raise
+        if "error" in box:
+            raise box["error"]
+        return box["result"]
+
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """同步迭代异步生成器：在引擎循环中读取，经有界缓冲交给调用方；提前结束时取消读取协程"""
+        loop = self._ensure_started()
+        items: collections.deque = collections.deque()
+        wake = _WakeEvent()
+        state: Dict[str, Any] = {"done": False, "error": None, "space": None, "task": None}
+
+        async def pump() -> None:
+            try:
+                async for item in agen:
+                    items.append(item)
+                    wake.set()
+                    if len(items) >= self.max_buffer:
+                        space = loop.create_future()
+                        state["space"] = space
+                        # 赋值后再检查一次，调用方可能已在赋值前取走了事件
+                        if len(items) >= self.max_buffer:
+                            await space
+            except asyncio.CancelledError:
+                pass
+            except BaseException as e:
+                state["error"] = e
+            finally:
+                try:
+                    await agen.aclose()
+                finally:
+                    state["done"] = True
+                    wake.set()
+
+        def start() -> None:
+            state["task"] = loop.create_task(pump())
+
+        def release(space: asyncio.Future) -> None:
+            if not space.done():
+                space.set_result(None)
+
+        loop.call_soon_threadsafe(start)
+        try:
+            while True:
+                wake.clear()
+                while items:
+                    item = items.popleft()
+                    space = state["space"]
+                    if space is not None:
+                        state["space"] = None
+                        loop.call_soon_threadsafe(release, space)
+                    yield item
+                if state["done"]:
+                    if items:
+                        continue
+                    if state["error"] is not None:
+                        raise state["error"]
+                    return
+                wake.wait()
+        finally:
+            if not state["done"]:
+                self._call_soon(loop, lambda: state["task"].cancel())
+
+    @staticmethod
+    def _call_soon(loop: asyncio.AbstractEventLoop, callback) -> None:
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def close(self, timeout: float = 5.0) -> None:
+        """取消所有流，关闭连接池并停止引擎线程"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        def shutdown() -> None:
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+            loop.stop()
+
+        self._call_soon(loop, shutdown)
+        self._stopped.acquire(timeout=timeout)
+        logger.info("[异步引擎] 事件循环线程已停止")
+
+
+_engine: Optional[AsyncSSEEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncSSEEngine:
+    """获取进程级共享的异步引擎"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AsyncSSEEngine()
+                atexit.register(_engine.close)
+    return _engine
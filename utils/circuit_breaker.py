@@ -0,0 +1,198 @@
+"""
+按主机的熔断器
+
+Dify API 主机宕机时，每个调用仍要完成4次尝试、约6秒的退避等待和若干次连接超时才返回失败，
+并发的工作流越多，浪费的时间和连接越多。熔断器按主机统计最近的请求结果：
+- closed：正常放行；窗口内请求数达到 min_requests 且失败率达到 failure_rate 时转为 open
+- open：直接拒绝（CircuitOpenError，不重试），open_seconds 秒后转为 half_open
+- half_open：只放行一个试探请求，成功则恢复 closed 并清空窗口，失败则重新 open；试探进行中的其他请求直接拒绝
+
+只有主机不健康的信号计为失败：连接/读取错误、超时、5xx 和 429；其他HTTP响应（包括4xx）说明主机可用，计为成功。
+结果在收到响应头时报告，试探请求不需要等整个流结束。没有产生结果的请求（如被限流拒绝、调用被取消）不计入。
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+from utils import metrics
+from utils.host_limiter import limiter_key
+from utils.native import original
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BreakerConfig:
+    """熔断配置，可通过环境变量覆盖默认值"""
+
+    def __init__(self, enabled: bool = True, failure_rate: float = 0.5, min_requests: int = 5,
+                 window: float = 60.0, open_seconds: float = 30.0):
+        self.enabled = enabled
+        self.failure_rate = failure_rate
+        self.min_requests = max(1, min_requests)
+        # 统计最近 window 秒内的请求结果
+        self.window = window
+        self.open_seconds = open_seconds
+
+    @classmethod
+    def from_env(cls) -> "BreakerConfig":
+        """从环境变量读取配置"""
+        return cls(
+            enabled=os.getenv("SSE_BREAKER", "1").strip().lower() not in ("0", "false", "off"),
+            failure_rate=float(os.getenv("SSE_BREAKER_FAILURE_RATE", "0.5")),
+            min_requests=int(os.getenv("SSE_BREAKER_MIN_REQUESTS", "5")),
+            window=float(os.getenv("SSE_BREAKER_WINDOW", "60")),
+            open_seconds=float(os.getenv("SSE_BREAKER_OPEN_SECONDS", "30")),
+        )
+
+
+class CircuitOpenError(Exception):
+    """主机熔断中，请求未发出"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_failure_status(status_code: int) -> bool:
+    """说明主机不健康的响应状态"""
+    return status_code >= 500 or status_code == 429
+
+
+class CircuitTicket:
+    """一次被放行的请求，只报告一次结果"""
+
+    __slots__ = ("_breaker", "probe", "_done")
+
+    def __init__(self, breaker: "CircuitBreaker", probe: bool):
+        self._breaker = breaker
+        self.probe = probe
+        self._done = False
+
+    def _report(self, failed: Optional[bool]) -> None:
+        if not self._done:
+            self._done = True
+            self._breaker._record(failed, self.probe)
+
+    def report_status(self, status_code: int) -> None:
+        self._report(is_failure_status(status_code))
+
+    def failure(self) -> None:
+        self._report(True)
+
+    def release(self) -> None:
+        """没有产生结果就结束：不计入统计，试探请求让出名额"""
+        self._report(None)
+
+
+class CircuitBreaker:
+    """一个主机的熔断状态和最近的请求结果"""
+
+    def __init__(self, key: str, config: BreakerConfig):
+        self.key = key
+        self.config = config
+        self.state = CLOSED
+        self._lock = original('_thread', 'allocate_lock')()
+        # (时间, 是否失败)
+        self._results: Deque[Tuple[float, bool]] = collections.deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _transition(self, state: str, detail: str) -> None:
+        """持有锁时调用"""
+        previous, self.state = self.state, state
+        metrics.circuit_transition(self.key, state)
+        log = logger.warning if state == OPEN else logger.info
+        log(f"[熔断] {self.key}: {previous} -> {state}，{detail}")
+
+    def _prune(self, now: float) -> None:
+        results = self._results
+        while results and results[0][0] < now - self.config.window:
+            self._failures -= results.popleft()[1]
+
+    def acquire(self, now: Optional[float] = None) -> CircuitTicket:
+        """请求发出前调用；熔断中抛出 CircuitOpenError"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.state == OPEN:
+                wait = self._opened_at + self.config.open_seconds - now
+                if wait > 0:
+                    metrics.circuit_rejected(self.key)
+                    raise CircuitOpenError(f"主机 {self.key} 熔断中，{wait:.1f}秒后再试探", wait)
+                self._transition(HALF_OPEN, "放行一个试探请求")
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    metrics.circuit_rejected(self.key)
+                    raise CircuitOpenError(f"主机 {self.key} 熔断中，等待试探请求的结果")
+                self._probing = True
+                return CircuitTicket(self, probe=True)
+        return CircuitTicket(self, probe=False)
+
+    def _record(self, failed: Optional[bool], probe: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if probe:
+                self._probing = False
+                if failed is None or self.state != HALF_OPEN:
+                    return
+                if failed:
+                    self._opened_at = now
+                    self._transition(OPEN, f"试探失败，{self.config.open_seconds:g}秒后再试探")
+                else:
+                    self._results.clear()
+                    self._failures = 0
+                    self._transition(CLOSED, "试探成功")
+                return
+            if failed is None or self.state != CLOSED:
+                # 熔断之前放行、之后才返回的请求不再影响状态
+                return
+            self._results.append((now, failed))
+            self._failures += failed
+            self._prune(now)
+            total = len(self._results)
+            if failed and total >= self.config.min_requests and self._failures / total >= self.config.failure_rate:
+                self._opened_at = now
+                self._transition(OPEN, f"最近{self.config.window:g}秒内{total}个请求失败{self._failures}个，"
+                                       f"{self.config.open_seconds:g}秒后再试探")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {"state": self.state, "requests": len(self._results), "failures": self._failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_config: Optional[BreakerConfig] = None
+
+
+def get_circuit_breaker(url: str) -> Optional[CircuitBreaker]:
+    """获取目标主机的熔断器；关闭熔断时返回None"""
+    global _config
+    if _config is None:
+        _config = BreakerConfig.from_env()
+    if not _config.enabled:
+        return None
+    key = limiter_key(url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(key, _config)
+    return breaker
+
+
+def configure(config: Optional[BreakerConfig]) -> None:
+    """替换熔断配置并丢弃已有的熔断状态，传None时下次使用前重新读取环境变量"""
+    global _config
+    with _breakers_lock:
+        _config = config
+        _breakers.clear()
@@ -0,0 +1,44 @@
+"""
+热路径上的调试日志
+
+f-string 在调用 logger.debug 之前就完成了格式化，即使级别是INFO也要付出代价。
+DebugLog 在一次调用/连接开始时检查一次DEBUG是否开启，之后热循环中只判断一个布尔值；
+逐事件的跟踪日志按 1/N 采样，生产环境开启DEBUG也不会拖垮吞吐。
+
+采样间隔可通过环境变量 SSE_DEBUG_SAMPLE_EVERY 配置，默认每100个事件记录一次，设为1则全部记录。
+"""
+import logging
+import os
+from typing import Any, Optional
+
+DEFAULT_SAMPLE_EVERY = 100
+
+
+def _sample_every_from_env() -> int:
+    try:
+        return max(1, int(os.getenv("SSE_DEBUG_SAMPLE_EVERY", DEFAULT_SAMPLE_EVERY)))
+    except ValueError:
+        return DEFAULT_SAMPLE_EVERY
+
+
+class DebugLog:
+    """按需构造的调试日志，创建时确定DEBUG是否开启"""
+    __slots__ = ("logger", "enabled", "sample_every", "_count")
+
+    def __init__(self, logger: logging.Logger, sample_every: Optional[int] = None):
+        self.logger = logger
+        self.enabled = logger.isEnabledFor(logging.DEBUG)
+        self.sample_every = max(1, sample_every) if sample_every else _sample_every_from_env()
+        self._count = 0
+
+    def debug(self, msg: str, *args: Any) -> None:
+        """%风格的延迟格式化，DEBUG关闭时不做任何格式化"""
+        if self.enabled:
+            self.logger.debug(msg, *args)
+
+    def sampled(self) -> bool:
+        """DEBUG开启时每sample_every次返回一次True（第1次总是返回True）"""
+        if not self.enabled:
+            return False
+        self._count += 1
+        return self._count % self.sample_every == 1 or self.sample_every == 1
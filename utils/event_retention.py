@@ -0,0 +1,83 @@
+"""
+按字节预算保留事件
+
+manifest.yaml 将插件内存限制为256MB，几个很大的 node_finished 载荷就可能导致OOM。
+每个事件只保存一份（输出用的事件字典），总大小按 data 载荷字节数计算，超出预算时按策略丢弃：
+    keep_first   保留最早的事件，超出预算后的事件丢弃（默认，与原有行为一致）
+    keep_last    环形缓冲，保留最近的事件，淘汰最早的事件
+    key_events   只保留关键事件（由调用方判定），超出预算时淘汰最早的关键事件
+"""
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+RETENTION_POLICIES = ("keep_first", "keep_last", "key_events")
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class EventRetention:
+    """有字节预算的事件存储"""
+
+    def __init__(self, policy: str = "keep_first", max_bytes: int = DEFAULT_MAX_BYTES,
+                 is_key_event: Optional[Callable[[Any], bool]] = None):
+        if policy not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {policy}")
+        if policy == "key_events" and is_key_event is None:
+            raise ValueError("Retention policy key_events requires a key event filter")
+        self.policy = policy
+        self.max_bytes = max_bytes
+        self.is_key_event = is_key_event
+        self._items: Deque[Tuple[Any, int]] = deque()
+        self.retained_bytes = 0
+        self.dropped_events = 0
+        self.dropped_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: Any, size: int) -> bool:
+        """保存一个事件，返回是否被保留"""
+        if self.policy == "key_events" and not self.is_key_event(item):
+            self._drop(size)
+            return False
+        if self.policy == "keep_first":
+            if self.retained_bytes + size > self.max_bytes:
+                self._drop(size)
+                return False
+        elif size > self.max_bytes:
+            # 单个事件就超出预算，保留它会清空整个缓冲区
+            self._drop(size)
+            return False
+        else:
+            while self._items and self.retained_bytes + size > self.max_bytes:
+                _, evicted = self._items.popleft()
+                self.retained_bytes -= evicted
+                self._drop(evicted)
+        self._items.append((item, size))
+        self.retained_bytes += size
+        return True
+
+    def _drop(self, size: int) -> None:
+        self.dropped_events += 1
+        self.dropped_bytes += size
+
+    def clear(self) -> None:
+        """丢弃全部事件并重置统计（整体重放时使用）"""
+        self._items.clear()
+        self.retained_bytes = 0
+        self.dropped_events = 0
+        self.dropped_bytes = 0
+
+    @property
+    def events(self) -> List[Any]:
+        return [item for item, _ in self._items]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "max_bytes": self.max_bytes,
+            "retained_events": len(self._items),
+            "retained_bytes": self.retained_bytes,
+            "dropped_events": self.dropped_events,
+            "dropped_bytes": self.dropped_bytes,
+        }
@@ -0,0 +1,31 @@
+"""
+请求头参数解析
+
+工具参数中的 headers 是 JSON 字符串，从网页或文档复制时常带有不间断空格（\xa0）、全角空格等
+Unicode 空白字符，json.loads 会直接报错；解析前统一替换为普通空格。
+"""
+import json
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def parse_headers(headers_str: str) -> Dict[str, str]:
+    """把 JSON 字符串形式的请求头解析为字典，空字符串返回空字典"""
+    headers = {}
+    if headers_str:
+        try:
+            # 清理字符串中的特殊字符（如\xa0不间断空格）和其他非ASCII空白字符
+            cleaned_str = ''.join(char if ord(char) < 128 or not char.isspace() else ' ' for char in headers_str)
+            cleaned_str = cleaned_str.strip()
+
+            logger.debug("[Headers清理] 原始: %r", headers_str)
+            logger.debug("[Headers清理] 清理后: %r", cleaned_str)
+
+            headers = json.loads(cleaned_str)
+            if not isinstance(headers, dict):
+                raise ValueError("Headers must be a JSON object")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format for headers: {e}")
+    return headers
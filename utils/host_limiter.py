@@ -0,0 +1,274 @@
+"""
+按主机的准入控制
+
+一批工作流同时运行时，每个调用都会立即向同一个 Dify API 建立SSE连接，压垮上游后又触发重试，放大风暴。
+连接发起之前先经过进程级的主机限流器：
+- 并发信号量：同一主机（可选再按 Authorization 区分）同时进行的流不超过 max_concurrent
+- 令牌桶：新建请求的速率不超过 rate 个/秒，允许 burst 个突发
+- 有界等待队列：排队的调用超过 max_queue 时直接拒绝，排队超过 queue_timeout 秒时放弃；先到先得
+
+同步引擎（gevent）和异步引擎（引擎线程中的事件循环）共用同一个限流器：
+队列中的等待者各自持有唤醒方式，释放名额的一方只负责唤醒队首。
+排队与拒绝都不重试（RetryPolicy 按 fatal 处理），避免在过载时继续加压。
+"""
+import asyncio
+import collections
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from typing import Deque, Dict, Mapping, Optional, Union
+from urllib.parse import urlsplit
+
+from utils import metrics
+from utils.native import original
+
+try:
+    from gevent.event import Event as _WakeEvent
+except ImportError:  # pragma: no cover - 未安装gevent时直接使用标准库
+    _WakeEvent = threading.Event
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class LimiterConfig:
+    """限流配置，可通过环境变量覆盖默认值；max_concurrent 和 rate 为0表示不限制，默认两者都为0（不启用限流）"""
+
+    def __init__(self, max_concurrent: int = 0, rate: float = 0, burst: Optional[int] = None,
+                 max_queue: int = 500, queue_timeout: float = 30.0, by_auth: bool = False):
+        self.max_concurrent = max(0, max_concurrent)
+        self.rate = max(0.0, rate)
+        self.burst = burst if burst and burst > 0 else max(1, int(math.ceil(self.rate)))
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        # 同一主机上不同的 Authorization（如不同的Dify应用）分别限流
+        self.by_auth = by_auth
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0 or self.rate > 0
+
+    @classmethod
+    def from_env(cls) -> "LimiterConfig":
+        """从环境变量读取配置"""
+        burst = os.getenv("SSE_LIMIT_BURST")
+        return cls(
+            max_concurrent=int(os.getenv("SSE_LIMIT_MAX_CONCURRENT", "0")),
+            rate=float(os.getenv("SSE_LIMIT_RATE", "0")),
+            burst=int(burst) if burst else None,
+            max_queue=int(os.getenv("SSE_LIMIT_QUEUE", "500")),
+            queue_timeout=float(os.getenv("SSE_LIMIT_QUEUE_TIMEOUT", "30")),
+            by_auth=os.getenv("SSE_LIMIT_BY_AUTH", "0").strip().lower() in ("1", "true", "on"),
+        )
+
+
+class HostLimitError(Exception):
+    """排队已满或排队超时，reason 为 queue_full / queue_timeout"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _SyncWaiter:
+    """同步调用方（gevent greenlet或线程）的等待者，可从其他线程唤醒"""
+
+    def __init__(self):
+        self._event = _WakeEvent()
+
+    def wake(self) -> None:
+        self._event.set()
+
+    def wait(self, timeout: float) -> None:
+        self._event.wait(None if timeout == math.inf else timeout)
+        self._event.clear()
+
+
+class _AsyncWaiter:
+    """事件循环中协程的等待者，其他线程通过 call_soon_threadsafe 唤醒"""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._event.wait(), None if timeout == math.inf else timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+
+class HostLimiter:
+    """一个主机的并发信号量、令牌桶和先到先得的等待队列"""
+
+    def __init__(self, key: str, config: LimiterConfig):
+        self.key = key
+        self.config = config
+        # 临界区很短且从不在持锁时等待；greenlet和引擎线程都会进入，使用未被gevent替换的原生锁
+        self._lock = original('_thread', 'allocate_lock')()
+        self._active = 0
+        self._tokens = float(config.burst)
+        self._refilled = time.monotonic()
+        self._waiters: Deque[Union[_SyncWaiter, _AsyncWaiter]] = collections.deque()
+
+    def _try_admit(self, now: float) -> Optional[float]:
+        """持有锁时调用：可以放行时占用名额并返回None，否则返回需要等待的秒数（等并发名额时为inf）"""
+        config = self.config
+        if config.max_concurrent and self._active >= config.max_concurrent:
+            return math.inf
+        if config.rate:
+            self._tokens = min(config.burst, self._tokens + (now - self._refilled) * config.rate)
+            self._refilled = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / config.rate
+            self._tokens -= 1
+        self._active += 1
+        return None
+
+    def _wake_head(self) -> None:
+        if self._waiters:
+            self._waiters[0].wake()
+
+    def _enqueue(self, waiter_factory) -> Optional[Union[_SyncWaiter, _AsyncWaiter]]:
+        """队列为空且可以放行时返回None；否则排入队尾，队列已满时拒绝"""
+        with self._lock:
+            if not self._waiters and self._try_admit(time.monotonic()) is None:
+                return None
+            if len(self._waiters) >= self.config.max_queue:
+                metrics.limiter_rejected("queue_full")
+                raise HostLimitError(f"主机 {self.key} 的等待队列已满（{self.config.max_queue}个）", "queue_full")
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _poll(self, waiter, now: float) -> Optional[float]:
+        """排在队首且可以放行时出队并返回None，否则返回下一次检查前的等待秒数"""
+        with self._lock:
+            if self._waiters[0] is not waiter:
+                return math.inf
+            delay = self._try_admit(now)
+            if delay is None:
+                self._waiters.popleft()
+                # 令牌或名额可能还够下一个
+                self._wake_head()
+            return delay
+
+    def _abandon(self, waiter) -> None:
+        with self._lock:
+            was_head = bool(self._waiters) and self._waiters[0] is waiter
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return
+            if was_head:
+                self._wake_head()
+
+    def _timeout_error(self, timeout: float) -> HostLimitError:
+        metrics.limiter_rejected("queue_timeout")
+        return HostLimitError(f"主机 {self.key} 排队{timeout:g}秒仍未获得连接名额", "queue_timeout")
+
+    def acquire(self, timeout: float = math.inf) -> float:
+        """同步获取一个名额，返回排队等待的秒数"""
+        start = time.monotonic()
+        timeout = min(timeout, self.config.queue_timeout)
+        waiter = self._enqueue(_SyncWaiter)
+        if waiter is None:
+            return 0.0
+        try:
+            while True:
+                now = time.monotonic()
+                delay = self._poll(waiter, now)
+                if delay is None:
+                    return now - start
+                remaining = start + timeout - now
+                if remaining <= 0:
+                    raise self._timeout_error(timeout)
+                waiter.wait(min(delay, remaining))
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    async def aacquire(self, timeout: float = math.inf) -> float:
+        """acquire 的协程版本，在异步引擎的事件循环中使用"""
+        start = time.monotonic()
+        timeout = min(timeout, self.config.queue_timeout)
+        waiter = self._enqueue(_AsyncWaiter)
+        if waiter is None:
+            return 0.0
+        try:
+            while True:
+                now = time.monotonic()
+                delay = self._poll(waiter, now)
+                if delay is None:
+                    return now - start
+                remaining = start + timeout - now
+                if remaining <= 0:
+                    raise self._timeout_error(timeout)
+                await waiter.wait(min(delay, remaining))
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def release(self) -> None:
+        """流结束时归还名额，唤醒队首"""
+        with self._lock:
+            self._active -= 1
+            self._wake_head()
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": self._active, "queued": len(self._waiters)}
+
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+_config: Optional[LimiterConfig] = None
+
+
+def limiter_key(url: str, headers: Optional[Mapping[str, str]] = None, by_auth: bool = False) -> str:
+    """限流的键：主机和端口，by_auth 时再加上 Authorization 的摘要（不保存明文）"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    key = f"{(parts.hostname or '').lower()}:{parts.port or _DEFAULT_PORTS.get(scheme, 0)}"
+    if by_auth and headers:
+        auth = next((v for k, v in headers.items() if k.lower() == "authorization"), None)
+        if auth:
+            key += "#" + hashlib.sha256(auth.encode()).hexdigest()[:8]
+    return key
+
+
+def get_host_limiter(url: str, headers: Optional[Mapping[str, str]] = None) -> Optional[HostLimiter]:
+    """获取目标主机的限流器；并发和速率都不限制时返回None"""
+    global _config
+    if _config is None:
+        _config = LimiterConfig.from_env()
+    if not _config.enabled:
+        return None
+    key = limiter_key(url, headers, _config.by_auth)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = _limiters[key] = HostLimiter(key, _config)
+                logger.info(f"[限流] 为 {key} 创建限流器：并发{_config.max_concurrent or '不限'}，"
+                            f"速率{_config.rate or '不限'}/秒，队列{_config.max_queue}，排队超时{_config.queue_timeout:g}秒")
+    return limiter
+
+
+def configure(config: Optional[LimiterConfig]) -> None:
+    """替换限流配置并丢弃已有的限流器，传None时下次使用前重新读取环境变量"""
+    global _config
+    with _limiters_lock:
+        _config = config
+        _limiters.clear()
@@ -0,0 +1,285 @@
+"""
+进程级共享的HTTP连接池
+
+所有SSE调用（包括重试）共用按主机划分的 httpx.Client，
+复用TCP连接和TLS握手，避免每次调用都重新建立连接。
+httpx 只在没有传入 transport 时读取环境代理，这里按 HTTP(S)_PROXY/ALL_PROXY/NO_PROXY
+为统计复用的传输层构造 mounts，代理行为与直接调用 httpx.stream 一致。
+AsyncHTTPClientPool 是对应的 httpx.AsyncClient 版本，由异步引擎在其事件循环中使用。
+"""
+import atexit
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from httpx._utils import get_environment_proxies
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class PoolConfig:
+    """连接池配置，可通过环境变量覆盖默认值"""
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0):
+        # 单个主机的最大连接数和最大保活连接数
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        # 空闲连接的保活时间（秒），超过后由连接池关闭
+        self.keepalive_expiry = keepalive_expiry
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        """从环境变量读取配置"""
+        return cls(
+            max_connections=int(os.getenv("SSE_POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("SSE_POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("SSE_POOL_KEEPALIVE_EXPIRY", "30")),
+        )
+
+    def to_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class PoolStats:
+    """连接池统计：复用次数、新建连接数、空闲关闭数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.new_connections = 0
+        self.idle_closes = 0
+
+    def record_request(self, reused: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if reused:
+                self.hits += 1
+            else:
+                self.new_connections += 1
+
+    def record_idle_closes(self, count: int) -> None:
+        if count:
+            with self._lock:
+                self.idle_closes += count
+
+    def to_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "new_connections": self.new_connections,
+                "idle_closes": self.idle_closes,
+            }
+
+
+class _TrackedTransport(httpx.HTTPTransport):
+    """统计连接复用情况的传输层"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        # 通过httpcore的trace扩展判断本次请求是否新建了TCP连接
+        state = {"new": False}
+        upstream_trace: Optional[Callable[[str, Dict[str, Any]], None]] = request.extensions.get("trace")
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.started":
+                state["new"] = True
+            if upstream_trace is not None:
+                upstream_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+
+        # 记录请求前的空闲连接，请求后消失的即为过期被关闭的连接
+        pool = getattr(self, "_pool", None)
+        idle_before = set()
+        if pool is not None:
+            idle_before = {id(conn) for conn in pool.connections if conn.is_idle()}
+
+        response = super().handle_request(request)
+
+        if pool is not None and idle_before:
+            current = {id(conn) for conn in pool.connections}
+            self._stats.record_idle_closes(len(idle_before - current))
+        self._stats.record_request(reused=not state["new"])
+        return response
+
+
+class _TrackedAsyncTransport(httpx.AsyncHTTPTransport):
+    """统计连接复用情况的异步传输层"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        state = {"new": False}
+        upstream_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.started":
+                state["new"] = True
+            if upstream_trace is not None:
+                await upstream_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+
+        pool = getattr(self, "_pool", None)
+        idle_before = set()
+        if pool is not None:
+            idle_before = {id(conn) for conn in pool.connections if conn.is_idle()}
+
+        response = await super().handle_async_request(request)
+
+        if pool is not None and idle_before:
+            current = {id(conn) for conn in pool.connections}
+            self._stats.record_idle_closes(len(idle_before - current))
+        self._stats.record_request(reused=not state["new"])
+        return response
+
+
+def _env_proxy_mounts(make_transport: Callable[..., Any]) -> Dict[str, Any]:
+    """按环境变量中的代理构造 mounts：需要代理的模式使用带代理的传输层，NO_PROXY 的模式为None（直连）"""
+    return {pattern: None if proxy is None else make_transport(proxy=httpx.Proxy(proxy))
+            for pattern, proxy in get_environment_proxies().items()}
+
+
+class HTTPClientPool:
+    """按主机划分的 httpx.Client 池，线程安全，可在并发调用间共享"""
+
+    def __init__(self, config: Optional[PoolConfig] = None):
+        self.config = config or PoolConfig.from_env()
+        self._clients: Dict[Tuple[str, str, int], httpx.Client] = {}
+        self._stats: Dict[Tuple[str, str, int], PoolStats] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _origin(url: str) -> Tuple[str, str, int]:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or _DEFAULT_PORTS.get(scheme, 0)
+        return scheme, (parts.hostname or "").lower(), port
+
+    def get_client(self, url: str) -> httpx.Client:
+        """获取目标主机对应的共享客户端，不存在时创建"""
+        origin = self._origin(url)
+        client = self._clients.get(origin)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is None:
+                stats = PoolStats()
+                limits = self.config.to_limits()
+
+                def make_transport(**kwargs) -> _TrackedTransport:
+                    return _TrackedTransport(stats, limits=limits, **kwargs)
+
+                client = httpx.Client(transport=make_transport(), mounts=_env_proxy_mounts(make_transport))
+                self._stats[origin] = stats
+                self._clients[origin] = client
+                logger.info(f"[连接池] 为主机 {origin[1]}:{origin[2]} 创建共享连接池")
+            return client
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs) -> Iterator[httpx.Response]:
+        """与 httpx.stream 用法一致，但使用共享连接池"""
+        with self.get_client(url).stream(method, url, **kwargs) as response:
+            yield response
+
+    def stats(self, url: Optional[str] = None) -> Dict[str, Any]:
+        """返回连接池统计；指定url时只返回该主机的统计"""
+        if url is not None:
+            stats = self._stats.get(self._origin(url))
+            return stats.to_dict() if stats else PoolStats().to_dict()
+        return {f"{host}:{port}": stats.to_dict() for (_, host, port), stats in self._stats.items()}
+
+    def close(self) -> None:
+        """关闭所有客户端及其连接"""
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.debug(f"[连接池] 关闭客户端时出错: {e}")
+            self._clients.clear()
+            self._stats.clear()
+
+
+class AsyncHTTPClientPool:
+    """按主机划分的 httpx.AsyncClient 池，只能在创建连接的同一个事件循环中使用"""
+
+    def __init__(self, config: Optional[PoolConfig] = None):
+        self.config = config or PoolConfig.from_env()
+        self._clients: Dict[Tuple[str, str, int], httpx.AsyncClient] = {}
+        self._stats: Dict[Tuple[str, str, int], PoolStats] = {}
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """获取目标主机对应的共享异步客户端，不存在时创建（事件循环单线程，无需加锁）"""
+        origin = HTTPClientPool._origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            stats = PoolStats()
+            limits = self.config.to_limits()
+
+            def make_transport(**kwargs) -> _TrackedAsyncTransport:
+                return _TrackedAsyncTransport(stats, limits=limits, **kwargs)
+
+            client = httpx.AsyncClient(transport=make_transport(), mounts=_env_proxy_mounts(make_transport))
+            self._stats[origin] = stats
+            self._clients[origin] = client
+            logger.info(f"[连接池] 为主机 {origin[1]}:{origin[2]} 创建共享异步连接池")
+        return client
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """与 httpx.AsyncClient.stream 用法一致，但使用共享连接池"""
+        async with self.get_client(url).stream(method, url, **kwargs) as response:
+            yield response
+
+    def stats(self, url: Optional[str] = None) -> Dict[str, Any]:
+        """返回连接池统计；指定url时只返回该主机的统计"""
+        if url is not None:
+            stats = self._stats.get(HTTPClientPool._origin(url))
+            return stats.to_dict() if stats else PoolStats().to_dict()
+        return {f"{host}:{port}": stats.to_dict() for (_, host, port), stats in self._stats.items()}
+
+    async def aclose(self) -> None:
+        """关闭所有异步客户端及其连接"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._stats.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug(f"[连接池] 关闭异步客户端时出错: {e}")
+
+
+_pool: Optional[HTTPClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HTTPClientPool:
+    """获取进程级共享连接池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HTTPClientPool()
+                atexit.register(_pool.close)
+    return _pool
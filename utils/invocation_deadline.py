@@ -0,0 +1,50 @@
+"""
+调用级时间预算
+
+插件守护进程在 MAX_REQUEST_TIMEOUT 秒后强制结束调用，已收到的部分结果全部丢失；
+而用户参数（如 chatflow 默认的 timeout=300、max_duration=600）加上重试和退避可以远超这个上限。
+调用开始时算出一个截止时间，连接、重试等待和流式读取共享：
+- 截止时间 = 调用开始 + min(max_duration, MAX_REQUEST_TIMEOUT - 输出余量)
+- 每次尝试的 httpx 超时（connect/read/write/pool）取 min(用户超时, 剩余预算)
+- 每次尝试的监听时长取剩余预算，由看门狗在截止时间关闭连接
+- 重试等待超过剩余预算时不再重试（RetryPolicy 的 total_budget）
+输出余量留给构建和返回结果：截止时间到达时工具返回已收到的部分结果，而不是被守护进程杀掉。
+"""
+import time
+from typing import Any, Dict, Optional
+
+from utils.retry_policy import MAX_REQUEST_TIMEOUT
+
+# 截止时间之后留给构建和返回结果的秒数
+OUTPUT_RESERVE = 5.0
+# 单次尝试的最短超时，剩余预算不足时也不传0给httpx
+MIN_ATTEMPT_TIMEOUT = 0.5
+
+
+class InvocationDeadline:
+    """一次工具调用的截止时间"""
+
+    def __init__(self, max_duration: float, runtime_limit: Optional[float] = None,
+                 reserve: Optional[float] = None):
+        self.started = time.monotonic()
+        runtime_limit = MAX_REQUEST_TIMEOUT if runtime_limit is None else runtime_limit
+        reserve = OUTPUT_RESERVE if reserve is None else reserve
+        limit = max(1.0, runtime_limit - reserve)
+        # 截止时间由运行时上限而不是用户的 max_duration 决定
+        self.capped = max_duration <= 0 or max_duration > limit
+        self.budget = limit if self.capped else float(max_duration)
+        self.deadline = self.started + self.budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def attempt_timeout(self, timeout: float) -> float:
+        """本次尝试的 httpx 超时：不超过用户设置，也不超过剩余预算"""
+        return round(max(MIN_ATTEMPT_TIMEOUT, min(float(timeout), self.remaining())), 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "budget_s": round(self.budget, 3),
+            "remaining_s": round(self.remaining(), 3),
+            "capped_by_runtime": self.capped,
+        }
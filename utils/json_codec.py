@@ -0,0 +1,107 @@
+"""
+可插拔的JSON编解码层
+
+安装了 orjson 或 msgspec 时用于解码（loads），否则回退到标准库 json；
+快速后端无法处理的输入（超大整数、NaN字面量等）会自动回退到标准库，解码失败统一抛出 json.JSONDecodeError。
+部分 orjson 版本会把超过64位的整数解码为浮点数而不报错；通用工具解析的是任意上游的数据，
+加载后端时先试解码一个超出64位的整数，结果不精确的后端不会被选用（与未安装相同，回退到下一个候选）。
+逐个载荷扫描长数字再决定是否回退的开销比快速后端节省的时间还多，所以不在每次解码时检查。
+
+编码（dumps）始终使用 json.dumps(obj, ensure_ascii=False, separators=(',', ':'))：
+快速后端把 NaN/Infinity 编码为 null、浮点数写作 1e16 而不是 1e+16，与标准库的输出不一致；
+热路径上只有解码（每个事件一次），编码只用于每次调用规范化一次请求体。
+
+可通过环境变量 SSE_JSON_BACKEND 指定后端：auto（默认）、orjson、msgspec、json。
+"""
+import json
+import logging
+import os
+from typing import Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def _json_loads(s: Any) -> Any:
+    return json.loads(s)
+
+
+def _json_dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _load_orjson() -> Optional[Callable[[Any], Any]]:
+    try:
+        import orjson
+    except ImportError:
+        return None
+
+    def loads(s: Any) -> Any:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # 标准库能接受部分orjson拒绝的输入（NaN、超大整数），失败时由标准库给出错误
+            return json.loads(s)
+
+    return loads
+
+
+def _load_msgspec() -> Optional[Callable[[Any], Any]]:
+    try:
+        import msgspec
+    except ImportError:
+        return None
+
+    decoder = msgspec.json.Decoder()
+
+    def loads(s: Any) -> Any:
+        try:
+            return decoder.decode(s)
+        except msgspec.DecodeError:
+            return json.loads(s)
+
+    return loads
+
+
+_BACKENDS = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+}
+
+
+def _exact_big_integers(loads: Callable[[Any], Any]) -> bool:
+    """后端能否精确解码超出64位的整数（解码失败时回退标准库也算精确）"""
+    big = 2 ** 64
+    decoded = loads(f"[{big}]")
+    return type(decoded[0]) is int and decoded[0] == big
+
+
+def _select_backend(preferred: str) -> Tuple[str, Callable[[Any], Any]]:
+    preferred = (preferred or "auto").lower()
+    if preferred == "json":
+        return "json", _json_loads
+    candidates = [preferred] if preferred in _BACKENDS else ["orjson", "msgspec"]
+    for name in candidates:
+        loaded = _BACKENDS[name]()
+        if loaded is not None and _exact_big_integers(loaded):
+            return name, loaded
+        if preferred == name:
+            reason = "未安装" if loaded is None else "会把超出64位的整数解码为浮点数"
+            logger.warning(f"[JSON编解码] 指定的后端 {name} {reason}，回退到标准库json")
+    return "json", _json_loads
+
+
+def use_backend(name: str) -> str:
+    """切换JSON解码后端，返回实际生效的后端名称"""
+    global backend, loads
+    backend, loads = _select_backend(name)
+    return backend
+
+
+backend: str = "json"
+# loads 在import时绑定到选中的后端，dumps 固定为标准库
+loads: Callable[[Any], Any] = _json_loads
+dumps: Callable[[Any], str] = _json_dumps
+
+use_backend(os.getenv("SSE_JSON_BACKEND", "auto"))
@@ -0,0 +1,31 @@
+"""
+延迟统计
+
+使用最近秩（nearest-rank）百分位：结果总是样本中的某个实际值，样本很少时也不做插值。
+"""
+import math
+from typing import Dict, Iterable, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> Optional[float]:
+    """已排序样本的第pct百分位（0-100），样本为空时返回None"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(values: Iterable[float], percentiles: Sequence[float] = (50, 95), digits: int = 3) -> Dict[str, Optional[float]]:
+    """样本数、最小/最大/平均值和指定百分位，如 {"count": 3, "min": .., "p50": .., "p95": .., "max": .., "mean": ..}"""
+    ordered = sorted(values)
+    summary: Dict[str, Optional[float]] = {"count": len(ordered)}
+
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, digits) if value is not None else None
+
+    summary["min"] = rounded(ordered[0] if ordered else None)
+    for pct in percentiles:
+        summary[f"p{pct:g}"] = rounded(percentile(ordered, pct))
+    summary["max"] = rounded(ordered[-1] if ordered else None)
+    summary["mean"] = rounded(sum(ordered) / len(ordered) if ordered else None)
+    return summary
@@ -0,0 +1,146 @@
+"""
+日志配置与非阻塞输出
+
+- 日志级别按凭据中的 log_level 配置，同一级别只配置一次并缓存，后续调用直接返回；
+  不再修改根logger，也不再使用 basicConfig(force=True) 拆掉根logger的处理器。
+- 插件logger经队列输出：SSE读取循环（包括异步引擎线程）只做入队，由主线程中的一个写greenlet
+  交给 dify 的 plugin_logger_handler 写到 stdout。
+
+stdio 模式下 dify_plugin 的 StdioResponseWriter 在主线程的greenlet里向同一个 sys.stdout 写插件协议帧，
+TextIOWrapper 不是线程安全的，日志如果从其他系统线程写出会与协议帧交错；
+写greenlet与协议写入在同一个系统线程里，阻塞写不会在中途切换，不会拆开协议帧。
+
+限制：写greenlet与同步引擎的读取greenlet共用主线程的hub，stdout管道阻塞时每次写入仍会让所有读取循环停顿；
+写greenlet每写一条就让出一次，停顿被限制在单次写入的耗时，不再随积压的日志条数累积。
+协议帧同样在主线程写出，管道阻塞时插件本身也无法响应，因此不把日志写入移出主线程。
+dify_plugin 在导入时对 threading/queue 做了 gevent monkey patch，跨线程入队使用未被patch的原生队列。
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from typing import Dict, List, Optional
+
+from utils.native import original
+
+try:
+    import gevent
+    from gevent.event import Event as _WakeEvent
+except ImportError:  # pragma: no cover - 未安装gevent时直接使用标准库
+    gevent = None
+
+LOG_LEVELS: Dict[str, int] = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+}
+
+
+class _WakingQueueHandler(logging.handlers.QueueHandler):
+    """入队后唤醒写greenlet，可以在任何线程中调用"""
+
+    def __init__(self, queue, wake):
+        super().__init__(queue)
+        self._wake = wake
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait(record)
+        self._wake.set()
+
+
+class _GreenletWriter:
+    """在主线程的greenlet中把队列里的日志交给 plugin_logger_handler，是插件日志唯一的stdout写入方"""
+
+    def __init__(self, queue, handler: logging.Handler):
+        self.queue = queue
+        self.handler = handler
+        self.wake = _WakeEvent()
+        self._greenlet = None
+
+    def start(self) -> None:
+        self._greenlet = gevent.spawn(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            self.drain(yield_between=True)
+
+    def drain(self, yield_between: bool = False) -> None:
+        """写出队列中的日志；yield_between 时每写一条让出一次，读取greenlet最多等待一次写入"""
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            # 与 QueueListener 相同：级别已由logger过滤，不再按处理器级别过滤
+            self.handler.handle(record)
+            if yield_between:
+                gevent.sleep(0)
+
+    def stop(self) -> None:
+        """停止写greenlet，在当前线程写完队列中剩余的日志"""
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+        self.drain()
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_queue = None
+_writer: Optional[_GreenletWriter] = None
+_queue_handler: Optional[logging.Handler] = None
+_loggers: List[logging.Logger] = []
+_configured_level: Optional[str] = None
+
+
+def install_queue_handler(plugin_logger: logging.Logger) -> logging.Logger:
+    """为插件logger挂上队列处理器，首次调用时在当前（主）线程启动写greenlet；级别由logger控制"""
+    global _queue, _writer, _queue_handler
+    with _lock:
+        if _queue_handler is None:
+            from dify_plugin.config.logger_format import plugin_logger_handler
+
+            if gevent is None:  # pragma: no cover - 没有gevent时直接同步写出
+                _queue_handler = plugin_logger_handler
+            else:
+                _queue = original('queue', 'SimpleQueue')()
+                _writer = _GreenletWriter(_queue, plugin_logger_handler)
+                _queue_handler = _WakingQueueHandler(_queue, _writer.wake)
+                # 异步引擎线程也会入队，处理器锁使用原生锁
+                _queue_handler.lock = original('threading', 'RLock')()
+                _writer.start()
+                atexit.register(_stop_writer)
+        if _queue_handler not in plugin_logger.handlers:
+            plugin_logger.addHandler(_queue_handler)
+        if plugin_logger not in _loggers:
+            _loggers.append(plugin_logger)
+    plugin_logger.setLevel(LOG_LEVELS[_configured_level or 'INFO'])
+    return plugin_logger
+
+
+def _stop_writer() -> None:
+    """进程退出时把队列中剩余的日志写完"""
+    if _writer is not None:
+        _writer.stop()
+
+
+def configure_log_level(log_level: Optional[str]) -> bool:
+    """按凭据中的日志级别配置插件logger，级别未变化时直接返回False"""
+    global _configured_level
+    level_name = (log_level or 'INFO').upper()
+    if level_name not in LOG_LEVELS:
+        level_name = 'INFO'
+    if level_name == _configured_level:
+        return False
+    level = LOG_LEVELS[level_name]
+    with _lock:
+        for plugin_logger in _loggers:
+            plugin_logger.setLevel(level)
+        _configured_level = level_name
+    logger.info(f"[日志配置] 日志级别设置为: {level_name}")
+    return True
@@ -0,0 +1,363 @@
+"""
+进程内指标注册表
+
+计数器、仪表和固定分桶直方图，可导出为 Prometheus 文本格式：
+- 环境变量 SSE_METRICS_FILE 指定文件时，调用结束后按 SSE_METRICS_DUMP_INTERVAL 秒（默认15）节流写出，
+  先写临时文件再改名，可直接交给 node_exporter 的 textfile collector
+- 诊断工具 sse_metrics 返回当前的文本或JSON快照
+
+热循环中不逐事件记录：事件数、字节数和事件间隔在流结束时从 StreamTiming 一次性汇总，
+重试相关指标在调用结束时从 RetryPolicy.attempts 汇总。SSE_METRICS=0 可关闭全部记录。
+greenlet 和异步引擎线程都会记录指标，临界区很短且从不在持锁时等待，使用未被gevent替换的原生锁。
+"""
+import atexit
+import bisect
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.native import original
+
+logger = logging.getLogger(__name__)
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = original('_thread', 'allocate_lock')()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self._lock = original('_thread', 'allocate_lock')()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def observe_many(self, values: Sequence[float]) -> None:
+        """批量记录，只加一次锁"""
+        bounds = self._bounds
+        indexes = [bisect.bisect_left(bounds, v) for v in values]
+        if not indexes:
+            return
+        total = sum(values)
+        with self._lock:
+            for index in indexes:
+                self.counts[index] += 1
+            self.sum += total
+            self.count += len(indexes)
+
+
+class _Metric:
+    """一个指标及其按标签值区分的子项"""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = original('_thread', 'allocate_lock')()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any):
+        """按标签值取子项，同一组标签值返回同一个对象，调用方可以缓存"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_text(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        """持锁复制子项，排序和格式化在锁外进行；其他线程同时新增标签时不会改变正在遍历的字典"""
+        with self._lock:
+            items = list(self._children.items())
+        items.sort(key=lambda item: item[0])
+        return items
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._items():
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{self._label_text(key)} {_format_value(child.value)}"]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [{"labels": dict(zip(self.labelnames, key)), **self._child_snapshot(child)}
+                for key, child in self._items()]
+
+    def _child_snapshot(self, child) -> Dict[str, Any]:
+        return {"value": child.value}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._label_text(key, ('le', _format_value(bound)))} {cumulative}")
+        labels = self._label_text(key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+    def _child_snapshot(self, child) -> Dict[str, Any]:
+        return {"count": child.count, "sum": round(child.sum, 6),
+                "buckets": dict(zip([_format_value(b) for b in self.buckets + (math.inf,)], child.counts))}
+
+
+class MetricsRegistry:
+    """按注册顺序保存指标，导出为 Prometheus 文本或JSON快照"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._last_dump = 0.0
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: {"type": metric.kind, "help": metric.help, "samples": metric.snapshot()}
+                for name, metric in self._metrics.items()}
+
+    def write_file(self, path: str) -> None:
+        """原子写出：先写临时文件再改名，读取方不会看到写了一半的内容"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def maybe_dump(self, force: bool = False) -> Optional[str]:
+        """配置了 SSE_METRICS_FILE 时按间隔节流写出，返回写出的路径"""
+        path = os.getenv("SSE_METRICS_FILE")
+        if not path or not self.enabled:
+            return None
+        now = time.monotonic()
+        if not force and now - self._last_dump < float(os.getenv("SSE_METRICS_DUMP_INTERVAL", "15")):
+            return None
+        self._last_dump = now
+        try:
+            self.write_file(path)
+        except OSError as e:
+            logger.warning(f"[指标] 写出指标文件失败: {e}")
+            return None
+        return path
+
+
+REGISTRY = MetricsRegistry(enabled=os.getenv("SSE_METRICS", "1").strip().lower() not in ("0", "false", "off"))
+atexit.register(lambda: REGISTRY.maybe_dump(force=True))
+
+# ---- 插件指标 ----
+# client 标签：generic（SSEClient）或 chatflow（DifyChatflowSSEClient）；tool 标签为工具名
+
+INVOCATIONS = REGISTRY.counter("sse_invocations_total", "Tool invocations by final status", ("tool", "status"))
+INVOCATION_SECONDS = REGISTRY.histogram("sse_invocation_duration_seconds", "Tool invocation duration", ("tool",))
+ATTEMPTS = REGISTRY.counter("sse_attempts_total", "Connection attempts by outcome", ("tool", "outcome"))
+ERRORS = REGISTRY.counter("sse_errors_total", "Failed attempts by error class and HTTP status",
+                          ("tool", "error_class", "status_code"))
+RETRIES = REGISTRY.counter("sse_retries_total", "Retries scheduled after a failed attempt", ("tool",))
+GIVE_UPS = REGISTRY.counter("sse_give_ups_total", "Invocations that stopped retrying, by reason", ("tool", "reason"))
+
+STREAMS_ACTIVE = REGISTRY.gauge("sse_streams_active", "Streams currently being read", ("client",))
+STREAMS = REGISTRY.counter("sse_streams_total", "Finished streams by stop reason", ("client", "stop_reason"))
+EVENTS = REGISTRY.counter("sse_events_total", "SSE events parsed", ("client",))
+BYTES = REGISTRY.counter("sse_bytes_received_total", "Response body bytes received", ("client",))
+CONNECT_SECONDS = REGISTRY.histogram("sse_connect_seconds", "TCP connect time (including DNS) for new connections",
+                                     ("client",))
+TTFE_SECONDS = REGISTRY.histogram("sse_time_to_first_event_seconds", "Request start to first event", ("client",))
+STREAM_SECONDS = REGISTRY.histogram("sse_stream_duration_seconds", "Request start to end of stream", ("client",))
+GAP_SECONDS = REGISTRY.histogram("sse_event_gap_seconds", "Time between consecutive events", ("client",),
+                                 buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("sse_queue_wait_seconds", "Time spent waiting for the per-host limiter",
+                                        ("client",))
+LIMITER_REJECTIONS = REGISTRY.counter("sse_limiter_rejections_total", "Requests rejected by the per-host limiter",
+                                      ("reason",))
+
+CIRCUIT_STATE = REGISTRY.gauge("sse_circuit_state", "Circuit breaker state per host (0 closed, 1 half-open, 2 open)",
+                               ("host",))
+CIRCUIT_TRANSITIONS = REGISTRY.counter("sse_circuit_transitions_total", "Circuit breaker state transitions",
+                                       ("host", "state"))
+CIRCUIT_REJECTIONS = REGISTRY.counter("sse_circuit_rejections_total", "Requests short-circuited by an open breaker",
+                                      ("host",))
+
+CREDENTIAL_VALIDATIONS = REGISTRY.counter("sse_credential_validations_total",
+                                          "Provider credential validations by result", ("result",))
+
+
+def credentials_validated(result: str) -> None:
+    if REGISTRY.enabled:
+        CREDENTIAL_VALIDATIONS.labels(result).inc()
+
+
+def stream_started(client: str) -> None:
+    if REGISTRY.enabled:
+        STREAMS_ACTIVE.labels(client).inc()
+
+
+def stream_finished(client: str, timing: Any, stop_reason: Optional[str]) -> None:
+    """流结束（包括出错）时调用一次，从 StreamTiming 汇总事件数、字节数和各阶段耗时"""
+    if not REGISTRY.enabled:
+        return
+    STREAMS_ACTIVE.labels(client).dec()
+    STREAMS.labels(client, stop_reason or "error").inc()
+    if timing.events:
+        EVENTS.labels(client).inc(timing.events)
+    if timing.bytes:
+        BYTES.labels(client).inc(timing.bytes)
+    if timing.queue_wait is not None:
+        QUEUE_WAIT_SECONDS.labels(client).observe(timing.queue_wait)
+    connect_ms = timing.phase_ms("connect_tcp")
+    if connect_ms is not None:
+        CONNECT_SECONDS.labels(client).observe(connect_ms / 1000)
+    if timing.request_start is not None:
+        if timing.first_event_at is not None:
+            TTFE_SECONDS.labels(client).observe(timing.first_event_at - timing.request_start)
+        if timing.end_at is not None:
+            STREAM_SECONDS.labels(client).observe(timing.end_at - timing.request_start)
+    if timing.gaps:
+        GAP_SECONDS.labels(client).observe_many(timing.gaps)
+
+
+def limiter_rejected(reason: str) -> None:
+    """主机限流器拒绝请求（queue_full / queue_timeout）"""
+    if REGISTRY.enabled:
+        LIMITER_REJECTIONS.labels(reason).inc()
+
+
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def circuit_transition(host: str, state: str) -> None:
+    """熔断器状态变化（closed / half_open / open）"""
+    if REGISTRY.enabled:
+        CIRCUIT_STATE.labels(host).set(_CIRCUIT_STATES[state])
+        CIRCUIT_TRANSITIONS.labels(host, state).inc()
+
+
+def circuit_rejected(host: str) -> None:
+    if REGISTRY.enabled:
+        CIRCUIT_REJECTIONS.labels(host).inc()
+
+
+def invocation_finished(tool: str, status: str, duration: float,
+                        attempts: Optional[List[Dict[str, Any]]] = None) -> None:
+    """调用结束时调用一次，按 RetryPolicy.attempts 汇总尝试、错误分类、重试和放弃原因"""
+    if not REGISTRY.enabled:
+        return
+    INVOCATIONS.labels(tool, status).inc()
+    INVOCATION_SECONDS.labels(tool).observe(duration)
+    for record in attempts or ():
+        ATTEMPTS.labels(tool, record["outcome"]).inc()
+        if record["outcome"] != "error":
+            continue
+        ERRORS.labels(tool, record.get("error_class"), record.get("status_code") or "").inc()
+        if record.get("retry_delay") is not None:
+            RETRIES.labels(tool).inc()
+        if record.get("give_up_reason"):
+            GIVE_UPS.labels(tool, record["give_up_reason"]).inc()
+    REGISTRY.maybe_dump()
@@ -0,0 +1,20 @@
+"""
+未被 gevent patch 的原生对象
+
+dify_plugin 在导入时对 threading/queue/time 等模块做了 gevent monkey patch。
+异步引擎线程、日志队列、限流器和熔断器需要跨系统线程使用的锁、队列和线程，
+从这里取 patch 之前的原始实现；未安装 gevent 时直接返回标准库中的对象。
+"""
+import sys
+
+try:
+    from gevent import monkey as _gevent_monkey
+except ImportError:  # pragma: no cover - 未安装gevent时直接使用标准库
+    _gevent_monkey = None
+
+
+def original(module: str, name: str):
+    """获取未被gevent patch的原始对象，如 original('_thread', 'allocate_lock')"""
+    if _gevent_monkey is not None:
+        return _gevent_monkey.get_original(module, name)
+    return getattr(sys.modules[module], name)
@@ -0,0 +1,125 @@
+"""
+SSE连接重试策略
+
+只重试暂时性故障：连接/读取错误、超时、5xx，以及带 Retry-After 的 429；
+参数错误（如非法JSON body）和其他4xx直接失败；目标主机熔断中（CircuitOpenError）时也不再重试。
+重试间隔为带抖动的指数退避，服务端通过 retry: 字段下发的重连时间作为退避基数，
+Retry-After 优先；所有尝试与等待共享总时间预算，默认等于 main.py 中的 MAX_REQUEST_TIMEOUT。
+"""
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from utils.circuit_breaker import CircuitOpenError
+
+# 插件单次请求的最长时间（秒），main.py 中的 DifyPluginEnv 使用同一个值
+MAX_REQUEST_TIMEOUT = 120
+
+
+class SSEHTTPStatusError(Exception):
+    """SSE服务端返回了非200状态码"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After头（秒数或HTTP日期），无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: BaseException) -> str:
+    """将异常归类为 transient（可重试）或 fatal（不可重试）"""
+    if isinstance(error, SSEHTTPStatusError):
+        if error.status_code >= 500:
+            return "transient"
+        if error.status_code == 429 and error.retry_after is not None:
+            return "transient"
+        return "fatal"
+    # 客户端把httpx异常包装后重新抛出，原始异常保存在__cause__中
+    cause = error if isinstance(error, httpx.TransportError) else error.__cause__
+    if isinstance(cause, httpx.TransportError):
+        return "transient"
+    return "fatal"
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试，记录每次尝试"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 total_budget: float = MAX_REQUEST_TIMEOUT):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.total_budget = total_budget
+        self.server_retry_ms: Optional[int] = None  # 服务端通过retry:字段下发的重连时间
+        self.attempts: List[Dict[str, Any]] = []
+        self._started = time.monotonic()
+        self._attempt_started = self._started
+
+    def remaining(self) -> float:
+        """剩余的总时间预算（秒）"""
+        return self.total_budget - (time.monotonic() - self._started)
+
+    def begin_attempt(self) -> int:
+        """开始一次尝试，返回尝试序号（从0开始）"""
+        self._attempt_started = time.monotonic()
+        return len(self.attempts)
+
+    def _record(self, outcome: str, **fields: Any) -> Dict[str, Any]:
+        now = time.monotonic()
+        record = {
+            "attempt": len(self.attempts) + 1,
+            "outcome": outcome,
+            "started_at": round(self._attempt_started - self._started, 3),
+            "duration": round(now - self._attempt_started, 3),
+        }
+        record.update(fields)
+        self.attempts.append(record)
+        return record
+
+    def record_success(self) -> None:
+        self._record("success")
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次失败后的退避时间：以服务端retry:或默认值为基数，指数增长并加随机抖动"""
+        base = self.server_retry_ms / 1000 if self.server_retry_ms else self.base_delay
+        ceiling = min(self.max_delay, base * (2 ** attempt))
+        # 抖动范围为[ceiling/2, ceiling]，避免大量客户端同时重连
+        return random.uniform(ceiling / 2, ceiling)
+
+    def record_failure(self, error: BaseException) -> Optional[float]:
+        """记录失败的尝试，返回重试前需要等待的秒数；不应重试时返回None"""
+        attempt = len(self.attempts)
+        kind = classify_error(error)
+        status_code = getattr(error, "status_code", None)
+        delay: Optional[float] = None
+        reason = None
+        if isinstance(error, CircuitOpenError):
+            reason = "circuit_open"
+        elif kind == "fatal":
+            reason = "non_retryable"
+        elif attempt + 1 >= self.max_attempts:
+            reason = "max_attempts"
+        else:
+            retry_after = getattr(error, "retry_after", None)
+            delay = retry_after if retry_after is not None else self.backoff(attempt)
+            if delay >= self.remaining():
+                delay, reason = None, "budget_exhausted"
+        self._record("error", error_class=kind, status_code=status_code,
+                     error=str(error)[:200], retry_delay=round(delay, 3) if delay is not None else None,
+                     give_up_reason=reason)
+        return delay
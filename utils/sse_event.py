@@ -0,0 +1,78 @@
+"""
+紧凑的SSE事件表示
+
+事件使用 __slots__，不再为每个实例分配 __dict__；接收时只记录相对流开始的
+单调时钟纳秒偏移（time.monotonic_ns，无需格式化），墙上时间仅在输出时才格式化。
+保留的事件就是这些对象本身，输出用的字典在最后一次性生成。
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from utils import json_codec
+
+
+class StreamClock:
+    """一次流的时间基准：开始时的墙上时间与单调时钟"""
+    __slots__ = ("wall_start", "mono_start_ns")
+
+    def __init__(self):
+        self.wall_start = time.time()
+        self.mono_start_ns = time.monotonic_ns()
+
+    def offset_ns(self) -> int:
+        return time.monotonic_ns() - self.mono_start_ns
+
+    def isoformat(self, offset_ns: int) -> str:
+        return datetime.fromtimestamp(self.wall_start + offset_ns / 1e9).isoformat()
+
+
+# 未绑定到具体流的事件（测试、基准）使用进程级时间基准
+_PROCESS_CLOCK = StreamClock()
+
+
+class SSEEvent:
+    """SSE事件数据结构"""
+    __slots__ = ("event_type", "_data", "parsed", "raw", "size", "event_id", "retry", "number", "offset_ns", "clock")
+
+    def __init__(self, event_type: str = "message", data: Optional[str] = "", event_id: str = "", retry: int = 0,
+                 parsed: Any = None, raw: Optional[bytes] = None, size: int = 0,
+                 clock: Optional[StreamClock] = None):
+        self.event_type = event_type
+        self._data = data
+        # 解码后的数据：JSON载荷为对象，否则为字符串，整个流程只解码一次
+        self.parsed = parsed if parsed is not None else data
+        # data载荷的原始字节（仅在需要时保留）
+        self.raw = raw
+        self.size = size  # data载荷的字节数
+        self.event_id = event_id
+        self.retry = retry
+        self.number = 0  # 在本次调用中的序号，由工具收集事件时设置
+        self.clock = clock or _PROCESS_CLOCK
+        self.offset_ns = self.clock.offset_ns()
+
+    @property
+    def data(self) -> str:
+        """事件数据的字符串形式：通常是收到的data文本；构建时未提供文本（如合并了自定义字段）的才在首次访问时序列化"""
+        if self._data is None:
+            self._data = json_codec.dumps(self.parsed)
+        return self._data
+
+    @property
+    def timestamp(self) -> str:
+        """接收时间的ISO格式字符串，访问时才格式化"""
+        return self.clock.isoformat(self.offset_ns)
+
+    def to_dict(self, include_raw: bool = False) -> Dict[str, Any]:
+        """生成输出用的事件字典"""
+        event_info = {
+            "event_number": self.number,
+            "event_type": self.event_type,
+            "data": self.parsed,
+            "event_id": self.event_id,
+            "timestamp": self.timestamp,
+            "retry": self.retry,
+        }
+        if include_raw:
+            event_info["raw_data"] = self.raw.decode('utf-8', errors='replace') if self.raw is not None else None
+        return event_info
@@ -0,0 +1,196 @@
+"""
+字节级增量SSE解析器
+
+直接处理 response.iter_bytes() 返回的原始网络数据块，
+按照 SSE 规范（https://html.spec.whatwg.org/multipage/server-sent-events.html）
+识别 \\r\\n、\\n、\\r 三种换行，只对 data 载荷做UTF-8解码。
+"""
+from typing import Dict, List, Optional, Union
+
+_LF = 0x0A
+_CR = 0x0D
+_COLON = 0x3A
+_SPACE = 0x20
+_BOM = b"\xef\xbb\xbf"
+
+
+class SSEFrame:
+    """解析得到的原始SSE帧（尚未做业务层处理）"""
+    __slots__ = ("event_type", "data", "event_id", "retry", "fields", "raw", "size")
+
+    def __init__(self, event_type: str = "message", data: Optional[str] = None, event_id: str = "",
+                 retry: int = 0, fields: Optional[Dict[str, Union[str, List[str]]]] = None,
+                 raw: Optional[bytes] = None, size: int = 0):
+        self.event_type = event_type
+        # 没有任何data字段时为None，用于区分空data和无data
+        self.data = data
+        self.event_id = event_id
+        self.retry = retry
+        # 非标准的自定义字段，重复字段保存为列表
+        self.fields = fields
+        # data载荷解码前的原始字节，仅在 keep_raw=True 时保留
+        self.raw = raw
+        # data载荷的字节数，用于按字节预算保留事件
+        self.size = size
+
+
+class SSEFrameParser:
+    """增量SSE帧解析器，可多次 feed 任意切分的数据块"""
+
+    def __init__(self, keep_raw: bool = False):
+        self.keep_raw = keep_raw
+        self._buffer = bytearray()
+        self._skip_lf = False
+        self._bom_checked = False
+        self.line_count = 0
+        # 规范中的 last event ID，跨事件保持
+        self.last_event_id = ""
+        self._reset_frame()
+
+    def _reset_frame(self) -> None:
+        self._event_type: Optional[bytes] = None
+        self._data_parts: Optional[List[bytes]] = None
+        self._event_id: Optional[str] = None
+        self._retry = 0
+        self._fields: Optional[Dict[str, Union[str, List[str]]]] = None
+        self._has_fields = False
+
+    def feed(self, chunk: bytes) -> List[SSEFrame]:
+        """喂入一个数据块，返回其中已完整的帧"""
+        frames: List[SSEFrame] = []
+        if not chunk:
+            return frames
+
+        buf = self._buffer
+        buf += chunk
+
+        if not self._bom_checked:
+            if len(buf) < len(_BOM) and _BOM.startswith(bytes(buf)):
+                return frames
+            if buf.startswith(_BOM):
+                del buf[:len(_BOM)]
+            self._bom_checked = True
+
+        pos = 0
+        end = len(buf)
+        # 上一个块以\r结尾时，紧随的\n属于同一个换行
+        if self._skip_lf and end:
+            if buf[0] == _LF:
+                pos = 1
+            self._skip_lf = False
+
+        has_cr = buf.find(b"\r", pos) != -1
+        while pos < end:
+            lf = buf.find(b"\n", pos)
+            if has_cr:
+                cr = buf.find(b"\r", pos)
+                if cr != -1 and (lf == -1 or cr < lf):
+                    line_end = cr
+                    if cr + 1 < end:
+                        next_pos = cr + 2 if buf[cr + 1] == _LF else cr + 1
+                    else:
+                        next_pos = cr + 1
+                        self._skip_lf = True
+                else:
+                    if lf == -1:
+                        break
+                    line_end = lf
+                    next_pos = lf + 1
+            else:
+                if lf == -1:
+                    break
+                line_end = lf
+                next_pos = lf + 1
+
+            frame = self._process_line(bytes(buf[pos:line_end]))
+            if frame is not None:
+                frames.append(frame)
+            pos = next_pos
+
+        if pos:
+            # 只保留未完成的行，缓冲区对象复用
+            del buf[:pos]
+        return frames
+
+    def flush(self) -> List[SSEFrame]:
+        """流结束时调用，处理没有以空行结尾的最后一帧"""
+        frames: List[SSEFrame] = []
+        if self._buffer:
+            frame = self._process_line(bytes(self._buffer))
+            self._buffer.clear()
+            if frame is not None:
+                frames.append(frame)
+        frame = self._dispatch()
+        if frame is not None:
+            frames.append(frame)
+        return frames
+
+    def _process_line(self, line: bytes) -> Optional[SSEFrame]:
+        self.line_count += 1
+        if not line:
+            return self._dispatch()
+        if line[0] == _COLON:
+            # 注释行（常用作心跳）
+            return None
+
+        colon = line.find(b":")
+        if colon == -1:
+            field = line
+            value = b""
+        else:
+            field = line[:colon]
+            value_start = colon + 1
+            if value_start < len(line) and line[value_start] == _SPACE:
+                value_start += 1
+            value = line[value_start:]
+
+        self._has_fields = True
+        if field == b"data":
+            if self._data_parts is None:
+                self._data_parts = [value]
+            else:
+                self._data_parts.append(value)
+        elif field == b"event":
+            self._event_type = value
+        elif field == b"id":
+            # 规范：包含NUL的id被忽略
+            if b"\x00" not in value:
+                self._event_id = value.decode("utf-8", errors="replace")
+                self.last_event_id = self._event_id
+        elif field == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        else:
+            name = field.decode("utf-8", errors="replace")
+            text = value.decode("utf-8", errors="replace")
+            if self._fields is None:
+                self._fields = {name: text}
+            elif name in self._fields:
+                existing = self._fields[name]
+                if isinstance(existing, list):
+                    existing.append(text)
+                else:
+                    self._fields[name] = [existing, text]
+            else:
+                self._fields[name] = text
+        return None
+
+    def _dispatch(self) -> Optional[SSEFrame]:
+        if not self._has_fields:
+            return None
+        data = None
+        raw = None
+        if self._data_parts is not None:
+            raw = self._data_parts[0] if len(self._data_parts) == 1 else b"\n".join(self._data_parts)
+            data = raw.decode("utf-8", errors="replace")
+        frame = SSEFrame(
+            self._event_type.decode("utf-8", errors="replace") if self._event_type else "message",
+            data,
+            self._event_id or "",
+            self._retry,
+            self._fields,
+            raw if self.keep_raw else None,
+            len(raw) if raw is not None else 0,
+        )
+        self._reset_frame()
+        return frame
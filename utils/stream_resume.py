@@ -0,0 +1,61 @@
+"""
+SSE断线续传状态
+
+重试时携带 Last-Event-ID 请求头从断点继续，而不是让上游从头重新生成整个回答。
+已接收事件的ID保存在去重集合中：服务端不支持续传、从头重放时，带ID的重复事件会被丢弃；
+流中没有任何事件ID时无法续传，只能整体重放。
+工具把集合上限设为 max_events，一次调用接受的事件都能识别，重放再长也不会漏掉最早的事件。
+去重在客户端解析出事件后立即进行，重复事件不产出，也不计入本次连接的事件数上限。
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResumeState:
+    """跨重试保存的续传与去重状态"""
+
+    def __init__(self, max_ids: int = 1024):
+        self.max_ids = max_ids
+        self.last_event_id: Optional[str] = None
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.resumed = False  # 当前尝试是否为续传
+        self.resumed_attempts = 0  # 携带Last-Event-ID重连的次数
+        self.full_replays = 0  # 无法续传、整体重放的次数
+        self.recovered_events = 0  # 续传后新收到的事件数
+        self.duplicate_events = 0  # 去重丢弃的事件数
+
+    def begin_attempt(self, attempt: int) -> Optional[str]:
+        """开始一次尝试，返回需要携带的Last-Event-ID；重试时返回None表示需要整体重放"""
+        self.resumed = False
+        if attempt == 0:
+            return None
+        if self.last_event_id:
+            self.resumed = True
+            self.resumed_attempts += 1
+            return self.last_event_id
+        self.full_replays += 1
+        return None
+
+    def accept(self, event_id: str) -> bool:
+        """记录收到的事件，重复事件返回False；超过 max_ids 时淘汰最早的ID"""
+        if event_id:
+            if event_id in self._seen:
+                self._seen.move_to_end(event_id)
+                self.duplicate_events += 1
+                return False
+            self._seen[event_id] = None
+            if len(self._seen) > self.max_ids:
+                self._seen.popitem(last=False)
+            self.last_event_id = event_id
+        if self.resumed:
+            self.recovered_events += 1
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "last_event_id": self.last_event_id,
+            "resumed_attempts": self.resumed_attempts,
+            "recovered_events": self.recovered_events,
+            "duplicate_events": self.duplicate_events,
+            "full_replays": self.full_replays,
+        }
@@ -0,0 +1,112 @@
+"""
+单次SSE连接的分阶段耗时
+
+- 连接阶段来自 httpcore 的 trace 扩展：TCP连接（含DNS解析）、TLS握手、发送请求、等待响应头
+- 读取阶段来自解析循环：等待网络数据、解析、调用方处理事件（生成器让出期间）的累计耗时
+- 相邻事件的到达间隔，用于区分上游生成慢（间隔大）还是插件处理慢
+
+所有时间点使用 time.perf_counter()，输出为毫秒。
+"""
+import time
+from array import array
+from typing import Any, Dict, Optional
+
+from utils.latency_stats import summarize
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 1)
+
+
+class StreamTiming:
+    """记录一次连接各阶段的时间点和累计耗时"""
+
+    def __init__(self):
+        # 在主机限流器中排队的秒数，未经过限流器时为None
+        self.queue_wait: Optional[float] = None
+        self.request_start: Optional[float] = None
+        self.headers_at: Optional[float] = None
+        self.first_byte_at: Optional[float] = None
+        self.first_event_at: Optional[float] = None
+        self.end_at: Optional[float] = None
+        # trace事件名去掉协议前缀后的时间点，如 "connect_tcp.started"
+        self._marks: Dict[str, float] = {}
+        self.network_wait = 0.0
+        self.parse = 0.0
+        self.consumer = 0.0
+        self.bytes = 0
+        self.events = 0
+        self._wait_start: Optional[float] = None
+        self._last_event_at: Optional[float] = None
+        # 事件间隔（秒），array比float列表紧凑
+        self.gaps = array('d')
+
+    def trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """httpcore trace回调，事件名形如 connection.connect_tcp.started、http11.receive_response_headers.complete"""
+        self._marks[event_name.split('.', 1)[-1]] = time.perf_counter()
+
+    async def atrace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """异步传输层要求trace回调是协程"""
+        self.trace(event_name, info)
+
+    def start_request(self) -> None:
+        self.request_start = time.perf_counter()
+
+    def headers_received(self) -> None:
+        self.headers_at = time.perf_counter()
+        self._wait_start = self.headers_at
+
+    def chunk_received(self, size: int) -> None:
+        now = time.perf_counter()
+        if self.first_byte_at is None:
+            self.first_byte_at = now
+        self.network_wait += now - self._wait_start
+        self.bytes += size
+
+    def wait_for_chunk(self) -> None:
+        """一个数据块处理完毕，开始等待下一个"""
+        self._wait_start = time.perf_counter()
+
+    def event_received(self, now: float) -> None:
+        self.events += 1
+        if self._last_event_at is None:
+            self.first_event_at = now
+        else:
+            self.gaps.append(now - self._last_event_at)
+        self._last_event_at = now
+
+    def finish(self) -> None:
+        if self.end_at is None:
+            self.end_at = time.perf_counter()
+
+    def phase_ms(self, step: str, end_step: Optional[str] = None) -> Optional[float]:
+        """trace记录的某个阶段的耗时（毫秒），如 phase_ms("connect_tcp")；没有该阶段时返回None"""
+        return _ms(self._marks.get(f"{step}.started"), self._marks.get(f"{end_step or step}.complete"))
+
+    def to_dict(self, invoke_start: Optional[float] = None) -> Dict[str, Any]:
+        """各阶段耗时（毫秒）；invoke_start 为调用开始时的 perf_counter，用于计算总耗时和连接前的准备耗时"""
+        connect_ms = self.phase_ms("connect_tcp")
+        return {
+            "total_ms": _ms(invoke_start, time.perf_counter()) if invoke_start is not None else None,
+            # 参数解析、之前失败的尝试与重试等待，以及限流排队
+            "setup_ms": _ms(invoke_start, self.request_start),
+            "queue_wait_ms": round(self.queue_wait * 1000, 1) if self.queue_wait is not None else None,
+            "connection_reused": self.request_start is not None and connect_ms is None,
+            "connect_ms": connect_ms,
+            "tls_ms": self.phase_ms("start_tls"),
+            "send_ms": self.phase_ms("send_request_headers", "send_request_body"),
+            # 服务端处理请求直到返回响应头
+            "server_wait_ms": self.phase_ms("receive_response_headers"),
+            "time_to_headers_ms": _ms(self.request_start, self.headers_at),
+            "time_to_first_byte_ms": _ms(self.request_start, self.first_byte_at),
+            "time_to_first_event_ms": _ms(self.request_start, self.first_event_at),
+            "stream_ms": _ms(self.first_event_at, self.end_at),
+            "network_wait_ms": round(self.network_wait * 1000, 1),
+            "parse_ms": round(self.parse * 1000, 1),
+            "consumer_ms": round(self.consumer * 1000, 1),
+            "events": self.events,
+            "bytes": self.bytes,
+            "gaps_ms": summarize((gap * 1000 for gap in self.gaps), percentiles=(95,)),
+        }
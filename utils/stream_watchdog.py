@@ -0,0 +1,127 @@
+"""
+流的停滞看门狗
+
+读取循环只在收到数据块后才能检查时长：上游连上后不再发送数据时，循环阻塞在读取上直到 httpx 的读超时；
+而读超时在每次收到字节后重新计时，涓流式的上游可以远远超过 max_duration。
+看门狗在独立的定时器中检查两个条件，不依赖数据到达：
+- 绝对截止时间：开始监听后 max_duration 秒
+- 空闲超时：idle_timeout 秒内没有收到任何字节（心跳注释行也算），0 表示不启用
+
+任一条件触发时 shutdown 底层socket，阻塞中的读取立即以传输错误返回，读取循环按 fired 记录的原因正常结束。
+同步引擎用线程定时（gevent patch 后是greenlet），异步引擎用事件循环的 call_later。
+"""
+import asyncio
+import socket
+import threading
+import time
+from typing import Any, Optional
+
+import httpx
+
+# 停止原因
+MAX_DURATION = "max_duration"
+IDLE_TIMEOUT = "idle_timeout"
+
+
+def _response_socket(response: httpx.Response) -> Optional[Any]:
+    """响应所用连接的socket；MockTransport 等没有网络流时返回None"""
+    network_stream = response.extensions.get("network_stream")
+    if network_stream is None:
+        return None
+    return network_stream.get_extra_info("socket")
+
+
+class StreamWatchdog:
+    """一次监听的截止时间与空闲超时"""
+
+    def __init__(self, max_duration: float, idle_timeout: float = 0):
+        now = time.monotonic()
+        self.max_duration = max_duration
+        self.deadline = now + max_duration
+        self.idle_timeout = idle_timeout if idle_timeout and idle_timeout > 0 else None
+        self.last_activity = now
+        # 定时器触发时记录的停止原因
+        self.fired: Optional[str] = None
+        self._socket = None
+        # 取消与触发互斥：连接归还连接池后不能再被关闭
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._stop: Optional[threading.Event] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def touch(self) -> None:
+        """收到数据，重新开始空闲计时"""
+        self.last_activity = time.monotonic()
+
+    def check(self, now: Optional[float] = None) -> Optional[str]:
+        """已触发或已到期时返回停止原因"""
+        if self.fired is not None:
+            return self.fired
+        now = time.monotonic() if now is None else now
+        if now >= self.deadline:
+            return MAX_DURATION
+        if self.idle_timeout is not None and now - self.last_activity >= self.idle_timeout:
+            return IDLE_TIMEOUT
+        return None
+
+    def describe(self, reason: str) -> str:
+        if reason == IDLE_TIMEOUT:
+            return f"空闲{self.idle_timeout:g}秒未收到数据"
+        return f"达到最大时长限制 {round(self.max_duration, 1):g}秒"
+
+    def _delay(self, now: float) -> float:
+        """距离下一次可能到期的秒数"""
+        due = self.deadline
+        if self.idle_timeout is not None:
+            due = min(due, self.last_activity + self.idle_timeout)
+        return max(0.0, due - now)
+
+    def _tick(self) -> Optional[float]:
+        """检查一次；到期时关闭连接并返回None，否则返回下一次检查的间隔"""
+        with self._lock:
+            if self._cancelled:
+                return None
+            now = time.monotonic()
+            reason = self.check(now)
+            if reason is None:
+                return self._delay(now)
+            self.fired = reason
+            if self._socket is not None:
+                try:
+                    self._socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass  # 连接已关闭
+            return None
+
+    def watch(self, response: httpx.Response) -> None:
+        """同步引擎：收到响应头后开始看守该响应的连接"""
+        self._socket = _response_socket(response)
+        stop = self._stop = threading.Event()
+
+        def run() -> None:
+            delay = self._tick()
+            while delay is not None and not stop.wait(delay):
+                delay = self._tick()
+
+        threading.Thread(target=run, name="sse-watchdog", daemon=True).start()
+
+    def awatch(self, response: httpx.Response) -> None:
+        """异步引擎：在当前事件循环中定时检查"""
+        self._socket = _response_socket(response)
+        loop = asyncio.get_running_loop()
+
+        def tick() -> None:
+            delay = self._tick()
+            if delay is not None:
+                self._handle = loop.call_later(delay, tick)
+
+        self._handle = loop.call_soon(tick)
+
+    def cancel(self) -> None:
+        """监听结束、释放连接之前调用，停止定时器"""
+        with self._lock:
+            self._cancelled = True
+        if self._stop is not None:
+            self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
@@ -0,0 +1,83 @@
+"""
+SSE流终止条件
+
+很多上游在完成时会发出结束信号但不关闭连接（OpenAI风格的 [DONE]、
+Dify 的 message_end/workflow_finished、自定义的 event: close），
+匹配到终止条件后立即关闭流，而不是等到 max_duration。
+
+条件以JSON数组（或单个对象）描述，支持三种类型：
+    {"type": "event", "value": "close"}                       SSE事件类型匹配
+    {"type": "data", "value": "[DONE]"}                       data内容（去掉首尾空白）完全相等
+    {"type": "json", "field": "event", "value": "message_end"} data解码后的JSON字段匹配，字段支持点号路径
+"""
+from typing import Any, List, Optional, Tuple
+
+from utils import json_codec
+
+_MISSING = object()
+
+
+class TerminalConditions:
+    """一组终止条件，任意一个匹配即终止"""
+
+    def __init__(self, event_types: Optional[List[str]] = None, data_sentinels: Optional[List[str]] = None,
+                 json_fields: Optional[List[Tuple[str, Any]]] = None):
+        self.event_types = set(event_types or [])
+        self.data_sentinels = set(data_sentinels or [])
+        # (字段路径, 期望值) 列表，路径预先拆分好
+        self.json_fields = [(field, tuple(field.split('.')), value) for field, value in (json_fields or [])]
+
+    def __bool__(self) -> bool:
+        return bool(self.event_types or self.data_sentinels or self.json_fields)
+
+    @classmethod
+    def parse(cls, conditions_str: str) -> "TerminalConditions":
+        """从JSON字符串解析终止条件，格式错误时抛出ValueError"""
+        if not conditions_str or not conditions_str.strip():
+            return cls()
+        try:
+            specs = json_codec.loads(conditions_str.strip())
+        except json_codec.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format for terminal conditions: {e}")
+        if isinstance(specs, dict):
+            specs = [specs]
+        if not isinstance(specs, list):
+            raise ValueError("Terminal conditions must be a JSON object or array")
+
+        event_types, data_sentinels, json_fields = [], [], []
+        for spec in specs:
+            if not isinstance(spec, dict) or "value" not in spec:
+                raise ValueError(f"Invalid terminal condition: {spec}")
+            kind = spec.get("type")
+            if kind == "event":
+                event_types.append(str(spec["value"]))
+            elif kind == "data":
+                data_sentinels.append(str(spec["value"]).strip())
+            elif kind == "json":
+                field = spec.get("field")
+                if not field:
+                    raise ValueError(f"Terminal condition of type json requires a field: {spec}")
+                json_fields.append((str(field), spec["value"]))
+            else:
+                raise ValueError(f"Unknown terminal condition type: {kind}")
+        return cls(event_types, data_sentinels, json_fields)
+
+    def match(self, event) -> Optional[str]:
+        """检查事件是否满足终止条件，返回匹配到的条件描述，不匹配返回None"""
+        if event.event_type in self.event_types:
+            return f"event={event.event_type}"
+        parsed = event.parsed
+        if self.data_sentinels and isinstance(parsed, str) and parsed.strip() in self.data_sentinels:
+            return f"data={parsed.strip()}"
+        if self.json_fields and isinstance(parsed, (dict, list)):
+            for field, path, expected in self.json_fields:
+                value = parsed
+                for key in path:
+                    if isinstance(value, dict):
+                        value = value.get(key, _MISSING)
+                    else:
+                        value = _MISSING
+                        break
+                if value is not _MISSING and value == expected:
+                    return f"json:{field}={expected}"
+        return None